@@ -10,15 +10,23 @@ try:
 except:
     __version__ = "unknown"
 
-# Pull some names into the package namespace
-from .dependencies import configure, Configuration, ExternalConfiguration
-from .state import env, opts, log, targets
-from .builders import ProductDir
+# Pull some names into the package namespace; env (state.env) is created when first used
+from .state import opts, log, targets
 
-# These inject methods into SConsEnviroment
-from . import installation
-from . import builders
+# These are only imported when first used, so that "scons -h", "scons -c" and packages that
+# don't use them don't pay for them.  Importing state.env also imports builders and
+# installation, which inject methods into SConsEnvironment.
+_lazyNames = {"env": "state", "configure": "dependencies", "Configuration": "dependencies",
+              "ExternalConfiguration": "dependencies", "ProductDir": "builders"}
 
 # These should remain in their own namespaces
-from . import scripts
-from . import tests
+_lazySubmodules = ("builders", "dependencies", "installation", "scripts", "tests")
+
+
+def __getattr__(name):
+    import importlib
+    if name in _lazyNames:
+        return getattr(importlib.import_module("." + _lazyNames[name], __name__), name)
+    if name in _lazySubmodules:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,133 @@
+##
+#  @file buildTrace.py
+#
+#  A trace of the whole scons run in Chrome's trace-event format (--build-trace=FILE).
+##
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import subprocess
+
+import SCons.Node
+
+from . import state
+from . import utils
+
+
+##
+#  @brief Records the sconsUtils startup phases and every action run by the build, for a trace viewer.
+#
+#  Enabled by the --build-trace=FILE option.  The startup phases come from state.timings (which is
+#  enabled, without its summary, if --sconsUtils-timings wasn't given).  Node.build is wrapped to
+#  time each target's actions in the worker thread that runs them, and env["SPAWN"] (see setup)
+#  to reap the commands with os.wait4, so that their CPU time and peak resident set size are known
+#  too; the CPU time of Python actions is that of their thread.
+#
+#  At exit FILE is written in the trace-event format read by chrome://tracing and Perfetto: one
+#  "complete" event per target built, on a track per worker thread (so -j utilization and the
+#  critical path can be seen), with the state.targets category ("lib", "tests", ...) the target
+#  was built for (see RebuildCauses.targetCategories), its builder, CPU time and peak RSS; and one
+#  per startup phase, on a track of their own.
+##
+class BuildTrace:
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        self.actions = []
+        self._threads = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        if not state.timings.enabled:
+            state.timings.enable(summary=False)
+        build = SCons.Node.Node.build
+
+        def tracingBuild(node, **kwds):
+            record = {"cpu": 0.0, "maxRss": 0, "commands": 0}
+            self._local.record = record
+            start = time.time()
+            startCpu = time.thread_time()
+            try:
+                return build(node, **kwds)
+            finally:
+                end = time.time()
+                self._local.record = None
+                record["cpu"] += time.thread_time() - startCpu
+                with self._lock:
+                    thread = self._threads.setdefault(threading.get_ident(), len(self._threads) + 1)
+                    self.actions.append((node, thread, start, end, record))
+
+        SCons.Node.Node.build = tracingBuild
+        atexit.register(self._finish)
+
+    ##
+    #  @brief Run env's commands through _spawn, where os.wait4 is available.
+    #
+    #  Called by state._initEnvironment, as env is created after the trace is enabled.
+    ##
+    def setup(self, env):
+        if hasattr(os, "wait4"):
+            env["SPAWN"] = self._spawn
+
+    ##
+    #  @brief A replacement for SCons' POSIX SPAWN that also collects the command's resource usage.
+    ##
+    def _spawn(self, sh, escape, cmd, args, spawnEnv):
+        try:
+            process = subprocess.Popen([sh, "-c", " ".join(args)], env=spawnEnv, close_fds=True)
+        except OSError as e:
+            sys.stderr.write("scons: %s: %s\n" % (cmd, e.strerror))
+            return 127
+        pid, status, usage = os.wait4(process.pid, 0)
+        # Decode the status as subprocess does: a negative return code is the signal that killed it
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        record = getattr(self._local, "record", None)
+        if record is not None:
+            record["cpu"] += usage.ru_utime + usage.ru_stime
+            # ru_maxrss is in kilobytes, except on macOS
+            maxRss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss*1024
+            record["maxRss"] = max(record["maxRss"], maxRss)
+            record["commands"] += 1
+        return process.returncode
+
+    # @brief Return the trace, as a dict ready to be written as JSON.
+    def report(self):
+        from .rebuildCauses import RebuildCauses
+        origin = state.timings.origin
+        categories = RebuildCauses.targetCategories()
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 0,
+                   "args": {"name": "sconsUtils startup"}}]
+        for thread in sorted(set(self._threads.values())):
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": thread,
+                           "args": {"name": "build worker %d" % thread}})
+        for phase in state.timings.phases:
+            events.append({"name": phase["name"], "cat": phase["category"], "ph": "X", "pid": 1, "tid": 0,
+                           "ts": phase["start"]*1e6, "dur": phase["wall"]*1e6,
+                           "args": {"cpu": phase["cpu"], "subprocesses": phase["subprocesses"]}})
+        for node, thread, start, end, record in self.actions:
+            builder = node.get_builder()
+            try:
+                builderName = builder.get_name(node.get_env())
+            except Exception:
+                builderName = None
+            events.append({"name": str(node), "cat": categories.get(node, "other"), "ph": "X", "pid": 1,
+                           "tid": thread, "ts": (start - origin)*1e6, "dur": (end - start)*1e6,
+                           "args": {"builder": builderName, "cpu": record["cpu"],
+                                    "maxRssMB": record["maxRss"]/1024.0**2, "commands": record["commands"]}})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"command": sys.argv}}
+
+    def _finish(self):
+        try:
+            utils.atomicWrite(self.filename, json.dumps(self.report()))
+        except Exception as e:
+            state.log.warn("Unable to write build trace %s: %s" % (self.filename, e))
+        else:
+            state.log.report("Build trace of %d actions written to %s" % (len(self.actions), self.filename))
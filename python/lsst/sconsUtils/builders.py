@@ -6,8 +6,7 @@
 
 import os
 import re
-import fnmatch
-import pipes
+import hashlib
 
 import SCons.Script
 from SCons.Script.SConscript import SConsEnvironment
@@ -28,14 +27,20 @@ def SharedLibraryIncomplete(self, target, source, **keywords):
 
 #  @brief Like LoadableModule, but don't insist that all symbols are resolved, and set
 #         some pybind11-specific flags.
+#
+#  If pch is not None the sources are compiled with that header precompiled (see UsePrecompiledHeader).
 @memberOf(SConsEnvironment)
-def Pybind11LoadableModule(self, target, source, **keywords):
+def Pybind11LoadableModule(self, target, source, pch=None, **keywords):
     myenv = self.Clone()
     myenv.Append(CCFLAGS=["-fvisibility=hidden"])
     if myenv['PLATFORM'] == 'darwin':
         myenv.Append(LDMODULEFLAGS=["-undefined", "suppress",
                                     "-flat_namespace", "-headerpad_max_install_names"])
-    return myenv.LoadableModule(target, source, **keywords)
+    keywords, pchNodes = myenv.UsePrecompiledHeader(pch, **keywords)
+    result = myenv.LoadableModule(target, source, **keywords)
+    if pchNodes:
+        myenv.Depends(result[0].sources, pchNodes)
+    return result
 
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
@@ -47,19 +52,42 @@ def Pybind11LoadableModule(self, target, source, **keywords):
 #  noOptFile="file1 file2") are built without optimisation and files listed in env.optFiles are
 #  built with optimisation
 #
+#  Flags for particular files may also be set in the package's ups/compileFlags.ini; see
+#  compileFlags.CompileFlagOverlay.  These are applied after optFiles and noOptFiles.
+#
 #  The usage pattern in an SConscript file is:
 #  ccFiles = env.SourcesForSharedLibrary(Glob("../src/*/*.cc"))
 #  env.SharedLibrary('afw', ccFiles, LIBS=env.getLibs("self")))
 #
 #  This is automatically used by scripts.BasicSConscript.lib().
+#
+#  @param files         Source files to compile.
+#  @param unity         Compile the sources in "unity" batches of this many files, which #include
+#                       them, rather than one at a time (defaults to the "unity" build variable;
+#                       0 or 1 disables batching).  See UnityBatches.
+#  @param unityExclude  Names of source files (basenames) to compile alone even in a unity build.
+#  @param unityDir      Directory for the generated batch files.
+#  @param pch           Header to precompile for the C++ sources (see UsePrecompiledHeader); sources
+#                       with flags of their own get a precompiled header built with those flags.
 ##
 @memberOf(SConsEnvironment)
-def SourcesForSharedLibrary(self, files):
+def SourcesForSharedLibrary(self, files, unity=None, unityExclude=(), unityDir="#.unity", pch=None):
 
     files = [SCons.Script.File(file) for file in files]
-
-    if not (self.get("optFiles") or self.get("noOptFiles")):
-        objs = [self.SharedObject(ccFile) for ccFile in sorted(state.env.Flatten(files), key=str)]
+    overlay = _compileFlagOverlay(self)
+    if unity is None:
+        unity = int(self.get("unity") or 0)
+
+    def sharedObject(ccFile, **overrides):
+        if pch is None or ccFile.suffix not in _CXX_SUFFIXES:
+            return self.SharedObject(ccFile, **overrides)
+        overrides, pchNodes = self.UsePrecompiledHeader(pch, **overrides)
+        obj = self.SharedObject(ccFile, **overrides)
+        self.Depends(obj, pchNodes)
+        return obj
+
+    if not (self.get("optFiles") or self.get("noOptFiles") or overlay or unity > 1):
+        objs = [sharedObject(ccFile) for ccFile in sorted(state.env.Flatten(files), key=str)]
         return objs
 
     if self.get("optFiles"):
@@ -87,20 +115,201 @@ def SourcesForSharedLibrary(self, files):
     CCFLAGS_OPT = re.sub(r"-O(\d|s)\s*", "-O%d " % opt, " ".join(self["CCFLAGS"]))
     CCFLAGS_NOOPT = re.sub(r"-O(\d|s)\s*", "-O0 ", " ".join(self["CCFLAGS"]))  # remove -O flags from CCFLAGS
 
+    root = self.Dir("#").abspath
     objs = []
+    batched = []
     for ccFile in files:
         if optFilesRe and re.search(optFilesRe, ccFile.abspath):
-            obj = self.SharedObject(ccFile, CCFLAGS=CCFLAGS_OPT)
+            ccflags = CCFLAGS_OPT
         elif noOptFilesRe and re.search(noOptFilesRe, ccFile.abspath):
-            obj = self.SharedObject(ccFile, CCFLAGS=CCFLAGS_NOOPT)
+            ccflags = CCFLAGS_NOOPT
         else:
-            obj = self.SharedObject(ccFile)
+            ccflags = None
+        if overlay:
+            path = os.path.relpath(ccFile.srcnode().abspath, root)
+            overlaid = overlay.apply(path, (ccflags.split() if ccflags is not None
+                                            else list(self["CCFLAGS"])))
+            if overlaid is not None:
+                ccflags = overlaid
+        if ccflags is None:
+            if unity > 1 and os.path.basename(ccFile.path) not in unityExclude:
+                batched.append(ccFile)  # files with flags of their own are always compiled alone
+                continue
+            obj = sharedObject(ccFile)
+        else:
+            obj = sharedObject(ccFile, CCFLAGS=ccflags)
         objs.append(obj)
+    if batched:
+        objs.extend(sharedObject(batch) for batch in self.UnityBatches(batched, unity, unityDir))
 
     objs = sorted(state.env.Flatten(objs), key=str)
     return objs
 
 
+##
+#  @brief Return generated source files that each #include up to batchSize of the given sources.
+#
+#  Compiling a few large "unity" files is much faster than compiling many small ones when most
+#  of the time goes into parsing the same headers.  Sources are batched per directory (C and C++
+#  sources separately), in order of their names, so a batch only changes (and is recompiled) when
+#  a file in it is edited or when the directory's files are added, removed or renamed.  The
+#  batches #include the sources by relative path and are only rewritten when their contents change.
+#
+#  Sources that can't share a translation unit with others (because of conflicting file-static
+#  names or macros, for example) should be excluded from the batches.
+#
+#  @param files      Source files (Nodes).
+#  @param batchSize  Maximum number of sources in each batch.
+#  @param directory  Directory in which to write the batches.
+##
+@memberOf(SConsEnvironment)
+def UnityBatches(self, files, batchSize, directory="#.unity"):
+    directory = self.Dir(directory)
+    root = self.Dir("#")
+    byDirectory = {}
+    for ccFile in files:
+        source = ccFile.srcnode()
+        byDirectory.setdefault((source.dir.get_path(root), source.suffix), []).append(source)
+
+    batches = []
+    for (sourceDir, suffix), sources in sorted(byDirectory.items()):
+        sources.sort(key=lambda node: node.name)
+        stem = re.sub(r"[^\w]", "_", sourceDir + suffix)  # src_cc_0.cc and src_c_0.c have distinct objects
+        for start in range(0, len(sources), batchSize):
+            batch = directory.File("%s_%d%s" % (stem, start//batchSize, suffix))
+            lines = ["// Unity batch generated by sconsUtils; do not edit\n"]
+            lines.extend('#include "%s"\n' % os.path.relpath(node.abspath, directory.abspath)
+                         for node in sources[start:start + batchSize])
+            batches.extend(self.Command(batch, self.Value("".join(lines)),
+                                        SCons.Script.Action(_writeValue, "Writing unity batch $TARGET")))
+    return batches
+
+
+# @brief Action writing the contents of a Value node (the source) to the target file.
+def _writeValue(target, source, env):
+    with open(target[0].abspath, "w") as outFile:
+        outFile.write(source[0].read())
+
+
+_COMPILE_FLAG_OVERLAYS = {}
+
+
+def _compileFlagOverlay(env):
+    """Return the package's CompileFlagOverlay (read once per build), or None if it has none."""
+    from .compileFlags import CompileFlagOverlay
+    filename = os.path.join(env.Dir("#").abspath, CompileFlagOverlay.FILE_NAME)
+    if filename not in _COMPILE_FLAG_OVERLAYS:
+        try:
+            _COMPILE_FLAG_OVERLAYS[filename] = CompileFlagOverlay.read(filename)
+        except ValueError as e:
+            state.log.fail(str(e))
+            _COMPILE_FLAG_OVERLAYS[filename] = None
+        if _COMPILE_FLAG_OVERLAYS[filename] is not None:
+            state.log.info("Using per-file compile flags from %s" % filename)
+    return _COMPILE_FLAG_OVERLAYS[filename]
+
+
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+
+_PRECOMPILED_HEADER_SUFFIXES = {"gcc": ".gch", "clang": ".pch"}
+_CXX_SUFFIXES = (".cc", ".cpp", ".cxx", ".c++", ".C")
+_PRECOMPILED_HEADERS = {}
+
+
+##
+#  @brief Build a precompiled header, for C++ sources compiled with this environment's flags.
+#
+#  The header is #included by a generated header, .pch/<hash>/<name>.h, next to which the compiler
+#  writes the precompiled version (<name>.h.gch for gcc, <name>.h.pch for clang; see env.whichCc).
+#  C++ sources compiled with "-include .pch/<hash>/<name>.h" (see UsePrecompiledHeader) then load
+#  that rather than parsing the header.  The hash covers the compiler and the flags the header is
+#  compiled with, so one precompiled header is built per flag set, and asking again for the same
+#  one returns the same nodes.  Should a source's flags not match after all, gcc ignores the
+#  precompiled header and simply reads the generated header, which still includes the real one.
+#
+#  @param header     The header to precompile: a File, or the name (or a list of names) of headers
+#                    to find on the include path, typically those of dependencies such as
+#                    "Eigen/Core"; several are precompiled together.
+#  @param shared     Build it for shared library objects (using SHCXX, SHCXXFLAGS and SHCCFLAGS)
+#                    rather than programs.
+#  @param overrides  Construction variables to override, as they will be for the sources using it.
+#
+#  @return the generated header and the precompiled header, or an empty list if the compiler
+#          doesn't support precompiled headers.
+##
+@memberOf(SConsEnvironment)
+def PrecompiledHeader(self, header, shared=True, **overrides):
+    whichCc = getattr(state.env, "whichCc", "unknown")
+    suffix = _PRECOMPILED_HEADER_SUFFIXES.get(whichCc)
+    if suffix is None:
+        if whichCc not in _PRECOMPILED_HEADERS:
+            _PRECOMPILED_HEADERS[whichCc] = []
+            state.log.info("Not using precompiled headers with compiler %s" % whichCc)
+        return []
+
+    if isinstance(header, str):
+        header = [header]
+    if isinstance(header, (list, tuple)):
+        name = "pch.h"
+        identity = list(header)
+    else:
+        header = self.File(header).srcnode()
+        name = header.name
+        identity = header.abspath
+    if shared:
+        compiler, flags = "$SHCXX", "$SHCXXFLAGS $SHCCFLAGS $_CCCOMCOM"
+    else:
+        compiler, flags = "$CXX", "$CXXFLAGS $CCFLAGS $_CCCOMCOM"
+    env = self.Override(overrides)
+    signature = repr((whichCc, identity, env.subst("%s %s" % (compiler, flags))))
+    key = hashlib.sha1(signature.encode()).hexdigest()[:16]
+    if key not in _PRECOMPILED_HEADERS:
+        directory = self.Dir("#.pch").Dir(key)
+        if isinstance(header, list):
+            lines = ["#include <%s>\n" % include for include in header]
+        else:
+            lines = ['#include "%s"\n' % os.path.relpath(header.abspath, directory.abspath)]
+        lines.insert(0, "// Precompiled header generated by sconsUtils; do not edit\n")
+        wrapper = self.Command(directory.File(name), self.Value("".join(lines)),
+                               SCons.Script.Action(_writeValue, "Writing precompiled header $TARGET"))
+        pch = self.Command(directory.File(name + suffix), wrapper,
+                           "%s -o $TARGET -x c++-header -c %s $SOURCE" % (compiler, flags),
+                           source_scanner=SCons.Script.CScanner, **overrides)
+        _PRECOMPILED_HEADERS[key] = wrapper + pch
+    return _PRECOMPILED_HEADERS[key]
+
+
+##
+#  @brief Return the overrides with which to compile C++ sources using a precompiled header.
+#
+#  For example, to build a program using a precompiled Eigen:
+#  @code
+#  overrides, pchNodes = env.UsePrecompiledHeader("Eigen/Core", shared=False, LIBS=libs)
+#  prog = env.Program("foo.cc", **overrides)
+#  env.Depends(prog[0].sources, pchNodes)
+#  @endcode
+#
+#  @param header     The header to precompile (see PrecompiledHeader), or None to use none.
+#  @param shared     Whether the sources are for a shared library (see PrecompiledHeader).
+#  @param overrides  Construction variables the sources would otherwise be compiled with.
+#
+#  @return the overrides, with "-include" added to SHCXXFLAGS (or CXXFLAGS if not shared) if a
+#          precompiled header can be used, so that any C sources compiled with them are unaffected,
+#          and the nodes (from PrecompiledHeader) the sources' objects must depend on.
+##
+@memberOf(SConsEnvironment)
+def UsePrecompiledHeader(self, header, shared=True, **overrides):
+    nodes = self.PrecompiledHeader(header, shared=shared, **overrides) if header is not None else []
+    if not nodes:
+        return overrides, []
+    var = "SHCXXFLAGS" if shared else "CXXFLAGS"
+    cxxflags = overrides.get(var, self.get(var, []))
+    if isinstance(cxxflags, str):
+        cxxflags = cxxflags.split()
+    return dict(overrides, **{var: list(cxxflags) + ["-include", nodes[0].path]}), nodes
+
+
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
 #
@@ -241,149 +450,6 @@ def ProductDir(env, product):
 
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
-##
-#  @brief A callable to be used as an SCons Action to run Doxygen.
-#
-#  This should only be used by the env.Doxygen pseudo-builder method.
-#
-class DoxygenBuilder:
-
-    def __init__(self, **kw):
-        self.__dict__.update(kw)
-        self.results = []
-        self.sources = []
-        self.targets = []
-        self.useTags = list(SCons.Script.File(item).abspath for item in self.useTags)
-        self.inputs = list(SCons.Script.Entry(item).abspath for item in self.inputs)
-        self.excludes = list(SCons.Script.Entry(item).abspath for item in self.excludes)
-        self.outputPaths = list(SCons.Script.Dir(item) for item in self.outputs)
-
-    def __call__(self, env, config):
-        self.findSources()
-        self.findTargets()
-        inConfigNode = SCons.Script.File(config)
-        outConfigName, ext = os.path.splitext(inConfigNode.abspath)
-        outConfigNode = SCons.Script.File(outConfigName)
-        if self.makeTag:
-            tagNode = SCons.Script.File(self.makeTag)
-            self.makeTag = tagNode.abspath
-            self.targets.append(tagNode)
-        config = env.Command(target=outConfigNode, source=inConfigNode if os.path.exists(config) else None,
-                             action=self.buildConfig)
-        env.AlwaysBuild(config)
-        doc = env.Command(target=self.targets, source=self.sources,
-                          action="doxygen %s" % pipes.quote(outConfigNode.abspath))
-        for path in self.outputPaths:
-            env.Clean(doc, path)
-        env.Depends(doc, config)
-        self.results.extend(config)
-        self.results.extend(doc)
-        return self.results
-
-    def findSources(self):
-        for path in self.inputs:
-            if os.path.isdir(path):
-                for root, dirs, files in os.walk(path):
-                    if os.path.abspath(root) in self.excludes:
-                        dirs[:] = []
-                        continue
-                    if not self.recursive:
-                        dirs[:] = []
-                    else:
-                        toKeep = []
-                        for relDir in dirs:
-                            if relDir.startswith("."):
-                                continue
-                            absDir = os.path.abspath(os.path.join(root, relDir))
-                            if absDir not in self.excludes:
-                                toKeep.append(relDir)
-                        dirs[:] = toKeep
-                    if self.excludeSwig:
-                        for relFile in files:
-                            base, ext = os.path.splitext(relFile)
-                            if ext == ".i":
-                                self.excludes.append(os.path.join(root, base + ".py"))
-                                self.excludes.append(os.path.join(root, base + "_wrap.cc"))
-                    for relFile in files:
-                        absFile = os.path.abspath(os.path.join(root, relFile))
-                        if absFile in self.excludes:
-                            continue
-                        for pattern in self.patterns:
-                            if fnmatch.fnmatch(relFile, pattern):
-                                self.sources.append(SCons.Script.File(absFile))
-                                break
-            elif os.path.isfile(path):
-                self.sources.append(SCons.Script.File(path))
-
-    def findTargets(self):
-        for item in self.outputs:
-            self.targets.append(SCons.Script.Dir(item))
-
-    def buildConfig(self, target, source, env):
-        outConfigFile = open(target[0].abspath, "w")
-
-        # Need a routine to quote paths that contain spaces
-        # but can not use pipes.quote because it has to be
-        # a double quote for doxygen.conf
-        # Do not quote a string if it is already quoted
-        # Also have a version that quotes each item in a sequence and generates the
-        # final quoted entry.
-        def _quote_path(path):
-            if " " in path and not path.startswith('"') and not path.endswith('"'):
-                return '"{}"'.format(path)
-            return path
-
-        def _quote_paths(pathList):
-            return " ".join(_quote_path(p) for p in pathList)
-
-        docPaths = []
-        incFiles = []
-        for incPath in self.includes:
-            docDir, incFile = os.path.split(incPath)
-            docPaths.append('"%s"' % docDir)
-            incFiles.append('"%s"' % incFile)
-            self.sources.append(SCons.Script.File(incPath))
-        if docPaths:
-            outConfigFile.write('@INCLUDE_PATH = %s\n' % _quote_paths(docPaths))
-        for incFile in incFiles:
-            outConfigFile.write('@INCLUDE = %s\n' % _quote_path(incFile))
-
-        for tagPath in self.useTags:
-            docDir, tagFile = os.path.split(tagPath)
-            htmlDir = os.path.join(docDir, "html")
-            outConfigFile.write('TAGFILES += "%s=%s"\n' % (tagPath, htmlDir))
-            self.sources.append(SCons.Script.Dir(docDir))
-        if self.projectName is not None:
-            outConfigFile.write("PROJECT_NAME = %s\n" % self.projectName)
-        if self.projectNumber is not None:
-            outConfigFile.write("PROJECT_NUMBER = %s\n" % self.projectNumber)
-        outConfigFile.write("INPUT = %s\n" % _quote_paths(self.inputs))
-        outConfigFile.write("EXCLUDE = %s\n" % _quote_paths(self.excludes))
-        outConfigFile.write("FILE_PATTERNS = %s\n" % " ".join(self.patterns))
-        outConfigFile.write("RECURSIVE = YES\n" if self.recursive else "RECURSIVE = NO\n")
-        allOutputs = set(("html", "latex", "man", "rtf", "xml"))
-        for output, path in zip(self.outputs, self.outputPaths):
-            try:
-                allOutputs.remove(output.lower())
-            except Exception:
-                state.log.fail("Unknown Doxygen output format '%s'." % output)
-                state.log.finish()
-            outConfigFile.write("GENERATE_%s = YES\n" % output.upper())
-            outConfigFile.write("%s_OUTPUT = %s\n" % (output.upper(), _quote_path(path.abspath)))
-        for output in allOutputs:
-            outConfigFile.write("GENERATE_%s = NO\n" % output.upper())
-        if self.makeTag is not None:
-            outConfigFile.write("GENERATE_TAGFILE = %s\n" % _quote_path(self.makeTag))
-        #
-        # Append the local overrides (usually doxygen.conf.in)
-        #
-        if len(source) > 0:
-            with open(source[0].abspath, "r") as inConfigFile:
-                outConfigFile.write(inConfigFile.read())
-
-        outConfigFile.close()
-
-
 ##
 #  @brief Generate a Doxygen config file and run Doxygen on it.
 #
@@ -469,6 +535,7 @@ def Doxygen(self, config, **kw):
     for k in defaults:
         if kw.get(k) is None:
             kw[k] = defaults[k]
+    from .doxygen import DoxygenBuilder  # only needed by packages that build documentation
     builder = DoxygenBuilder(**kw)
     return builder(self, config)
 
@@ -483,78 +550,86 @@ def VersionModule(self, filename, versionString=None):
         if not versionString:
             versionString = "git"
 
-    def calcMd5(filename):
-        try:
-            import hashlib
-            md5 = hashlib.md5(open(filename, "rb").read()).hexdigest()
-        except IOError:
-            md5 = None
+    # The content is rendered now, so its signature decides whether the file needs rewriting.
+    # That saves rewriting the file (and rebuilding what depends on it) when nothing changed, but
+    # not the version control queries: the version comes from setPrefix, and the fingerprint needs
+    # HEAD and the modification check, which are memoized and usually answered by the startup
+    # probes.  A cheaper key, such as HEAD and the index's stamp, would miss unstaged changes.
+    if self.GetOption("clean") or self.GetOption("help"):
+        content = ""
+    else:
+        content = _versionModuleContent(self, versionString)
 
-        return md5
+    def makeVersionModule(target, source, env):
+        state.log.info("makeVersionModule([\"%s\"], [])" % str(target[0]))
+        with open(target[0].abspath, "w") as outFile:
+            outFile.write(source[0].read())
 
-    oldMd5 = calcMd5(filename)
+    return self.Command(filename, self.Value(content),
+                        self.Action(makeVersionModule, strfunction=lambda *args: None))
 
-    def makeVersionModule(target, source, env):
-        try:
-            version = determineVersion(state.env, versionString)
-        except RuntimeError:
-            version = "unknown"
-        parts = version.split("+")
 
-        names = []
-        with open(target[0].abspath, "w") as outFile:
-            outFile.write("# -------- This file is automatically generated by LSST's sconsUtils -------- #\n")
+def _versionModuleContent(env, versionString):
+    try:
+        version = determineVersion(state.env, versionString)
+    except RuntimeError:
+        version = "unknown"
+    parts = version.split("+")
 
-            what = "__version__"
-            outFile.write("%s = '%s'\n" % (what, version))
-            names.append(what)
+    names = []
+    lines = ["# -------- This file is automatically generated by LSST's sconsUtils -------- #\n"]
 
-            what = "__repo_version__"
-            outFile.write("%s = '%s'\n" % (what, parts[0]))
-            names.append(what)
+    what = "__version__"
+    lines.append("%s = '%s'\n" % (what, version))
+    names.append(what)
 
-            what = "__fingerprint__"
-            outFile.write("%s = '%s'\n" % (what, getFingerprint(versionString)))
-            names.append(what)
+    what = "__repo_version__"
+    lines.append("%s = '%s'\n" % (what, parts[0]))
+    names.append(what)
+
+    what = "__fingerprint__"
+    lines.append("%s = '%s'\n" % (what, getFingerprint(versionString)))
+    names.append(what)
 
-            try:
-                info = tuple(int(v) for v in parts[0].split("."))
-                what = "__version_info__"
-                names.append(what)
-                outFile.write("%s = %r\n" % (what, info))
-            except ValueError:
-                pass
-
-            if len(parts) > 1:
-                try:
-                    what = "__rebuild_version__"
-                    outFile.write("%s = %s\n" % (what, int(parts[1])))
-                    names.append(what)
-                except ValueError:
-                    pass
-
-            what = "__dependency_versions__"
+    try:
+        info = tuple(int(v) for v in parts[0].split("."))
+        what = "__version_info__"
+        names.append(what)
+        lines.append("%s = %r\n" % (what, info))
+    except ValueError:
+        pass
+
+    if len(parts) > 1:
+        try:
+            what = "__rebuild_version__"
+            lines.append("%s = %s\n" % (what, int(parts[1])))
             names.append(what)
-            outFile.write("%s = {\n" % (what))
-            for name, mod in env.dependencies.packages.items():
-                if mod is None:
-                    outFile.write("    '%s': None,\n" % name)
-                elif hasattr(mod.config, "version"):
-                    outFile.write("    '%s': '%s',\n" % (name, mod.config.version))
-                else:
-                    outFile.write("    '%s': 'unknown',\n" % name)
-            outFile.write("}\n")
-
-            # Write out an entry per line as there can be many names
-            outFile.write("__all__ = (\n")
-            for n in names:
-                outFile.write("    {!r},\n".format(n))
-            outFile.write(")\n")
-
-        if calcMd5(target[0].abspath) != oldMd5:  # only print if something's changed
-            state.log.info("makeVersionModule([\"%s\"], [])" % str(target[0]))
-
-    result = self.Command(filename, [], self.Action(makeVersionModule, strfunction=lambda *args: None))
-
-    self.AlwaysBuild(result)
-    return result
+        except ValueError:
+            pass
+
+    what = "__dependency_versions__"
+    names.append(what)
+    lines.append("%s = {\n" % (what))
+    for name, mod in env.dependencies.packages.items():
+        if mod is None:
+            lines.append("    '%s': None,\n" % name)
+        elif hasattr(mod.config, "version"):
+            lines.append("    '%s': '%s',\n" % (name, mod.config.version))
+        else:
+            lines.append("    '%s': 'unknown',\n" % name)
+    lines.append("}\n")
+
+    # Write out an entry per line as there can be many names
+    lines.append("__all__ = (\n")
+    for n in names:
+        lines.append("    {!r},\n".format(n))
+    lines.append(")\n")
+    return "".join(lines)
+
+
+def __getattr__(name):
+    # DoxygenBuilder lives in the doxygen module, which is only imported when first used
+    if name == "DoxygenBuilder":
+        from .doxygen import DoxygenBuilder
+        return DoxygenBuilder
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
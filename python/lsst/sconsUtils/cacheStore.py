@@ -0,0 +1,173 @@
+##
+#  @file cacheStore.py
+#
+#  A size-bounded, content-keyed file store that can be shared by concurrent processes.
+#
+#  This module deliberately imports nothing from SCons or the rest of sconsUtils, so that it
+#  can also be used by helper scripts that scons runs as separate processes.
+##
+
+import os
+import time
+import shutil
+import tempfile
+
+
+##
+#  @brief A directory of cache entries, each a file named by its key.
+#
+#  Entries are written atomically (to a temporary file that is renamed into place), so any
+#  number of processes may read and write the same store at once; a reader sees either a
+#  complete entry or none at all.  Reading an entry updates its modification time, which
+#  evict() uses to discard the least-recently-used entries once the store exceeds maxBytes
+#  or maxEntries.
+#
+#  Hit and miss counts, and the number of bytes read from and written to the store, are
+#  kept for reporting.
+##
+class CacheStore:
+
+    def __init__(self, directory, maxBytes=None, maxEntries=None):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self.bytesRead = 0
+        self.bytesWritten = 0
+
+    # @brief Return the filename used for the entry with the given key (a hex digest).
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    # @brief Return the contents of the entry for key, or None if there is none.
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self._touch(path)
+        self.hits += 1
+        self.bytesRead += len(data)
+        return data
+
+    # @brief Copy the entry for key to filename, returning False if there is no such entry.
+    def getFile(self, key, filename):
+        path = self.path(key)
+        try:
+            size = os.path.getsize(path)
+            self._atomicCopy(path, filename)
+        except OSError:
+            self.misses += 1
+            return False
+        self._touch(path)
+        self.hits += 1
+        self.bytesRead += size
+        return True
+
+    # @brief Store data (bytes) as the entry for key.
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpName, path)
+        except BaseException:
+            self._remove(tmpName)
+            raise
+        self.bytesWritten += len(data)
+
+    # @brief Store a copy of filename as the entry for key.
+    def putFile(self, key, filename):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._atomicCopy(filename, path)
+        self.bytesWritten += os.path.getsize(path)
+
+    @staticmethod
+    def _atomicCopy(source, destination):
+        fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destination)), prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmpName)
+            shutil.copymode(source, tmpName)
+            os.replace(tmpName, destination)
+        except BaseException:
+            CacheStore._remove(tmpName)
+            raise
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    ##
+    #  @brief Remove least-recently-used entries until the store is within its limits.
+    #
+    #  Stray temporary files left by interrupted writers are removed too.
+    #  @return the number of entries removed.
+    ##
+    def evict(self):
+        entries = []
+        totalBytes = 0
+        staleBefore = time.time() - 3600
+        try:
+            subdirs = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for subdir in subdirs:
+            subdir = os.path.join(self.directory, subdir)
+            try:
+                names = os.listdir(subdir)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(subdir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.startswith(".tmp-"):
+                    if st.st_mtime < staleBefore:
+                        self._remove(path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                totalBytes += st.st_size
+        entries.sort()
+        removed = 0
+        for mtime, size, path in entries:
+            if ((self.maxBytes is None or totalBytes <= self.maxBytes) and
+                    (self.maxEntries is None or len(entries) - removed <= self.maxEntries)):
+                break
+            self._remove(path)
+            totalBytes -= size
+            removed += 1
+        return removed
+
+    # @brief Return a one-line summary of the store's statistics.
+    def summary(self):
+        lookups = self.hits + self.misses
+        return "%d hits, %d misses (%.0f%% hit rate), %s read, %s written" % (
+            self.hits, self.misses, 100.0*self.hits/lookups if lookups else 0.0,
+            formatBytes(self.bytesRead), formatBytes(self.bytesWritten))
+
+
+# @brief Format a number of bytes for humans.
+def formatBytes(nBytes):
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(nBytes) < 1024 or unit == "GB":
+            return ("%d %s" if unit == "B" else "%.1f %s") % (nBytes, unit)
+        nBytes /= 1024.0
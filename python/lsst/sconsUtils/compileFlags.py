@@ -0,0 +1,118 @@
+##
+#  @file compileFlags.py
+#
+#  Per-file compile flags, read from a package's ups/compileFlags.ini.
+##
+
+import os
+import re
+import shlex
+import fnmatch
+import configparser
+
+
+##
+#  @brief Compile-flag changes for the source files matching globs, as read from an INI file.
+#
+#  Each section of the file is a glob, matched against source paths relative to the package root
+#  (with "/" separators, and "*" not matching "/"; use "**/" to match any number of directories).
+#  Its "add" entry lists flags to add to CCFLAGS, and its "remove" entry flags to remove from it;
+#  removals may themselves be globs, e.g. "-O*".  Adding an optimisation level (-O<n>) replaces
+#  the one already in CCFLAGS.  For example:
+#  @code
+#  # hot loops are worth the extra compile time
+#  [src/kernels/*.cc]
+#  add = -O3 -march=native -ffast-math
+#
+#  [src/io/**/*.cc]
+#  remove = -O*
+#  add = -O1
+#  @endcode
+#  When several sections match a file their changes are applied in the order of the file.
+##
+class CompileFlagOverlay:
+
+    FILE_NAME = os.path.join("ups", "compileFlags.ini")
+    KEYS = ("add", "remove")
+
+    ##
+    #  @brief Parse the text of a compile-flags file.
+    #
+    #  @param text      Contents of the file.
+    #  @param filename  Name of the file, for error messages.
+    #
+    #  @throw ValueError if the file is malformed.
+    ##
+    def __init__(self, text, filename=FILE_NAME):
+        parser = configparser.ConfigParser(interpolation=None, default_section="\0")
+        parser.optionxform = str
+        try:
+            parser.read_string(text, source=filename)
+        except configparser.Error as e:
+            raise ValueError("Unable to parse %s: %s" % (filename, e))
+        self.filename = filename
+        self.rules = []
+        for glob in parser.sections():
+            unknown = set(parser[glob]) - set(self.KEYS)
+            if unknown:
+                raise ValueError("Unknown key(s) %s in section [%s] of %s; expected %s"
+                                 % (", ".join(sorted(unknown)), glob, filename, " or ".join(self.KEYS)))
+            add = shlex.split(parser[glob].get("add", ""))
+            remove = shlex.split(parser[glob].get("remove", ""))
+            self.rules.append((self._compileGlob(glob), add, remove))
+        self._lookup = {}
+
+    # @brief Return a CompileFlagOverlay for the named file, or None if it does not exist.
+    @classmethod
+    def read(cls, filename):
+        try:
+            with open(filename) as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        return cls(text, filename)
+
+    @staticmethod
+    def _compileGlob(glob):
+        parts = []
+        for part in re.split(r"(\*\*/|\*|\?)", glob.strip().lstrip("/")):
+            if part == "**/":
+                parts.append("(?:.*/)?")
+            elif part == "*":
+                parts.append("[^/]*")
+            elif part == "?":
+                parts.append("[^/]")
+            else:
+                parts.append(re.escape(part))
+        return re.compile("".join(parts) + r"\Z")
+
+    # @brief Return the (add, remove) flag lists that apply to path (relative to the package root).
+    def lookup(self, path):
+        path = path.replace(os.sep, "/")
+        try:
+            return self._lookup[path]
+        except KeyError:
+            pass
+        add = []
+        remove = []
+        for regex, ruleAdd, ruleRemove in self.rules:
+            if regex.match(path):
+                add = [flag for flag in add if not self._matches(flag, ruleRemove)] + ruleAdd
+                remove += ruleRemove
+        self._lookup[path] = (add, remove)
+        return add, remove
+
+    @staticmethod
+    def _matches(flag, patterns):
+        return any(fnmatch.fnmatchcase(flag, pattern) for pattern in patterns)
+
+    ##
+    #  @brief Return ccflags (a list) with the changes for path applied, or None if there are none.
+    ##
+    def apply(self, path, ccflags):
+        add, remove = self.lookup(path)
+        if not (add or remove):
+            return None
+        if any(re.match(r"-O(\d|s|fast|g|z)?$", flag) for flag in add):
+            remove = remove + ["-O", "-O?", "-Ofast"]
+        return [flag for flag in ccflags if not self._matches(str(flag), remove)] + add
@@ -8,14 +8,31 @@
 ##
 
 import os.path
+import re
+import sys
+import json
+import atexit
+import time
+import types
+import shutil
+import struct
+import marshal
+import hashlib
+import tempfile
+import subprocess
 import collections
-import imp
+import concurrent.futures
+import importlib.machinery
+import importlib.util
 import SCons.Script
+import SCons.Subst
 from . import eupsForScons
 from SCons.Script.SConscript import SConsEnvironment
 
 from . import installation
 from . import state
+from . import utils
+from .cacheStore import CacheStore
 
 
 ##
@@ -62,7 +79,14 @@ def configure(packageName, versionString=None, eupsProduct=None, eupsProductPath
     #
     state.log.traceback = state.env.GetOption("traceback")
     state.log.verbose = state.env.GetOption("verbose")
-    packages = PackageTree(packageName, noCfgFile=noCfgFile)
+    check = state.env.GetOption("checkDependencies")
+    snapshot = DependencySnapshot(state.env, packageName, noCfgFile)
+    with state.timings.phase("PackageTree"):
+        packages = None if check else snapshot.load()
+        if packages is None:
+            with state.log.record() as messages:
+                packages = PackageTree(packageName, noCfgFile=noCfgFile)
+            snapshot.warnings = messages
     state.log.flush()  # if we've already hit a fatal error, die now.
     state.env.libs = {"main": [], "python": [], "test": []}
     state.env.doxygen = {"tags": [], "includes": []}
@@ -93,13 +117,73 @@ def configure(packageName, versionString=None, eupsProduct=None, eupsProductPath
         state.env['SWIGPATH'] = state.env['CPPPATH']
 
     if not state.env.GetOption("clean") and not state.env.GetOption("help"):
-        packages.configure(state.env, check=state.env.GetOption("checkDependencies"))
+        with state.timings.phase("packages.configure"):
+            if snapshot.restored:
+                snapshot.restore(state.env)
+            else:
+                packages.configure(state.env, check=check)
+                if not check:
+                    snapshot.save(packages, state.env)
         for target in state.env.libs:
             state.log.info("Libraries in target '%s': %s" % (target, state.env.libs[target]))
+        if "RPATHLINK" in state.env:
+            # where the linker finds the libraries that the tree's libraries link with; those of
+            # indirect dependencies may only be on LD_LIBRARY_PATH
+            rpathLink = [state.env.Dir(d).abspath for d in state.env["LIBPATH"]]
+            for d in os.environ.get("LD_LIBRARY_PATH", "").split(":"):
+                if d and d not in rpathLink:
+                    rpathLink.append(d)
+            state.env["RPATHLINK"] = rpathLink
+        if state.env.get("relocatable"):
+            _makeRelocatable(state.env, packages)
     state.env.dependencies = packages
     state.log.flush()
 
 
+##
+# @brief Keep the absolute paths of the package and its dependencies out of what env builds
+#        (the "relocatable" build variable).
+#
+# The package root is mapped to "." and the root of each dependency to <PRODUCT>_DIR (the variable
+# EUPS would point at it) by -ffile-prefix-map, which covers __FILE__ as well as debug
+# information, or by -fdebug-prefix-map with compilers too old for that.  These flags are
+# excluded from command signatures, and static libraries are archived without timestamps, so
+# builds in different checkouts, against products installed in different places, produce the same
+# files and signatures, and can share a CacheDir or an --objectCache.
+##
+def _makeRelocatable(env, packages):
+    whichCc = getattr(env, "whichCc", "unknown")
+    if whichCc not in ("gcc", "clang"):
+        state.log.warn("Relocatable builds are not supported with compiler %s" % whichCc)
+        return
+    version = re.match(r"\d+", getattr(env, "ccVersion", ""))
+    # -ffile-prefix-map appeared in gcc 8 and clang 10
+    if version and int(version.group()) >= (8 if whichCc == "gcc" else 10):
+        option = "-ffile-prefix-map"
+    else:
+        option = "-fdebug-prefix-map"
+    roots = {}
+    for name, module in packages.packages.items():
+        config = getattr(module, "config", None)
+        root = getattr(config, "root", None)
+        if root:
+            roots[root] = "%s_DIR" % getattr(config, "eupsProduct", name).upper()
+    top = env.Dir("#").abspath
+    roots[top] = roots[os.path.realpath(top)] = "."
+    # the last matching map wins, so put the most specific (longest) roots last
+    maps = ["%s=%s=%s" % (option, root, roots[root]) for root in sorted(roots, key=len)
+            if "=" not in root]
+    env["_PREFIXMAPFLAGS"] = ["$("] + maps + ["$)"]
+    env["_CCCOMCOM"] = "%s $_PREFIXMAPFLAGS" % env["_CCCOMCOM"]
+
+    if env["PLATFORM"] == "darwin":
+        env["ENV"]["ZERO_AR_DATE"] = "1"
+    else:
+        arflags = env.Split(env["ARFLAGS"])
+        env["ARFLAGS"] = [arflags[0] + "D"] + arflags[1:] if arflags else ["rcD"]
+        env.Append(RANLIBFLAGS=["-D"])
+
+
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 
 ##
@@ -125,12 +209,10 @@ class Configuration:
         name, ext = os.path.splitext(file)
         return name, os.path.abspath(os.path.join(dir, ".."))
 
+    # @brief Return the (version, productDir) of a setup EUPS product; either may be None.
     @staticmethod
     def getEupsData(eupsProduct):
-        version, eupsPathDir, productDir, table, flavor = eupsForScons.getEups().findSetupVersion(eupsProduct)
-        if productDir is None:
-            productDir = eupsForScons.productDir(eupsProduct)
-        return version, productDir
+        return eupsForScons.findSetupProduct(eupsProduct)
 
     ##
     # @brief Initialize the configuration object.
@@ -195,6 +277,8 @@ class Configuration:
         else:
             self.libs = {"main": libs, "python": [], "test": []}
         self.paths = {}
+        # Whether each candidate include and lib directory existed, for DependencySnapshot
+        self.pathDirs = {}
         if hasSwigFiles:
             self.paths["SWIGPATH"] = [os.path.join(self.root, "python")]
         else:
@@ -209,7 +293,8 @@ class Configuration:
 
             for subDir in subDirs:
                 pathDir = os.path.join(self.root, subDir)
-                if os.path.isdir(pathDir):
+                self.pathDirs[pathDir] = os.path.isdir(pathDir)
+                if self.pathDirs[pathDir]:
                     self.paths[pathName].append(pathDir)
 
         self.provides = {
@@ -261,6 +346,10 @@ class Configuration:
                         conf.env.libs[target].append(lib)
                         state.log.info("Adding '%s' library to target '%s'." % (lib, target))
         if check:
+            checker = getattr(conf, "dependencyChecks", None)
+            if checker is not None:
+                checker.add(self.name, self.provides["headers"], self.libs["main"])
+                return True
             for header in self.provides["headers"]:
                 if not conf.CheckCXXHeader(header):
                     return False
@@ -307,6 +396,108 @@ class ExternalConfiguration(Configuration):
         del self.paths["CPPPATH"]
 
 
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+
+##
+# @brief Results of the Custom*Check tests, shared between packages (--conftest-cache).
+#
+# SCons only caches configuration tests in each package's own .sconf_temp, so every package in
+# a stack would otherwise re-run the same flag and snippet tests.  With --conftest-cache, each
+# result is also kept in a per-user CacheStore, keyed on the identity of the compiler binary,
+# the fully-expanded compile (and link) flags that can affect it and the test source (see
+# key()), and consulted before running the test.  The store is trimmed to MAX_ENTRIES at exit;
+# --conftest-stats reports its hits and misses.
+##
+class ConftestCache:
+
+    MAX_ENTRIES = 20000
+
+    _store = None
+    _registered = False
+    _unusable = False
+
+    @classmethod
+    def getStore(cls, env):
+        if not cls._registered and (env.GetOption("conftestCache") or env.GetOption("conftestStats")):
+            cls._registered = True
+            atexit.register(cls._finish, env.GetOption("conftestStats"))
+        if cls._store is None and env.GetOption("conftestCache") and not cls._unusable:
+            try:
+                cls._store = CacheStore(utils.userCacheDir("conftest"), maxEntries=cls.MAX_ENTRIES)
+            except OSError as e:
+                cls._unusable = True
+                state.log.warn("Shared conftest cache disabled: %s" % e)
+        return cls._store
+
+    @classmethod
+    def _finish(cls, stats):
+        store = cls._store
+        if store is not None and store.bytesWritten:
+            store.evict()
+        if stats:
+            if store is None:
+                state.log.report("Shared conftest cache: disabled (use --conftest-cache)")
+            else:
+                state.log.report("Shared conftest cache: %s" % store.summary())
+
+    ##
+    # @brief Return the key of a test's result.
+    #
+    # The include path (and any prefix maps) of $_CCCOMCOM, and the library path, differ between
+    # packages, as they hold each package's own absolute paths.  They can only change the result
+    # of a test that includes a header or links with a library, so they are left out of the keys
+    # of the others (such as the flag checks), which can then be shared by all packages.
+    ##
+    @staticmethod
+    def key(env, kind, source, extension):
+        if re.search(r"^\s*#\s*include", source, re.MULTILINE):
+            cppFlags = "$_CCCOMCOM"
+        else:
+            cppFlags = "$CPPFLAGS $_CPPDEFFLAGS"
+        if extension == ".c":
+            template = "$CC $CFLAGS $CCFLAGS " + cppFlags
+        else:
+            template = "$CXX $CXXFLAGS $CCFLAGS " + cppFlags
+        command = env.subst_list(template, SCons.Subst.SUBST_CMD)[0]
+        if kind == "link":
+            libFlags = env.subst_list("$_LIBFLAGS", SCons.Subst.SUBST_CMD)[0]
+            command += env.subst_list("$LINK $LINKFLAGS" + (" $_LIBDIRFLAGS" if libFlags else ""),
+                                      SCons.Subst.SUBST_CMD)[0] + libFlags
+        command = [str(arg) for arg in command]
+        compiler = utils.fileStamp(env.WhereIs(command[0])) if command else None
+        identity = [compiler, getattr(state.env, "ccVersion", None), kind, extension, command,
+                    hashlib.sha1(source.encode()).hexdigest()]
+        return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+    ##
+    # @brief Run context.TryCompile or context.TryLink on source, or reuse its shared result.
+    #
+    # A shared result is reported as "(cached)", just as SCons reports its own cached tests.
+    ##
+    @classmethod
+    def tryBuild(cls, context, kind, source, extension):
+        tryFunction = context.TryLink if kind == "link" else context.TryCompile
+        store = cls.getStore(context.env)
+        if store is None:
+            return tryFunction(source, extension)
+        key = cls.key(context.env, kind, source, extension)
+        data = store.get(key)
+        if data is not None:
+            try:
+                result = json.loads(data.decode())["result"]
+            except (ValueError, KeyError):
+                pass
+            else:
+                context.sconf.cached = 1
+                return result
+        result = tryFunction(source, extension)
+        try:
+            store.put(key, json.dumps({"result": result}).encode())
+        except OSError as e:
+            state.log.warn("Unable to write to shared conftest cache: %s" % e)
+        return result
+
+
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 
 ##
@@ -320,9 +511,10 @@ class ExternalConfiguration(Configuration):
 ##
 def CustomCFlagCheck(context, flag, append=True):
     context.Message("Checking if C compiler supports " + flag + " flag ")
-    ccflags = context.env["CCFLAGS"]
+    ccflags = context.env["CCFLAGS"][:]  # Append modifies the list in place
     context.env.Append(CCFLAGS=flag)
-    result = context.TryCompile("int main(int argc, char **argv) { return 0; }", ".c")
+    result = ConftestCache.tryBuild(context, "compile",
+                                    "int main(int argc, char **argv) { return 0; }", ".c")
     context.Result(result)
     if not append or not result:
         context.env.Replace(CCFLAGS=ccflags)
@@ -340,9 +532,10 @@ def CustomCFlagCheck(context, flag, append=True):
 ##
 def CustomCppFlagCheck(context, flag, append=True):
     context.Message("Checking if C++ compiler supports " + flag + " flag ")
-    cxxflags = context.env["CXXFLAGS"]
+    cxxflags = context.env["CXXFLAGS"][:]  # Append modifies the list in place
     context.env.Append(CXXFLAGS=flag)
-    result = context.TryCompile("int main(int argc, char **argv) { return 0; }", ".cc")
+    result = ConftestCache.tryBuild(context, "compile",
+                                    "int main(int argc, char **argv) { return 0; }", ".cc")
     context.Result(result)
     if not append or not result:
         context.env.Replace(CXXFLAGS=cxxflags)
@@ -365,7 +558,7 @@ def CustomCompileCheck(context, message, source, extension=".cc"):
     if (env.GetOption("clean") or env.GetOption("help") or env.GetOption("no_exec")):
         result = True
     else:
-        result = context.TryCompile(source, extension)
+        result = ConftestCache.tryBuild(context, "compile", source, extension)
 
     context.Result(result)
 
@@ -383,11 +576,225 @@ def CustomCompileCheck(context, message, source, extension=".cc"):
 ##
 def CustomLinkCheck(context, message, source, extension=".cc"):
     context.Message(message)
-    result = context.TryLink(source, extension)
+    result = ConftestCache.tryBuild(context, "link", source, extension)
     context.Result(result)
     return result
 
 
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+
+##
+# @brief Run the autoconf-style header and library checks requested by --checkDependencies.
+#
+# Rather than one compile per header and one link per library, every header provided by the
+# dependencies is included in a single translation unit and a single program is linked against
+# all their main libraries.  Only if one of these fails is the failing group bisected to find
+# the culprits; each round of the bisection runs its compiles and links concurrently, using as
+# many workers as scons jobs (or cores, with -j1).
+#
+# Configuration.configure registers its checks with add() when the Configure context carries
+# a DependencyChecker (as PackageTree.configure arranges), and run() performs them all.
+##
+class DependencyChecker:
+
+    def __init__(self, env):
+        self.env = env
+        self.headers = []               # (package, header) pairs, in configuration order
+        self.libs = []                  # (package, library) pairs, in configuration order
+        jobs = env.GetOption("num_jobs")
+        self.jobs = jobs if jobs > 1 else (os.cpu_count() or 1)
+
+    def add(self, name, headers, libs):
+        self.headers.extend((name, header) for header in headers)
+        self.libs.extend((name, lib) for lib in libs)
+
+    def _command(self, template, env=None):
+        env = self.env if env is None else env
+        return [str(arg) for arg in env.subst_list(template, SCons.Subst.SUBST_CMD)[0]]
+
+    def _execute(self, args):
+        # Run from the top directory, as SCons does, so relative -I and -L flags resolve; only the
+        # sources and outputs live in tmpDir.
+        proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              env=self.env["ENV"], cwd=self.topDir)
+        return proc.returncode == 0, proc.stdout.decode(errors="replace")
+
+    def _compile(self, index, items):
+        source = os.path.join(self.tmpDir, "headers%d.cc" % index)
+        with open(source, "w") as f:
+            for name, header in items:
+                f.write('#include "%s"\n' % header)
+        return self._execute(self.compileCommand + ["-o", source[:-3] + ".o", source])
+
+    def _link(self, index, items):
+        source = os.path.join(self.tmpDir, "libs%d.cc" % index)
+        with open(source, "w") as f:
+            f.write("int main(int argc, char **argv) { return 0; }\n")
+        libEnv = self.env.Override({"LIBS": [lib for name, lib in items]})
+        flags = self._command("$LINKFLAGS $__RPATH $_LIBDIRFLAGS $_LIBFLAGS", libEnv)
+        return self._execute(self.linkCommand + ["-o", source[:-3], source] + flags)
+
+    def _bisect(self, pool, groups):
+        """Test (function, items) groups, splitting failing ones until single items remain.
+
+        @return the list of (function, item, output) for the items that fail on their own.
+        """
+        failures = []
+        index = 0
+        while groups:
+            futures = []
+            for function, items in groups:
+                futures.append((function, items, pool.submit(function, index, items)))
+                index += 1
+            groups = []
+            for function, items, future in futures:
+                ok, output = future.result()
+                if ok:
+                    continue
+                if len(items) == 1:
+                    failures.append((function, items[0], output))
+                else:
+                    middle = len(items)//2
+                    groups.extend([(function, items[:middle]), (function, items[middle:])])
+        return failures
+
+    ##
+    # @brief Perform all registered checks.
+    #
+    # @return the names of packages that failed a check, in configuration order.
+    ##
+    def run(self):
+        if not self.headers and not self.libs:
+            return []
+        state.log.info("Checking %d headers and %d libraries together." %
+                       (len(self.headers), len(self.libs)))
+        self.compileCommand = self._command("$CXX -c $CXXFLAGS $CCFLAGS $_CCCOMCOM")
+        self.linkCommand = self._command("$CXX $CXXFLAGS $CCFLAGS $_CCCOMCOM")
+        confDir = self.env.Dir(self.env["CONFIGUREDIR"]).abspath
+        os.makedirs(confDir, exist_ok=True)
+        self.tmpDir = tempfile.mkdtemp(prefix="checks-", dir=confDir)
+        self.topDir = self.env.Dir("#").abspath
+        groups = [(f, items) for f, items in ((self._compile, self.headers), (self._link, self.libs))
+                  if items]
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                failures = self._bisect(pool, groups)
+        finally:
+            shutil.rmtree(self.tmpDir, ignore_errors=True)
+        failed = set()
+        for function, (name, what), output in failures:
+            kind = "header" if function == self._compile else "library"
+            state.log.warn("Package %s: %s %s failed its check:\n%s" % (name, kind, what, output))
+            failed.add(name)
+        return [name for name in collections.OrderedDict.fromkeys(n for n, item in self.headers + self.libs)
+                if name in failed]
+
+
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+
+##
+# @brief An index of the .cfg files available on a configuration search path.
+#
+# Each directory on the path is listed once (duplicates are dropped, keeping the first
+# occurrence), and the package name of every .cfg file found is mapped to the list of
+# matching files in search-path order.  Lookups, including those for packages that do
+# not exist, then cost a dictionary access rather than a stat call per directory.
+##
+class ConfigPathIndex:
+
+    def __init__(self, cfgPath):
+        self.path = self.searchPath(cfgPath)
+        self._files = {}
+        for path in self.path:
+            try:
+                with os.scandir(path) as entries:
+                    names = sorted(entry.name for entry in entries
+                                   if entry.name.endswith(".cfg") and entry.is_file())
+            except OSError:
+                continue
+            for name in names:
+                self._files.setdefault(name[:-len(".cfg")], []).append(os.path.join(path, name))
+
+    # @brief Return the directories of cfgPath that are searched, in order and without duplicates.
+    @staticmethod
+    def searchPath(cfgPath):
+        return list(collections.OrderedDict.fromkeys(os.path.normpath(p) for p in cfgPath))
+
+    # @brief Return the .cfg files for package name, in search-path order (empty if there are none).
+    def find(self, name):
+        return self._files.get(name, ())
+
+    def __contains__(self, name):
+        return name in self._files
+
+
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+
+##
+# @brief An importlib loader for .cfg configuration modules that caches their compiled code.
+#
+# Code objects are stored in the per-user cache directory (see utils.userCacheDir), one file per
+# .cfg file named by its absolute path.  As with importlib's own .pyc files, each starts with the
+# Python bytecode version and the size and modification time of its source, so a .cfg file is
+# only parsed and compiled again when it changes, and the stale code is then overwritten.  If
+# there is no usable cache directory, the code is compiled from source every time.
+##
+class ConfigurationLoader(importlib.machinery.SourceFileLoader):
+
+    _HEADER = struct.Struct("<4sQQ")
+
+    def __init__(self, fullname, path):
+        importlib.machinery.SourceFileLoader.__init__(self, fullname, path)
+        self.cacheHit = False
+
+    @staticmethod
+    def _cacheFile(path):
+        return os.path.join(utils.userCacheDir("cfg"),
+                            hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + ".pyc")
+
+    def get_code(self, fullname):
+        path = self.get_filename(fullname)
+        cacheFile = None
+        try:
+            st = os.stat(path)
+            header = self._HEADER.pack(importlib.util.MAGIC_NUMBER, st.st_size, st.st_mtime_ns)
+            cacheFile = self._cacheFile(path)
+            with open(cacheFile, "rb") as f:
+                data = f.read()
+            if data[:self._HEADER.size] == header:
+                code = marshal.loads(data[self._HEADER.size:])
+                self.cacheHit = True
+                return code
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        code = self.source_to_code(self.get_data(path), path)
+        if cacheFile is not None:
+            try:
+                utils.atomicWrite(cacheFile, header + marshal.dumps(code))
+            except OSError as e:
+                state.log.info("Unable to cache compiled configuration %s: %s" % (path, e))
+        return code
+
+
+##
+# @brief Import the configuration module in filename as moduleName.
+#
+# Like the old imp.load_source, the module is added to sys.modules.
+# @return a (module, loader) tuple.
+##
+def loadConfigurationModule(moduleName, filename):
+    loader = ConfigurationLoader(moduleName, filename)
+    spec = importlib.util.spec_from_file_location(moduleName, filename, loader=loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[moduleName] = module
+    try:
+        loader.exec_module(module)
+    except BaseException:
+        del sys.modules[moduleName]
+        raise
+    return module, loader
+
+
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 
 ##
@@ -418,13 +825,9 @@ class PackageTree:
     ##
     def __init__(self, primaryName, noCfgFile=False):
         self.cfgPath = state.env.cfgPath
+        self.cfgIndex = ConfigPathIndex(self.cfgPath)
         self.packages = collections.OrderedDict()
-        self.customTests = {
-            "CustomCFlagCheck": CustomCFlagCheck,
-            "CustomCppFlagCheck": CustomCppFlagCheck,
-            "CustomCompileCheck": CustomCompileCheck,
-            "CustomLinkCheck": CustomLinkCheck,
-        }
+        self.customTests = self._defaultCustomTests()
         self._current = set([primaryName])
         if noCfgFile:
             self.primary = None
@@ -454,19 +857,78 @@ class PackageTree:
         for dependency in self.primary.dependencies.get("buildOptional", ()):
             self._recurse(dependency)
 
+    @staticmethod
+    def _defaultCustomTests():
+        return {
+            "CustomCFlagCheck": CustomCFlagCheck,
+            "CustomCppFlagCheck": CustomCppFlagCheck,
+            "CustomCompileCheck": CustomCompileCheck,
+            "CustomLinkCheck": CustomLinkCheck,
+        }
+
+    ##
+    # @brief Create a PackageTree from the state saved by moduleState, without importing any .cfg files.
+    #
+    # Used by DependencySnapshot; packages are represented by module objects holding just the
+    # "dependencies" dict and the "config" object.
+    ##
+    @classmethod
+    def fromSnapshot(cls, primary, packages):
+        self = cls.__new__(cls)
+        self.cfgPath = state.env.cfgPath
+        self.packages = collections.OrderedDict((name, cls._restoreModule(name, module))
+                                                for name, module in packages)
+        self.customTests = self._defaultCustomTests()
+        self.primary = cls._restoreModule(None, primary)
+        self._current = set()
+        return self
+
+    # @brief Return a JSON-compatible description of a configuration module, for fromSnapshot.
+    @staticmethod
+    def moduleState(module):
+        if module is None:
+            return None
+        return {"file": module.__file__, "dependencies": module.dependencies,
+                "class": type(module.config).__name__, "config": vars(module.config)}
+
+    @staticmethod
+    def _restoreModule(name, data):
+        if data is None:
+            return None
+        config = data["config"]
+        module = types.ModuleType((name or config["name"]) + "_cfg")
+        module.__file__ = data["file"]
+        module.dependencies = data["dependencies"]
+        cls = ExternalConfiguration if data["class"] == "ExternalConfiguration" else Configuration
+        module.config = cls.__new__(cls)
+        module.config.__dict__.update(config)
+        module.config.provides = dict((k, tuple(v)) for k, v in config["provides"].items())
+        return module
+
     name = property(lambda self: self.primary.config.name)
 
     # @brief Configure the entire dependency tree in order. and return an updated environment."""
     def configure(self, env, check=False):
         conf = env.Configure(custom_tests=self.customTests)
+        if check:
+            conf.dependencyChecks = DependencyChecker(conf.env)
         for name, module in self.packages.items():
             if module is None:
                 state.log.info("Skipping missing optional package %s." % name)
                 continue
-            if not module.config.configure(conf, packages=self.packages, check=check, build=False):
+            with state.timings.phase(name, category="dependency"):
+                ok = module.config.configure(conf, packages=self.packages, check=check, build=False)
+            if not ok:
                 state.log.fail("%s was found but did not pass configuration checks." % name)
+        if check:
+            with state.timings.phase("checkDependencies"):
+                failed = conf.dependencyChecks.run()
+            if failed:
+                state.log.fail("%s %s found but did not pass configuration checks." %
+                               (", ".join(failed), "was" if len(failed) == 1 else "were"))
         if self.primary:
-            self.primary.config.configure(conf, packages=self.packages, check=False, build=True)
+            with state.timings.phase(self.name, category="dependency"):
+                self.primary.config.configure(conf, packages=self.packages, check=False, build=True)
         env.AppendUnique(SWIGPATH=env["CPPPATH"])
         env.AppendUnique(XSWIGPATH=env["XCPPPATH"])
         # reverse the order of libraries in env.libs, so libraries that fulfill a dependency
@@ -474,7 +936,12 @@ class PackageTree:
         # in static libraries.
         for target in env.libs:
                 env.libs[target].reverse()
-        env = conf.Finish()
+        confEnv = conf.Finish()
+        if confEnv is not env:
+            # With --config=force, SCons runs the checks in a clone of env, which holds the paths
+            # and libraries the packages set up; copy them back
+            env.Replace(**dict((k, v) for k, v in confEnv.Dictionary().items()
+                               if k != "BUILDERS" and (k not in env or env[k] != v)))
         return env
 
     def __contains__(self, name):
@@ -501,24 +968,25 @@ class PackageTree:
 
     def _tryImport(self, name):
         """Search for and import an individual configuration module from file."""
-        for path in self.cfgPath:
-            filename = os.path.join(path, name + ".cfg")
-            if os.path.exists(filename):
-                try:
-                    module = imp.load_source(name + "_cfg", filename)
-                except Exception as e:
-                    state.log.warn("Error loading configuration %s (%s)" % (filename, e))
-                    continue
-                state.log.info("Using configuration for package '%s' at '%s'." % (name, filename))
-                if not hasattr(module, "dependencies") or not isinstance(module.dependencies, dict):
-                    state.log.warn("Configuration module for package '%s' lacks a dependencies dict." % name)
-                    return None
-                if not hasattr(module, "config") or not isinstance(module.config, Configuration):
-                    state.log.warn("Configuration module for package '%s' lacks a config object." % name)
-                    return None
-                else:
-                    module.config.addCustomTests(self.customTests)
-                return module
+        for filename in self.cfgIndex.find(name):
+            startTime = time.perf_counter()
+            try:
+                module, loader = loadConfigurationModule(name + "_cfg", filename)
+            except Exception as e:
+                state.log.warn("Error loading configuration %s (%s)" % (filename, e))
+                continue
+            loadTime = 1e3*(time.perf_counter() - startTime)
+            state.log.info("Using configuration for package '%s' at '%s' (loaded in %.1f ms%s)." %
+                           (name, filename, loadTime, ", cached bytecode" if loader.cacheHit else ""))
+            if not hasattr(module, "dependencies") or not isinstance(module.dependencies, dict):
+                state.log.warn("Configuration module for package '%s' lacks a dependencies dict." % name)
+                return None
+            if not hasattr(module, "config") or not isinstance(module.config, Configuration):
+                state.log.warn("Configuration module for package '%s' lacks a config object." % name)
+                return None
+            else:
+                module.config.addCustomTests(self.customTests)
+            return module
         state.log.info("Failed to import configuration for optional package '%s'." % name)
 
     def _recurse(self, name):
@@ -552,6 +1020,135 @@ class PackageTree:
         return True
 
 
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+##
+# @brief A record of a resolved and configured PackageTree, stored in the configure directory
+#        (usually .sconf_temp), that lets later builds skip loading the tree altogether.
+#
+# The snapshot holds the package order, each package's dependencies and Configuration attributes,
+# and the libs, paths and doxygen settings the tree left in the environment.  It is keyed on the
+# size and mtime of every .cfg file used, on which of the packages' candidate include and lib
+# directories exist, the SETUP_* and *_DIR environment variables (plus LSST_CFG_PATH and
+# EUPS_PATH), the configuration search path and the mtimes of its directories (so adding a .cfg
+# file that would be found, or would shadow one, invalidates it) and the options that affect
+# configuration.  If the
+# key still matches, load() rebuilds an equivalent PackageTree without importing any .cfg module
+# and restore() fills in the environment.  Warnings logged while loading the tree are stored with
+# it and repeated by load().
+#
+# Trees containing a Configuration subclass are never snapshotted, as their configure()
+# methods may do anything; nor is anything saved or used with --checkDependencies.
+# Use --config=force to ignore an existing snapshot.
+##
+class DependencySnapshot:
+
+    FILE_NAME = "dependencies.json"
+    ENV_VARIABLES = ("libs", "doxygen")
+    PATH_VARIABLES = ("CPPPATH", "XCPPPATH", "LIBPATH", "SWIGPATH", "XSWIGPATH")
+
+    def __init__(self, env, packageName, noCfgFile):
+        self.env = env
+        self.restored = None
+        self.warnings = []
+        self.filename = os.path.join(env.Dir(env["CONFIGUREDIR"]).abspath, self.FILE_NAME)
+        environ = dict((k, v) for k, v in os.environ.items()
+                       if k.startswith("SETUP_") or re.search(r"_DIR(_EXTRA)?$", k) or
+                       k in ("LSST_CFG_PATH", "EUPS_PATH"))
+        self.key = {
+            "packageName": packageName,
+            "noCfgFile": noCfgFile,
+            "linkFarmDir": env.linkFarmDir,
+            "noEups": env['no_eups'],
+            "cfgPath": env.cfgPath,
+            "cfgPathDirs": self._stampDirs(ConfigPathIndex.searchPath(env.cfgPath)),
+            "environ": environ,
+            "sconsUtils": utils.fileStamp(__file__),
+        }
+
+    @staticmethod
+    def _stampFiles(filenames):
+        stamps = {}
+        for filename in filenames:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                return None
+            stamps[filename] = [st.st_size, st.st_mtime_ns]
+        return stamps
+
+    # Adding or removing a .cfg file changes the mtime of its directory.
+    @staticmethod
+    def _stampDirs(dirnames):
+        stamps = {}
+        for dirname in dirnames:
+            try:
+                stamps[dirname] = os.stat(dirname).st_mtime_ns
+            except OSError:
+                stamps[dirname] = None
+        return stamps
+
+    @staticmethod
+    def _checkDirs(dirnames):
+        return dict((dirname, os.path.isdir(dirname)) for dirname in dirnames)
+
+    # @brief Return a PackageTree rebuilt from a valid snapshot, or None.
+    def load(self):
+        if self.env.GetOption("config") == "force":
+            return None
+        data = utils.readJsonCache(self.filename)
+        if not data or data.get("key") != json.loads(json.dumps(self.key)):
+            return None
+        if self._stampFiles(data["files"]) != data["files"]:
+            return None
+        if "dirs" not in data or self._checkDirs(data["dirs"]) != data["dirs"]:
+            return None
+        packages = PackageTree.fromSnapshot(data["primary"], data["packages"])
+        state.log.info("Using dependency snapshot from %s." % self.filename)
+        # the warnings loading the tree gave, e.g. for products EUPS doesn't know about
+        for message in data["warnings"]:
+            state.log.warn(message)
+        self.restored = data
+        return packages
+
+    # @brief Fill the environment with the configuration recorded in the snapshot.
+    def restore(self, env):
+        for name, value in self.restored["env"].items():
+            if name in self.ENV_VARIABLES:
+                setattr(env, name, value)
+            else:
+                env[name] = value
+
+    # @brief Record a configured PackageTree and the environment it produced, if possible.
+    def save(self, packages, env):
+        modules = [packages.primary] if packages.primary else []
+        modules.extend(m for m in packages.packages.values() if m is not None)
+        if any(type(m.config) not in (Configuration, ExternalConfiguration) for m in modules):
+            state.log.info("Not saving a dependency snapshot; the tree has custom configurations.")
+            return
+        data = {
+            "key": self.key,
+            "files": self._stampFiles(m.__file__ for m in modules),
+            "dirs": self._checkDirs(d for m in modules for d in getattr(m.config, "pathDirs", ())),
+            "primary": PackageTree.moduleState(packages.primary),
+            "packages": [[name, PackageTree.moduleState(m)] for name, m in packages.packages.items()],
+            "env": dict((name, getattr(env, name)) for name in self.ENV_VARIABLES),
+            "warnings": self.warnings,
+        }
+        for name in self.PATH_VARIABLES:
+            if name in env:
+                data["env"][name] = list(env[name])
+        try:
+            text = json.dumps(data)
+        except TypeError:
+            state.log.info("Not saving a dependency snapshot; the configuration is not serializable.")
+            return
+        try:
+            utils.atomicWrite(self.filename, text)
+        except OSError as e:
+            state.log.info("Unable to write dependency snapshot %s: %s" % (self.filename, e))
+
+
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
 ##
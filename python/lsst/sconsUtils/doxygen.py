@@ -0,0 +1,156 @@
+##
+#  @file doxygen.py
+#
+#  Support for the env.Doxygen pseudo-builder (see builders.py), imported only when it is used.
+##
+
+import os
+import fnmatch
+import pipes
+
+import SCons.Script
+
+from . import state
+
+
+##
+#  @brief A callable to be used as an SCons Action to run Doxygen.
+#
+#  This should only be used by the env.Doxygen pseudo-builder method.
+#
+class DoxygenBuilder:
+
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+        self.results = []
+        self.sources = []
+        self.targets = []
+        self.useTags = list(SCons.Script.File(item).abspath for item in self.useTags)
+        self.inputs = list(SCons.Script.Entry(item).abspath for item in self.inputs)
+        self.excludes = list(SCons.Script.Entry(item).abspath for item in self.excludes)
+        self.outputPaths = list(SCons.Script.Dir(item) for item in self.outputs)
+
+    def __call__(self, env, config):
+        self.findSources()
+        self.findTargets()
+        inConfigNode = SCons.Script.File(config)
+        outConfigName, ext = os.path.splitext(inConfigNode.abspath)
+        outConfigNode = SCons.Script.File(outConfigName)
+        if self.makeTag:
+            tagNode = SCons.Script.File(self.makeTag)
+            self.makeTag = tagNode.abspath
+            self.targets.append(tagNode)
+        config = env.Command(target=outConfigNode, source=inConfigNode if os.path.exists(config) else None,
+                             action=self.buildConfig)
+        env.AlwaysBuild(config)
+        doc = env.Command(target=self.targets, source=self.sources,
+                          action="doxygen %s" % pipes.quote(outConfigNode.abspath))
+        for path in self.outputPaths:
+            env.Clean(doc, path)
+        env.Depends(doc, config)
+        self.results.extend(config)
+        self.results.extend(doc)
+        return self.results
+
+    def findSources(self):
+        for path in self.inputs:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    if os.path.abspath(root) in self.excludes:
+                        dirs[:] = []
+                        continue
+                    if not self.recursive:
+                        dirs[:] = []
+                    else:
+                        toKeep = []
+                        for relDir in dirs:
+                            if relDir.startswith("."):
+                                continue
+                            absDir = os.path.abspath(os.path.join(root, relDir))
+                            if absDir not in self.excludes:
+                                toKeep.append(relDir)
+                        dirs[:] = toKeep
+                    if self.excludeSwig:
+                        for relFile in files:
+                            base, ext = os.path.splitext(relFile)
+                            if ext == ".i":
+                                self.excludes.append(os.path.join(root, base + ".py"))
+                                self.excludes.append(os.path.join(root, base + "_wrap.cc"))
+                    for relFile in files:
+                        absFile = os.path.abspath(os.path.join(root, relFile))
+                        if absFile in self.excludes:
+                            continue
+                        for pattern in self.patterns:
+                            if fnmatch.fnmatch(relFile, pattern):
+                                self.sources.append(SCons.Script.File(absFile))
+                                break
+            elif os.path.isfile(path):
+                self.sources.append(SCons.Script.File(path))
+
+    def findTargets(self):
+        for item in self.outputs:
+            self.targets.append(SCons.Script.Dir(item))
+
+    def buildConfig(self, target, source, env):
+        outConfigFile = open(target[0].abspath, "w")
+
+        # Need a routine to quote paths that contain spaces
+        # but can not use pipes.quote because it has to be
+        # a double quote for doxygen.conf
+        # Do not quote a string if it is already quoted
+        # Also have a version that quotes each item in a sequence and generates the
+        # final quoted entry.
+        def _quote_path(path):
+            if " " in path and not path.startswith('"') and not path.endswith('"'):
+                return '"{}"'.format(path)
+            return path
+
+        def _quote_paths(pathList):
+            return " ".join(_quote_path(p) for p in pathList)
+
+        docPaths = []
+        incFiles = []
+        for incPath in self.includes:
+            docDir, incFile = os.path.split(incPath)
+            docPaths.append('"%s"' % docDir)
+            incFiles.append('"%s"' % incFile)
+            self.sources.append(SCons.Script.File(incPath))
+        if docPaths:
+            outConfigFile.write('@INCLUDE_PATH = %s\n' % _quote_paths(docPaths))
+        for incFile in incFiles:
+            outConfigFile.write('@INCLUDE = %s\n' % _quote_path(incFile))
+
+        for tagPath in self.useTags:
+            docDir, tagFile = os.path.split(tagPath)
+            htmlDir = os.path.join(docDir, "html")
+            outConfigFile.write('TAGFILES += "%s=%s"\n' % (tagPath, htmlDir))
+            self.sources.append(SCons.Script.Dir(docDir))
+        if self.projectName is not None:
+            outConfigFile.write("PROJECT_NAME = %s\n" % self.projectName)
+        if self.projectNumber is not None:
+            outConfigFile.write("PROJECT_NUMBER = %s\n" % self.projectNumber)
+        outConfigFile.write("INPUT = %s\n" % _quote_paths(self.inputs))
+        outConfigFile.write("EXCLUDE = %s\n" % _quote_paths(self.excludes))
+        outConfigFile.write("FILE_PATTERNS = %s\n" % " ".join(self.patterns))
+        outConfigFile.write("RECURSIVE = YES\n" if self.recursive else "RECURSIVE = NO\n")
+        allOutputs = set(("html", "latex", "man", "rtf", "xml"))
+        for output, path in zip(self.outputs, self.outputPaths):
+            try:
+                allOutputs.remove(output.lower())
+            except Exception:
+                state.log.fail("Unknown Doxygen output format '%s'." % output)
+                state.log.finish()
+            outConfigFile.write("GENERATE_%s = YES\n" % output.upper())
+            outConfigFile.write("%s_OUTPUT = %s\n" % (output.upper(), _quote_path(path.abspath)))
+        for output in allOutputs:
+            outConfigFile.write("GENERATE_%s = NO\n" % output.upper())
+        if self.makeTag is not None:
+            outConfigFile.write("GENERATE_TAGFILE = %s\n" % _quote_path(self.makeTag))
+        #
+        # Append the local overrides (usually doxygen.conf.in)
+        #
+        if len(source) > 0:
+            with open(source[0].abspath, "r") as inConfigFile:
+                outConfigFile.write(inConfigFile.read())
+
+        outConfigFile.close()
@@ -1,4 +1,5 @@
 import os
+import threading
 
 try:
     # Prefer to use native EUPS but if that is not available, fallback
@@ -58,3 +59,98 @@ def getEups():
     except AttributeError:
         getEups._eups = Eups()
         return getEups._eups
+
+
+class SetupProductResolver:
+    """Resolve the version and product directory of setup products in bulk.
+
+    The SETUP_<PRODUCT> and <PRODUCT>_DIR environment variables of every setup product are
+    parsed in a single pass; products not described there are looked up with one query for
+    all setup products in the EUPS database.  Only if that query is unavailable do we fall
+    back to asking EUPS about each product in turn.  Products whose directory is
+    still unknown, including those that aren't setup, are given the one productDir() reports.
+
+    The resolver may be filled in by a background thread (see prefill()); lookups wait for it.
+    """
+
+    def __init__(self):
+        self._products = None
+        self._eupsProducts = None
+        self._lock = threading.RLock()
+
+    def _fromEnvironment(self):
+        products = {}
+        for key, value in os.environ.items():
+            if not key.startswith("SETUP_"):
+                continue
+            words = value.split()
+            if len(words) < 2:
+                continue
+            name, version = words[0], words[1]
+            pdir = os.environ.get("%s_DIR" % name.upper())
+            if pdir is not None:
+                products[name] = (version, pdir)
+        return products
+
+    def _fromEups(self):
+        products = {}
+        try:
+            setupProducts = getEups().getSetupProducts()
+        except Exception:
+            return None
+        for product in setupProducts:
+            products[product.name] = (product.version, product.dir)
+        return products
+
+    def prefill(self):
+        """Run the bulk queries now, so later lookups are answered from memory."""
+        with self._lock:
+            if self._products is None:
+                self._products = self._fromEnvironment()
+            if haveEups() and self._eupsProducts is None:
+                self._eupsProducts = self._fromEups()
+
+    def find(self, eupsProduct):
+        """Return (version, productDir) for eupsProduct; either may be None."""
+        with self._lock:
+            return self._find(eupsProduct)
+
+    def _find(self, eupsProduct):
+        if self._products is None:
+            self._products = self._fromEnvironment()
+        try:
+            return self._products[eupsProduct]
+        except KeyError:
+            pass
+        if haveEups() and self._eupsProducts is None:
+            self._eupsProducts = self._fromEups()
+        if self._eupsProducts is not None:
+            version, pdir = self._eupsProducts.get(eupsProduct, (None, None))
+        else:
+            version, eupsPathDir, pdir, table, flav = getEups().findSetupVersion(eupsProduct)
+        if pdir is None:
+            pdir = productDir(eupsProduct)
+        self._products[eupsProduct] = (version, pdir)
+        return version, pdir
+
+
+_RESOLVER_LOCK = threading.Lock()
+
+
+def _sharedResolver():
+    with _RESOLVER_LOCK:
+        try:
+            return findSetupProduct._resolver
+        except AttributeError:
+            findSetupProduct._resolver = SetupProductResolver()
+            return findSetupProduct._resolver
+
+
+def findSetupProduct(eupsProduct):
+    """Return (version, productDir) for a setup product using a shared SetupProductResolver."""
+    return _sharedResolver().find(eupsProduct)
+
+
+def prefillSetupProducts():
+    """Run the shared SetupProductResolver's bulk queries (used as a startup probe)."""
+    _sharedResolver().prefill()
@@ -12,10 +12,6 @@ import shutil
 import SCons.Script
 from SCons.Script.SConscript import SConsEnvironment
 
-from .vcs import svn
-from .vcs import hg
-from .vcs import git
-
 from . import state
 from .utils import memberOf
 
@@ -59,12 +55,15 @@ def determineVersion(env, versionString):
         # SVN.  Guess the tagname from the last part of the directory
         HeadURL = re.search(r"^[$]HeadURL:\s+(.*)", versionString).group(1)
         HeadURL = os.path.split(HeadURL)[0]
+        from .vcs import svn
         version = svn.guessVersionName(HeadURL)
     elif versionString.lower() in ("hg", "mercurial"):
         # Mercurial (hg).
+        from .vcs import hg
         version = hg.guessVersionName()
     elif versionString.lower() in ("git",):
         # git.
+        from .vcs import git
         version = git.guessVersionName()
     return version.replace("/", "_")
 
@@ -73,9 +72,12 @@ def determineVersion(env, versionString):
 
 # @brief Return a unique fingerprint for a version (e.g. an SHA1); return None if unavailable
 def getFingerprint(versionString):
+    # The version control backends are only imported when needed, to keep startup fast.
     if versionString.lower() in ("hg", "mercurial"):
+        from .vcs import hg
         fingerprint, modified = hg.guessFingerprint()
     elif versionString.lower() in ("git",):
+        from .vcs import git
         fingerprint, modified = git.guessFingerprint()
     else:
         fingerprint, modified = None, False
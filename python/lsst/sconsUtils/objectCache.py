@@ -0,0 +1,272 @@
+##
+#  @file objectCache.py
+#
+#  A content-addressed cache of compiled objects, shared between builds and checkouts
+#  (--objectCache=DIR).
+#
+#  When the cache is enabled, scons runs each compile through this file as a script, a compiler
+#  wrapper in the style of ccache: the source is preprocessed, and the object is copied from the
+#  cache if one was compiled before from the same preprocessed source, with the same command line,
+#  by the same compiler.  Otherwise the compiler is run and its object (and any warnings) stored.
+#  The cache is a CacheStore, so parallel compiles, and builds, can share it; the scons process
+#  trims it to its size limit and reports the wrappers' hits and misses at exit.
+#
+#  The script half of this module, like cacheStore, imports nothing from SCons or the rest of
+#  sconsUtils.
+##
+
+import os
+import re
+import sys
+import json
+import atexit
+import shutil
+import struct
+import hashlib
+import tempfile
+import subprocess
+
+try:
+    from .cacheStore import CacheStore, formatBytes
+except ImportError:  # run as a script
+    from cacheStore import CacheStore, formatBytes
+
+# Environment variables passing the cache's configuration from scons to the wrapper
+DIR_VARIABLE = "SCONSUTILS_OBJECT_CACHE"
+STATS_VARIABLE = "SCONSUTILS_OBJECT_CACHE_STATS"
+COMPILER_VARIABLE = "SCONSUTILS_OBJECT_CACHE_COMPILER"
+
+SOURCE_SUFFIXES = (".c", ".cc", ".cpp", ".cxx", ".c++", ".C")
+# Options that write files other than the object, or whose output depends on more than the
+# preprocessed source
+UNCACHEABLE_OPTIONS = ("-M", "-save-temps", "--coverage", "-fprofile-", "-ftest-coverage",
+                       "-gsplit-dwarf", "-E", "-S", "-###")
+PREFIX_MAP_OPTIONS = ("-ffile-prefix-map=", "-fmacro-prefix-map=", "-fdebug-prefix-map=")
+
+
+##
+#  @brief Analyse a compile command.
+#
+#  @return (output, preprocess), the object file the command writes and the command that writes
+#          the preprocessed source to stdout instead, or None if the command can't be cached
+#          (it isn't a compile of a single source to an object, or has options that write
+#          other files).
+##
+def parseCommand(command):
+    output = None
+    sources = []
+    compiling = False
+    preprocess = command[:1]
+    words = iter(command[1:])
+    for word in words:
+        if word == "-o":
+            output = next(words, None)
+        elif word == "-c":
+            compiling = True
+            preprocess.append("-E")
+        elif word.startswith(UNCACHEABLE_OPTIONS):
+            return None
+        else:
+            if not word.startswith("-") and os.path.splitext(word)[1] in SOURCE_SUFFIXES:
+                sources.append(word)
+            preprocess.append(word)
+    if not compiling or output is None or len(sources) != 1:
+        return None
+    return output, preprocess
+
+
+##
+#  @brief Return the (old, new, sourceToo) prefix maps given by a command's -f*-prefix-map options.
+#
+#  sourceToo is True if the map applies to __FILE__ (and so the preprocessed source) as well as to
+#  the debug information.
+##
+def prefixMaps(command):
+    maps = []
+    for word in command:
+        for option in PREFIX_MAP_OPTIONS:
+            if word.startswith(option) and "=" in word[len(option):]:
+                old, new = word[len(option):].split("=", 1)
+                maps.append((old, new, option != "-fdebug-prefix-map="))
+    return maps
+
+
+# @brief Return text (str or bytes) with the paths starting with the olds of maps replaced by their news.
+def _applyPrefixMaps(text, maps):
+    if not maps:
+        return text
+    if isinstance(text, bytes):
+        return _applyPrefixMaps(text.decode("latin-1"), maps).encode("latin-1")
+    replacements = dict(maps)
+    pattern = "|".join(re.escape(old) for old in sorted(replacements, key=len, reverse=True))
+    return re.sub(r"(%s)(?=[/=\"]|$)" % pattern, lambda match: replacements[match.group(1)], text)
+
+
+##
+#  @brief Return the cache key for a compile command, given its preprocessed source.
+#
+#  The key covers the compiler (its identity as classified by scons, and the size and modification
+#  time of its executable), the command line but for the name of the object, the working
+#  directory (which ends up in the debug information) and the preprocessed source.
+#
+#  Paths are keyed as the command's -f*-prefix-map options map them in the object, so compiles in
+#  different checkouts of a relocatable build (see the "relocatable" build variable) share entries.
+##
+def computeKey(command, preprocessed, compiler=""):
+    executable = shutil.which(command[0])
+    try:
+        st = os.stat(executable) if executable else None
+    except OSError:
+        st = None
+    output = command.index("-o") + 1
+    maps = prefixMaps(command)
+    allMaps = [(old, new) for old, new, sourceToo in maps]
+    identity = [compiler, [st.st_size, st.st_mtime_ns] if st else None,
+                [_applyPrefixMaps(word, allMaps) for word in command[:output] + command[output + 1:]],
+                _applyPrefixMaps(os.getcwd(), allMaps)]
+    hasher = hashlib.sha1(json.dumps(identity).encode())
+    hasher.update(_applyPrefixMaps(preprocessed, [(old, new) for old, new, sourceToo in maps if sourceToo]))
+    return hasher.hexdigest()
+
+
+def _writeAtomically(filename, data):
+    fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmpName, filename)
+    except BaseException:
+        CacheStore._remove(tmpName)
+        raise
+
+
+def _record(outcome, nBytes=0):
+    # One short line per compile, appended with a single write so parallel wrappers don't mix them
+    statsFile = os.environ.get(STATS_VARIABLE)
+    if statsFile:
+        try:
+            fd = os.open(statsFile, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, ("%s %d\n" % (outcome, nBytes)).encode())
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+##
+#  @brief Run a compile command through the cache in $SCONSUTILS_OBJECT_CACHE.
+#
+#  Commands that can't be cached, or whose source doesn't preprocess, are simply run.
+#  @return the exit status of the compile.
+##
+def runCompile(command):
+    directory = os.environ.get(DIR_VARIABLE)
+    parsed = parseCommand(command) if directory else None
+    if parsed is None:
+        _record("uncacheable")
+        return subprocess.call(command)
+    output, preprocess = parsed
+    preprocessed = subprocess.run(preprocess, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if preprocessed.returncode != 0:
+        _record("uncacheable")
+        return subprocess.call(command)  # leave reporting the errors to the compiler
+
+    store = CacheStore(directory)
+    key = computeKey(command, preprocessed.stdout, os.environ.get(COMPILER_VARIABLE, ""))
+    data = store.get(key)
+    if data is not None and len(data) >= 4:
+        nStderr, = struct.unpack(">I", data[:4])
+        _writeAtomically(output, data[4 + nStderr:])
+        sys.stderr.buffer.write(data[4:4 + nStderr])  # replay the compiler's warnings
+        _record("hit", len(data) - 4 - nStderr)
+        return 0
+
+    result = subprocess.run(command, stderr=subprocess.PIPE)
+    sys.stderr.buffer.write(result.stderr)
+    if result.returncode == 0:
+        try:
+            with open(output, "rb") as f:
+                data = f.read()
+            store.put(key, struct.pack(">I", len(result.stderr)) + result.stderr + data)
+        except OSError as e:
+            print("Unable to write to object cache %s: %s" % (directory, e), file=sys.stderr)
+    _record("miss")
+    return result.returncode
+
+
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+##
+#  @brief Convert a size such as "500M" or "5G" (or a number of bytes) to bytes.
+#
+#  @throw ValueError if the size can't be parsed.
+##
+def parseSize(size):
+    size = str(size).strip()
+    multiplier = 1
+    for power, unit in enumerate("kMGT", 1):
+        if size[-1:].upper() == unit.upper():
+            size, multiplier = size[:-1], 1024**power
+            break
+    return int(float(size)*multiplier)
+
+
+##
+#  @brief Run the compiles of env (C and C++, shared and static) through the object cache.
+#
+#  Called by state._configureCommon when --objectCache is given; the wrapper is excluded from the
+#  commands' signatures, so turning the cache on or off doesn't rebuild anything.
+##
+def setup(env):
+    from . import state
+    directory = os.path.abspath(os.path.expanduser(env.GetOption("objectCache")))
+    try:
+        maxBytes = parseSize(env.GetOption("objectCacheSize"))
+    except ValueError:
+        state.log.fail("Invalid --objectCacheSize %r; expected e.g. 500M or 5G"
+                       % env.GetOption("objectCacheSize"))
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        state.log.fail("Unable to create object cache %s: %s" % (directory, e))
+    fd, statsFile = tempfile.mkstemp(prefix="sconsUtils-objectCache-", suffix=".stats")
+    os.close(fd)
+    env["ENV"][DIR_VARIABLE] = directory
+    env["ENV"][STATS_VARIABLE] = statsFile
+    env["ENV"][COMPILER_VARIABLE] = "%s %s" % (env.whichCc, getattr(env, "ccVersion", "unknown"))
+    env["OBJECTCACHEWRAPPER"] = [sys.executable, os.path.abspath(__file__)]
+    for command in ("CCCOM", "SHCCCOM", "CXXCOM", "SHCXXCOM"):
+        env[command] = "$( $OBJECTCACHEWRAPPER $) " + env[command]
+    atexit.register(_finish, directory, maxBytes, statsFile)
+
+
+def _finish(directory, maxBytes, statsFile):
+    from . import state
+    counts = {"hit": 0, "miss": 0, "uncacheable": 0}
+    bytesSaved = 0
+    try:
+        with open(statsFile) as f:
+            for line in f:
+                outcome, nBytes = line.split()
+                counts[outcome] = counts.get(outcome, 0) + 1
+                bytesSaved += int(nBytes)
+        os.unlink(statsFile)
+    except (OSError, ValueError):
+        pass
+    store = CacheStore(directory, maxBytes=maxBytes)
+    evicted = store.evict() if counts["miss"] else 0
+    lookups = counts["hit"] + counts["miss"]
+    if lookups or counts["uncacheable"]:
+        state.log.report("Object cache %s: %d hits, %d misses (%.0f%% hit rate), %d not cacheable; "
+                         "%s of objects reused%s" % (
+                             directory, counts["hit"], counts["miss"],
+                             100.0*counts["hit"]/lookups if lookups else 0.0, counts["uncacheable"],
+                             formatBytes(bytesSaved), ", %d entries evicted" % evicted if evicted else ""))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: %s COMPILER [ARGS...]" % sys.argv[0], file=sys.stderr)
+        sys.exit(2)
+    sys.exit(runCompile(sys.argv[1:]))
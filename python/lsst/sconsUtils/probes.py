@@ -0,0 +1,146 @@
+##
+#  @file probes.py
+#
+#  Startup probes: slow, independent queries (version control state, EUPS products, compiler
+#  identity, the python on the PATH) that are started together in a thread pool at the beginning of
+#  BasicSConstruct.initialize, so that their subprocesses and I/O overlap rather than running one
+#  after another.
+#
+#  Consumers don't need to know whether a probe was started: result() waits for a running probe and
+#  otherwise computes the answer on the spot.
+##
+
+import os
+import atexit
+import threading
+import concurrent.futures
+
+from . import state
+from . import utils
+
+MAX_WORKERS = 4
+
+_executor = None
+_futures = {}
+_messages = []
+_lock = threading.Lock()
+
+
+class _Skipped(Exception):
+    """Raised by a probe that could not run where it was started (the directory changed)."""
+    pass
+
+
+def _run(name, cwd, func, args):
+    # SConscript files are run from their own directory; a probe that depends on the working
+    # directory must not answer for the wrong one, so leave it to the consumer instead.
+    if os.getcwd() != cwd:
+        raise _Skipped()
+    with state.log.capture() as messages:
+        try:
+            with state.timings.phase(name, category="probe"):
+                return func(*args)
+        finally:
+            with _lock:
+                _messages.extend(messages)
+
+
+# @brief Print the messages logged by probes so far (they are held back while the probes run).
+def flushLog():
+    with _lock:
+        messages = _messages[:]
+        del _messages[:]
+    state.log.replay(messages)
+
+
+##
+#  @brief Start running func(*args) in the background as the probe called name.
+#
+#  Does nothing if a probe of that name has already been started.
+##
+def submit(name, func, *args):
+    global _executor
+    with _lock:
+        if name not in _futures:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(MAX_WORKERS,
+                                                                  thread_name_prefix="sconsUtils-probe")
+            _futures[name] = _executor.submit(_run, name, os.getcwd(), func, args)
+        return _futures[name]
+
+
+# @brief Return True if the probe called name has been started.
+def started(name):
+    return name in _futures
+
+
+##
+#  @brief Return the result of the probe called name, waiting for it if necessary.
+#
+#  If the probe was never started (or could not run), func(*args) is called instead; exceptions
+#  raised by the probe are raised here.
+##
+def result(name, func, *args):
+    future = _futures.get(name)
+    if future is not None:
+        try:
+            return future.result()
+        except _Skipped:
+            pass
+    return func(*args)
+
+
+def _ignoreErrors(func, *args):
+    # Probes that only warm caches leave reporting errors to whoever uses the answer
+    try:
+        func(*args)
+    except Exception as e:
+        state.log.info("Startup probe %s failed: %s" % (func.__name__, e))
+
+
+def _probeGit():
+    from .vcs import git
+    git.headSha()
+    # guessVersionName only describes a clean tree
+    if not git.isModified():
+        git.describe()
+
+
+def _probeHg():
+    from .vcs import hg
+    hg.identify()
+
+
+##
+#  @brief Start the probes whose answers BasicSConstruct.initialize is going to need.
+#
+#  @param versionString  As passed to BasicSConstruct.initialize; decides which version control
+#                        system is queried.
+#  @param disableCc      If True, the compiler is not probed.
+##
+def start(versionString=None, disableCc=False):
+    env = state.env
+    atexit.register(flushLog)
+    building = not (env.GetOption("clean") or env.GetOption("help") or env.GetOption("no_exec"))
+
+    # setPrefix defaults to git; VersionModule looks for the repository's metadata
+    if versionString is None:
+        systems = {"git"} | {n for n in ("hg", "svn") if os.path.isdir(".%s" % n)}
+    else:
+        systems = {versionString.lower()}
+    if "git" in systems and os.path.exists(".git"):
+        submit("git", _ignoreErrors, _probeGit)
+    if systems & {"hg", "mercurial"} and os.path.exists(".hg"):
+        submit("hg", _ignoreErrors, _probeHg)
+
+    if not env['no_eups']:
+        from . import eupsForScons
+        submit("eups", _ignoreErrors, eupsForScons.prefillSetupProducts)
+
+    if building and os.path.exists(os.path.join("bin.src", "SConscript")):
+        submit("whichPython", utils.findPython)
+
+    if building and not disableCc:
+        state._selectCompilers()
+        if state._loadToolchainProbe(state._toolchainProbeKey()) is None:
+            submit("ccVersion", state._runCcVersion, env.subst("$CC --version"), dict(env["ENV"]))
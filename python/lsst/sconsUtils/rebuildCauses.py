@@ -0,0 +1,175 @@
+##
+#  @file rebuildCauses.py
+#
+#  Why targets were rebuilt (--why-rebuilt).
+##
+
+import atexit
+import threading
+import collections
+
+import SCons.Node
+import SCons.Node.Python
+import SCons.Util
+
+from . import state
+
+
+##
+#  @brief Records why SCons decided to rebuild each target, and summarizes it at exit.
+#
+#  Enabled by the --why-rebuilt option.  Node.changed, which SCons asks whether a target is out of
+#  date with respect to the information stored when it was last built, is wrapped; when it says
+#  yes, the decider is asked again about each of the target's dependencies to find out which
+#  changed.  The causes are:
+#   - "command line":          the build action (its flags, usually) changed
+#   - "sources":               the content of a source changed
+#   - "explicit dependencies": the content of a Depends() dependency changed
+#   - "implicit dependencies": the content of a scanned dependency (a header, a library) changed
+#   - "dependency list":       dependencies were added or removed
+#   - "no build record":       the target exists, but SCons has no record of building it
+#   - "target missing":        the target didn't exist (it was never built, or removed)
+#   - "AlwaysBuild":           the target is always rebuilt
+#  "AlwaysBuild", and "target missing" when Node.changed isn't consulted, are assigned as the
+#  targets are built.
+#
+#  At exit the rebuilt targets are counted by cause and by the state.targets category ("lib",
+#  "tests", ...) that they were built for, and the inputs that triggered most rebuilds are listed.
+##
+class RebuildCauses:
+
+    TOP_INPUTS = 10
+    # Targets built for several categories are counted in the first of these
+    CATEGORY_ORDER = ("version", "include", "lib", "python", "shebang", "examples", "tests", "doc")
+
+    def __init__(self):
+        self.causes = {}
+        self.built = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        changed = SCons.Node.Node.changed
+        build = SCons.Node.Node.build
+
+        def recordingChanged(node, *args, **kwds):
+            result = changed(node, *args, **kwds)
+            if result and node.has_builder() and node not in self.causes:
+                storedNode = kwds.get("node", args[0] if args else None)
+                try:
+                    causes = self._analyze(node, storedNode)
+                except Exception as e:  # never let the report break the build
+                    causes = (["unknown (%s)" % e], [])
+                self._record(node, causes)
+            return result
+
+        def recordingBuild(node, **kwds):
+            try:
+                targets = node.get_executor().get_all_targets()
+            except Exception:
+                targets = [node]
+            with self._lock:
+                for target in targets:
+                    self.built.append(target)
+                    if target not in self.causes:
+                        self.causes[target] = (["AlwaysBuild" if target.always_build else "target missing"],
+                                               [])
+            return build(node, **kwds)
+
+        SCons.Node.Node.changed = recordingChanged
+        SCons.Node.Node.build = recordingBuild
+        atexit.register(self._finish)
+
+    def _record(self, node, causes):
+        with self._lock:
+            self.causes.setdefault(node, causes)
+
+    ##
+    #  @brief Return (causes, inputs): why node is out of date, and the dependencies that changed.
+    #
+    #  This repeats the checks of SCons.Node.Node.changed, keeping the details.
+    ##
+    @staticmethod
+    def _analyze(node, storedNode=None):
+        if storedNode is None:
+            storedNode = node
+        if not node.exists():
+            return ["target missing"], []
+        binfo = storedNode.get_stored_info().binfo
+        if getattr(binfo, "bactsig", None) is None:
+            return ["no build record"], []
+        causes = []
+        inputs = []
+        then = binfo.bsourcesigs + binfo.bdependsigs + binfo.bimplicitsigs
+        children = node.children()
+        if len(children) != len(then):
+            causes.append("dependency list")
+        sources = set(node.sources)
+        depends = set(node.depends)
+        for child, previous in zip(children, then):
+            if SCons.Node._decider_map[child.changed_since_last_build](child, node, previous, storedNode):
+                inputs.append(child)
+                if child in sources:
+                    cause = "sources"
+                elif child in depends:
+                    cause = "explicit dependencies"
+                else:
+                    cause = "implicit dependencies"
+                if cause not in causes:
+                    causes.append(cause)
+        if SCons.Util.hash_signature(node.get_executor().get_contents()) != binfo.bactsig:
+            causes.insert(0, "command line")
+        return causes, inputs
+
+    # @brief Return a dict mapping the built nodes to the state.targets category they were built for.
+    @classmethod
+    def targetCategories(cls):
+        categories = {}
+        order = [c for c in cls.CATEGORY_ORDER if c in state.targets]
+        for category in order + [c for c in state.targets if c not in order]:
+            stack = list(SCons.Util.flatten(state.targets[category]))
+            seen = set()
+            while stack:
+                node = stack.pop()
+                if node in seen:
+                    continue
+                seen.add(node)
+                if node.has_builder():
+                    categories.setdefault(node, category)
+                stack.extend(node.children(scan=False))
+        return categories
+
+    @staticmethod
+    def _describe(node):
+        if isinstance(node, SCons.Node.Python.Value):
+            value = str(node.read()).strip().splitlines()
+            return "Value(%s%s)" % (value[0][:40] if value else "", "..." if len(value) > 1 else "")
+        return str(node)
+
+    # @brief Return the lines of the report.
+    def summary(self):
+        with self._lock:
+            built = list(dict.fromkeys(self.built))
+            causes = dict(self.causes)
+        if not built:
+            return ["Why rebuilt: nothing was rebuilt"]
+        categories = self.targetCategories()
+        byCause = collections.OrderedDict()
+        byInput = collections.Counter()
+        for node in built:
+            nodeCauses, inputs = causes.get(node, (["unknown"], []))
+            for cause in nodeCauses:
+                byCause.setdefault(cause, collections.Counter())[categories.get(node, "other")] += 1
+            byInput.update(self._describe(child) for child in inputs)
+        lines = ["Why rebuilt: %d targets" % len(built)]
+        for cause, counts in sorted(byCause.items(), key=lambda item: -sum(item[1].values())):
+            lines.append("  %-22s %5d  (%s)" % (cause, sum(counts.values()),
+                                                ", ".join("%s %d" % item for item in counts.most_common())))
+        if byInput:
+            lines.append("  top triggering inputs:")
+            for name, count in byInput.most_common(self.TOP_INPUTS):
+                lines.append("    %5d  %s" % (count, name))
+        return lines
+
+    def _finish(self):
+        for line in self.summary():
+            state.log.report(line)
@@ -9,11 +9,12 @@
 import os.path
 import re
 import pipes
+import shutil
 from stat import ST_MODE
 from SCons.Script import SConscript, File, Dir, Glob, BUILD_TARGETS
-from distutils.spawn import find_executable
 
 from . import dependencies
+from . import probes
 from . import state
 from . import tests
 from . import utils
@@ -102,17 +103,22 @@ class BasicSConstruct:
     def initialize(cls, packageName, versionString=None, eupsProduct=None, eupsProductPath=None,
                    cleanExt=None, versionModuleName="python/lsst/%s/version.py", noCfgFile=False,
                    sconscriptOrder=None, disableCc=False):
+        # start the slow, independent queries for version control, EUPS and the compiler now,
+        # so they run concurrently; whoever needs an answer waits for it
+        probes.start(versionString, disableCc)
         if not disableCc:
-            state._configureCommon()
-            state._saveState()
+            with state.timings.phase("_configureCommon"):
+                state._configureCommon()
+                state._saveState()
         if cls._initializing:
             state.log.fail("Recursion detected; an SConscript file should not call BasicSConstruct.")
         cls._initializing = True
-        dependencies.configure(packageName, versionString, eupsProduct, eupsProductPath, noCfgFile)
+        with state.timings.phase("dependencies.configure"):
+            dependencies.configure(packageName, versionString, eupsProduct, eupsProductPath, noCfgFile)
         state.env.BuildETags()
         if cleanExt is None:
             cleanExt = r"*~ core core.[1-9]* *.so *.os *.o *.pyc *.pkgc"
-        state.env.CleanTree(cleanExt, ".cache __pycache__ .pytest_cache")
+        state.env.CleanTree(cleanExt, ".cache __pycache__ .pytest_cache .unity .pch")
         if versionModuleName is not None:
             try:
                 versionModuleName = versionModuleName % "/".join(packageName.split("_"))
@@ -140,9 +146,12 @@ class BasicSConstruct:
                     return i
             return len(sconscriptOrder)
         scripts.sort(key=key)
-        for script in scripts:
-            state.log.info("Using SConscript at %s" % script)
-            SConscript(script)
+        probes.flushLog()
+        with state.timings.phase("SConscripts"):
+            for script in scripts:
+                state.log.info("Using SConscript at %s" % script)
+                with state.timings.phase(script, category="SConscript"):
+                    SConscript(script)
         cls._initializing = False
         return state.env
 
@@ -166,6 +175,11 @@ class BasicSConstruct:
     @staticmethod
     def finish(defaultTargets=DEFAULT_TARGETS,
                subDirList=None, ignoreRegex=None):
+        with state.timings.phase("finish"):
+            BasicSConstruct._finish(defaultTargets, subDirList, ignoreRegex)
+
+    @staticmethod
+    def _finish(defaultTargets, subDirList, ignoreRegex):
         if ignoreRegex is None:
             ignoreRegex = r"(~$|\.pyc$|^\.svn$|\.o|\.os$)"
         if subDirList is None:
@@ -247,16 +261,25 @@ class BasicSConscript:
     #  @param libs        Libraries to link against, either as a string argument to be passed to
     #                     env.getLibs() or a sequence of actual libraries to pass in.
     #  @param noBuildList List of source files to exclude from building.
+    #  @param unity       Compile the sources in batches of this many files (defaults to the "unity"
+    #                     build variable; 0 compiles them one at a time).  See env.UnityBatches.
+    #  @param unityExclude List of source files to compile alone in a unity build; files listed in
+    #                     optFiles or noOptFiles, or with flags in ups/compileFlags.ini, always are.
+    #  @param pch         A header to precompile and use for all the sources: a File, or the name
+    #                     (or a list of names) of headers on the include path.  See
+    #                     env.PrecompiledHeader.
     ##
     @staticmethod
-    def lib(libName=None, src=None, libs="self", noBuildList=None):
+    def lib(libName=None, src=None, libs="self", noBuildList=None, unity=None, unityExclude=None,
+            pch=None):
         if libName is None:
             libName = state.env["packageName"]
         if src is None:
             src = Glob("#src/*.cc") + Glob("#src/*/*.cc") + Glob("#src/*/*/*.cc") + Glob("#src/*/*/*/*.cc")
         if noBuildList is not None:
             src = [node for node in src if os.path.basename(str(node)) not in noBuildList]
-        src = state.env.SourcesForSharedLibrary(src)
+        src = state.env.SourcesForSharedLibrary(src, unity=unity, unityExclude=unityExclude or (),
+                                                unityDir="#.unity/%s" % libName, pch=pch)
         if isinstance(libs, str):
             libs = state.env.getLibs(libs)
         elif libs is None:
@@ -344,9 +367,10 @@ class BasicSConscript:
     #                  if ``src`` is defaulted.
     #  @param libs     Libraries to link against, either as a string argument to be passed to
     #                  env.getLibs() or a sequence of actual libraries to pass in.
+    #  @param pch      A header to precompile and use for all the sources (see lib()).
     ##
     @staticmethod
-    def python(module=None, src=None, extra=(), libs="main python"):
+    def python(module=None, src=None, extra=(), libs="main python", pch=None):
         if module is None:
             module = "_" + state.env["packageName"].split("_")[-1]
         if src is None:
@@ -356,7 +380,7 @@ class BasicSConscript:
             libs = state.env.getLibs(libs)
         elif libs is None:
             libs = []
-        result = state.env.Pybind11LoadableModule(module, src, LIBS=libs)
+        result = state.env.Pybind11LoadableModule(module, src, LIBS=libs, pch=pch)
         state.targets["python"].append(result)
         return result
 
@@ -418,7 +442,7 @@ class BasicSConscript:
     ##
     @staticmethod
     def doc(config="doxygen.conf.in", projectName=None, projectNumber=None, **kw):
-        if not find_executable("doxygen"):
+        if not shutil.which("doxygen"):
             state.log.warn("doxygen executable not found; skipping documentation build.")
             return []
         if projectName is None:
@@ -468,11 +492,12 @@ class BasicSConscript:
     #  @param nobuildList      List of tests that should not even be built.
     #  @param args             A dictionary of program arguments for tests, passed directly
     #                          to tests.Control.
+    #  @param pch              A header to precompile and use for the C++ tests (see lib()).
     ##
     @staticmethod
     def tests(pyList=None, ccList=None, swigNameList=None, swigSrc=None,
               ignoreList=None, noBuildList=None, pySingles=None,
-              args=None):
+              args=None, pch=None):
         if noBuildList is None:
             noBuildList = []
         if pySingles is None:
@@ -515,8 +540,11 @@ class BasicSConscript:
         state.log.info("Files that will not be built: %s" % noBuildList)
         state.log.info("Ignored tests: %s" % ignoreList)
         control = tests.Control(state.env, ignoreList=ignoreList, args=args, verbose=True)
+        overrides, pchNodes = state.env.UsePrecompiledHeader(pch, shared=False,
+                                                             LIBS=state.env.getLibs("main test"))
         for ccTest in ccList:
-            state.env.Program(ccTest, LIBS=state.env.getLibs("main test"))
+            prog = state.env.Program(ccTest, **overrides)
+            state.env.Depends(prog[0].sources, pchNodes)
         swigMods = []
         for name, src in swigSrc.items():
             swigMods.extend(
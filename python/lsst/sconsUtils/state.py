@@ -8,12 +8,13 @@
 # these variables are aliased to the main lsst.sconsUtils scope, so there should be no
 # need for users to deal with the state module directly.
 #
-# These are all initialized when the module is imported, but may be modified by other code
-# (particularly dependencies.configure()).
+# These are all initialized when the module is imported, except for state.env, which is created
+# when it is first used; all may be modified by other code (particularly dependencies.configure()).
 ##
 
 import os
 import re
+import threading
 
 import SCons.Script
 import SCons.Conftest
@@ -40,9 +41,10 @@ targets = {"doc": [], "tests": [], "lib": [], "python": [], "examples": [], "inc
 
 # @cond INTERNAL
 
-env = None
 log = None
 opts = None
+timings = None
+trace = None
 
 
 def _initOptions():
@@ -67,6 +69,30 @@ def _initOptions():
                            help="Print full exception tracebacks when errors occur.")
     SCons.Script.AddOption('--no-eups', dest='no_eups', action='store_true', default=False,
                            help="Do not use EUPS for configuration")
+    SCons.Script.AddOption('--conftest-cache', dest='conftestCache', action='store_true', default=False,
+                           help="Share the results of custom configuration tests between packages "
+                           "in a per-user cache")
+    SCons.Script.AddOption('--conftest-stats', dest='conftestStats', action='store_true', default=False,
+                           help="Report shared configuration test cache hits and misses at exit")
+    SCons.Script.AddOption('--sconsUtils-timings', dest='sconsUtilsTimings', action='store_true',
+                           default=False,
+                           help="Record the time taken by each phase of sconsUtils startup in "
+                           ".sconf_temp/timings.json and print a summary at exit")
+    SCons.Script.AddOption('--build-trace', dest='buildTrace', action='store', default=None,
+                           metavar="FILE",
+                           help="Write a trace of sconsUtils startup and of every action run, with its "
+                           "CPU time and peak memory, to FILE in Chrome's trace-event format")
+    SCons.Script.AddOption('--why-rebuilt', dest='whyRebuilt', action='store_true', default=False,
+                           help="Report why targets were rebuilt (what changed, for which kinds of "
+                           "target) at exit")
+    SCons.Script.AddOption('--objectCache', dest='objectCache', action='store', default=None,
+                           metavar="DIR",
+                           help="Reuse compiled objects from, and add them to, a cache in DIR that may be "
+                           "shared between builds")
+    SCons.Script.AddOption('--objectCacheSize', dest='objectCacheSize', action='store',
+                           default="5G", metavar="SIZE",
+                           help="Trim the --objectCache to SIZE (e.g. 500M) at exit, discarding the "
+                           "least recently used objects")
 
 
 def _initLog():
@@ -75,6 +101,12 @@ def _initLog():
     log = utils.Log()
 
 
+def _initTimings():
+    from . import timing
+    global timings
+    timings = timing.Timings()
+
+
 def _initVariables():
     files = []
     if "optfile" in SCons.Script.ARGUMENTS:
@@ -105,6 +137,10 @@ def _initVariables():
         ('baseversion', 'Specify the current base version', None),
         ('optFiles', "Specify a list of files that SHOULD be optimized", None),
         ('noOptFiles', "Specify a list of files that should NOT be optimized", None),
+        ('unity', "Compile library sources in batches of this many files (0 to compile them one "
+         "at a time)", 0),
+        SCons.Script.BoolVariable('relocatable', "Keep the paths of the package and its dependencies out of "
+                                  "compiled objects, so caches can share them between checkouts", False),
         ('macosx_deployment_target', 'Deployment target for Mac OS X', '10.9'),
     )
 
@@ -143,7 +179,6 @@ def _initEnvironment():
         if m.group("extra"):
             cfgPath.append(os.environ[k])
         else:
-            cfgPath.append(os.path.join(os.environ[k], "ups"))
             p = m.group("name")
             varname = eupsForScons.utils.setupEnvNameFor(p)
             if varname in os.environ:
@@ -156,10 +191,8 @@ def _initEnvironment():
     cfgPath.append(os.path.join(SCons.Script.Dir('#').abspath, 'ups'))
 
     # Recursively walk LSST_CFG_PATH
-    for root in os.environ.get("LSST_CFG_PATH", "").split(":"):
-        for base, dirs, files in os.walk(root):
-            dirs = [d for d in dirs if not d.startswith(".")]
-            cfgPath.insert(0, base)
+    for base in _walkConfigPath(os.environ.get("LSST_CFG_PATH", "").split(":")):
+        cfgPath.insert(0, base)
     #
     # Add any values marked as export=FOO=XXX[,GOO=YYY] to ourEnv
     #
@@ -281,6 +314,143 @@ def _initEnvironment():
     # We need a binary name, not just "Posix"
     #
     env['eupsFlavor'] = eupsForScons.flavor()
+    #
+    # Measure the commands run, for --build-trace
+    #
+    if trace is not None:
+        trace.setup(env)
+
+
+_CFG_WALK_CACHE_FILE = "cfgPathWalk.json"
+
+
+def _walkConfigRoot(root):
+    """Walk the directory tree under root, skipping hidden and version-control directories.
+
+    Returns a list of [directory, mtime] pairs in walk order.  A root that doesn't exist is
+    recorded as [root, None], so that the walk is redone once it is created.
+    """
+    if not os.path.isdir(root):
+        return [[root, None]]
+    result = []
+    for base, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "CVS")
+        try:
+            result.append([base, os.stat(base).st_mtime_ns])
+        except OSError:
+            continue
+    return result
+
+
+def _isConfigWalkCurrent(walk):
+    """Return True if no directory recorded by _walkConfigRoot has been created, removed or
+    modified since."""
+    if not walk:
+        return False
+    for base, mtime in walk:
+        try:
+            if os.stat(base).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            if mtime is not None:
+                return False
+    return True
+
+
+def _walkConfigPath(roots):
+    """Return all directories under the given LSST_CFG_PATH roots.
+
+    The walk of each root is cached per-user and reused for as long as none of the
+    directories in it have changed; adding or removing a subdirectory changes the mtime
+    of its parent, so revalidation costs one stat per directory rather than a full walk.
+    """
+    from . import utils
+
+    try:
+        cacheFile = os.path.join(utils.userCacheDir(), _CFG_WALK_CACHE_FILE)
+    except OSError:
+        cacheFile = None  # no usable cache directory; walk every root
+    cache = utils.readJsonCache(cacheFile, {}) if cacheFile else {}
+    modified = False
+    result = []
+    for root in roots:
+        if not root:
+            continue
+        key = os.path.abspath(root)
+        walk = cache.get(key)
+        if walk is None or not _isConfigWalkCurrent(walk):
+            walk = _walkConfigRoot(root)
+            cache[key] = walk
+            modified = True
+        result.extend(base for base, mtime in walk if mtime is not None)
+    if modified and cacheFile:
+        utils.writeJsonCache(cacheFile, cache)
+    return result
+
+
+_compilersSelected = False
+
+
+def _selectCompilers():
+    """Set CC and CXX from the "cc" build variable, unless they were set explicitly.
+
+    Only the first call does anything, so probes.start and _configureCommon can both call it.
+    """
+    global _compilersSelected
+    if _compilersSelected:
+        return
+    _compilersSelected = True
+    if env['cc'] != '':
+        CC = CXX = None
+        if re.search(r"^gcc(-\d+(\.\d+)*)?( |$)", env['cc']):
+            CC = env['cc']
+            CXX = re.sub(r"^gcc", "g++", CC)
+        elif re.search(r"^icc( |$)", env['cc']):
+            CC = env['cc']
+            CXX = re.sub(r"^icc", "icpc", CC)
+        elif re.search(r"^clang( |$)", env['cc']):
+            CC = env['cc']
+            CXX = re.sub(r"^clang", "clang++", CC)
+        elif re.search(r"^cc( |$)", env['cc']):
+            CC = env['cc']
+            CXX = re.sub(r"^cc", "c++", CC)
+        else:
+            log.fail("Unrecognised compiler:%s" % env['cc'])
+        env0 = SCons.Script.Environment()
+        if CC and env['CC'] == env0['CC']:
+            env['CC'] = CC
+        if CC and env['CXX'] == env0['CXX']:
+            env['CXX'] = CXX
+
+
+def _classifyCc(ccVersDump):
+    """Identify a compiler from the output of its --version option
+
+    @return (compiler, version) as a pair of strings, or ("unknown", "unknown") if unknown
+    """
+    versionNameList = (
+        (r"gcc(?:\-.+)? +\(.+\) +([0-9.a-zA-Z]+)", "gcc"),
+        (r"\(GCC\) +([0-9.a-zA-Z]+) ", "gcc"),
+        (r"LLVM +version +([0-9.a-zA-Z]+) ", "clang"),  # clang on Mac
+        (r"clang +version +([0-9.a-zA-Z]+) ", "clang"),  # clang on linux
+        (r"\(ICC\) +([0-9.a-zA-Z]+) ", "icc"),
+        (r"cc \(Ubuntu +([0-9\~\-.a-zA-Z]+)\)", "gcc"),  # gcc on Ubuntu (not always caught by #2 above)
+    )
+    for reStr, compilerName in versionNameList:
+        match = re.search(reStr, ccVersDump)
+        if match:
+            return (compilerName, match.groups()[0])
+    return ("unknown", "unknown")
+
+
+def _runCcVersion(command, environ):
+    """Run a compiler's --version command (e.g. in a startup probe), returning (ok, output)."""
+    from . import utils
+    try:
+        return (True, utils.runExternal(command, fatal=True, env=environ,
+                                        pure=env.GetOption("config") != "force"))
+    except RuntimeError:
+        return (False, "")
 
 
 _configured = False
@@ -301,65 +471,47 @@ def _configureCommon():
 
         @return (compiler, version) as a pair of strings, or ("unknown", "unknown") if unknown
         """
-        versionNameList = (
-            (r"gcc(?:\-.+)? +\(.+\) +([0-9.a-zA-Z]+)", "gcc"),
-            (r"\(GCC\) +([0-9.a-zA-Z]+) ", "gcc"),
-            (r"LLVM +version +([0-9.a-zA-Z]+) ", "clang"),  # clang on Mac
-            (r"clang +version +([0-9.a-zA-Z]+) ", "clang"),  # clang on linux
-            (r"\(ICC\) +([0-9.a-zA-Z]+) ", "icc"),
-            (r"cc \(Ubuntu +([0-9\~\-.a-zA-Z]+)\)", "gcc"),  # gcc on Ubuntu (not always caught by #2 above)
-        )
-
         context.Message("Checking who built the CC compiler...")
-        result = context.TryAction(SCons.Script.Action(r"$CC --version > $TARGET"))
-        ccVersDumpOK, ccVersDump = result[0:2]
-        if ccVersDumpOK:
-            for reStr, compilerName in versionNameList:
-                match = re.search(reStr, ccVersDump)
-                if match:
-                    compilerVersion = match.groups()[0]
-                    context.Result("%s=%s" % (compilerName, compilerVersion))
-                    return (compilerName, compilerVersion)
-        context.Result("unknown")
-        return ("unknown", "unknown")
+        if probes.started("ccVersion"):
+            context.sconf.cached = 0  # nothing was built, so don't report a stale "(cached)"
+            ccVersDumpOK, ccVersDump = probes.result("ccVersion", _runCcVersion,
+                                                     env.subst("$CC --version"), dict(env["ENV"]))
+        else:
+            result = context.TryAction(SCons.Script.Action(r"$CC --version > $TARGET"))
+            ccVersDumpOK, ccVersDump = result[0:2]
+        compilerName, compilerVersion = _classifyCc(ccVersDump) if ccVersDumpOK else ("unknown", "unknown")
+        if compilerName == "unknown":
+            context.Result("unknown")
+        else:
+            context.Result("%s=%s" % (compilerName, compilerVersion))
+        return (compilerName, compilerVersion)
 
+    from . import probes
+    probe = None
     if env.GetOption("clean") or env.GetOption("no_exec") or env.GetOption("help"):
         env.whichCc = "unknown"         # who cares? We're cleaning/not execing, not building
     else:
-        if env['cc'] != '':
-            CC = CXX = None
-            if re.search(r"^gcc(-\d+(\.\d+)*)?( |$)", env['cc']):
-                CC = env['cc']
-                CXX = re.sub(r"^gcc", "g++", CC)
-            elif re.search(r"^icc( |$)", env['cc']):
-                CC = env['cc']
-                CXX = re.sub(r"^icc", "icpc", CC)
-            elif re.search(r"^clang( |$)", env['cc']):
-                CC = env['cc']
-                CXX = re.sub(r"^clang", "clang++", CC)
-            elif re.search(r"^cc( |$)", env['cc']):
-                CC = env['cc']
-                CXX = re.sub(r"^cc", "c++", CC)
-            else:
-                log.fail("Unrecognised compiler:%s" % env['cc'])
-            env0 = SCons.Script.Environment()
-            if CC and env['CC'] == env0['CC']:
-                env['CC'] = CC
-            if CC and env['CXX'] == env0['CXX']:
-                env['CXX'] = CXX
-        conf = env.Configure(custom_tests={'ClassifyCc': ClassifyCc})
-        env.whichCc, env.ccVersion = conf.ClassifyCc()
-
-        # If we have picked up a default compiler called gcc that is really
-        # clang, we call it clang to avoid confusion (gcc on macOS has subtly
-        # different options)
-        if not env['cc'] and env.whichCc == "clang" and env['CC'] == "gcc":
-            env['CC'] = "clang"
-            env['CXX'] = "clang++"
+        _selectCompilers()
+        probeKey = _toolchainProbeKey()
+        probe = _loadToolchainProbe(probeKey)
+        if probe is not None:
+            env.whichCc, env.ccVersion = probe["whichCc"], probe["ccVersion"]
+            env['CC'], env['CXX'] = probe["CC"], probe["CXX"]
+        else:
+            conf = env.Configure(custom_tests={'ClassifyCc': ClassifyCc})
+            env.whichCc, env.ccVersion = conf.ClassifyCc()
+            conf.Finish()
+
+            # If we have picked up a default compiler called gcc that is really
+            # clang, we call it clang to avoid confusion (gcc on macOS has subtly
+            # different options)
+            if not env['cc'] and env.whichCc == "clang" and env['CC'] == "gcc":
+                env['CC'] = "clang"
+                env['CXX'] = "clang++"
 
         if not env.GetOption("no_progress"):
-            log.info("CC is %s version %s" % (env.whichCc, env.ccVersion))
-        conf.Finish()
+            log.info("CC is %s version %s%s" % (env.whichCc, env.ccVersion,
+                                                " (cached)" if probe is not None else ""))
     #
     # Compiler flags, including CCFLAGS for C and C++ and CXXFLAGS for C++ only
     #
@@ -379,20 +531,37 @@ def _configureCommon():
     # Enable C++14 support (and C99 support for gcc)
     #
     if not (env.GetOption("clean") or env.GetOption("help") or env.GetOption("no_exec")):
-        if not env.GetOption("no_progress"):
-            log.info("Checking for C++14 support")
-        conf = env.Configure()
-        for cpp14Arg in ("-std=%s" % (val,) for val in ("c++14",)):
-            conf.env = env.Clone()
-            conf.env.Append(CXXFLAGS=cpp14Arg)
-            if conf.CheckCXX():
-                env.Append(CXXFLAGS=cpp14Arg)
-                if not env.GetOption("no_progress"):
-                    log.info("C++14 supported with %r" % (cpp14Arg,))
-                break
+        if probe is not None:
+            env.Append(CXXFLAGS=probe["cxxStd"])
+            if not env.GetOption("no_progress"):
+                log.info("C++14 supported with %r (cached)" % (probe["cxxStd"],))
         else:
-            log.fail("C++14 extensions could not be enabled for compiler %r" % env.whichCc)
-        conf.Finish()
+            if not env.GetOption("no_progress"):
+                log.info("Checking for C++14 support")
+            conf = env.Configure()
+            confEnv = conf.env
+            for cpp14Arg in ("-std=%s" % (val,) for val in ("c++14",)):
+                conf.env = confEnv.Clone()
+                conf.env.Append(CXXFLAGS=cpp14Arg)
+                if conf.CheckCXX():
+                    env.Append(CXXFLAGS=cpp14Arg)
+                    if not env.GetOption("no_progress"):
+                        log.info("C++14 supported with %r" % (cpp14Arg,))
+                    break
+            else:
+                log.fail("C++14 extensions could not be enabled for compiler %r" % env.whichCc)
+            conf.env = confEnv  # Finish() must restore the environment the context was started on
+            conf.Finish()
+            _saveToolchainProbe(probeKey, {"whichCc": env.whichCc, "ccVersion": env.ccVersion,
+                                           "CC": env['CC'], "CXX": env['CXX'], "cxxStd": cpp14Arg})
+
+    #
+    # Cache compiled objects between builds
+    #
+    if env.GetOption("objectCache") and not (env.GetOption("clean") or env.GetOption("help") or
+                                             env.GetOption("no_exec")):
+        from . import objectCache
+        objectCache.setup(env)
 
     #
     # Byte order
@@ -404,9 +573,16 @@ def _configureCommon():
     # If we're linking to libraries that themselves linked to
     # shareable libraries we need to do something special.
     #
-    if (re.search(r"^(Linux|Linux64)$", env["eupsFlavor"]) and "LD_LIBRARY_PATH" in os.environ):
-        env.Append(LINKFLAGS=["-Wl,-rpath-link"])
-        env.Append(LINKFLAGS=["-Wl,%s" % os.environ["LD_LIBRARY_PATH"]])
+    # RPATHLINK is filled in from the dependencies' LIBPATH and from LD_LIBRARY_PATH by
+    # dependencies.configure.  Like LIBPATH, it's left out of the link commands' signatures,
+    # so setting up another product doesn't relink anything.
+    #
+    if re.search(r"^(Linux|Linux64)$", env["eupsFlavor"]):
+        env["RPATHLINK"] = []
+        env["RPATHLINKPREFIX"] = "-Wl,-rpath-link,"
+        env["RPATHLINKSUFFIX"] = ""
+        env["_RPATHLINKFLAGS"] = "$( ${_concat(RPATHLINKPREFIX, RPATHLINK, RPATHLINKSUFFIX, __env__)} $)"
+        env.Append(LINKFLAGS=["$_RPATHLINKFLAGS"])
     #
     # Set the optimization level.
     #
@@ -478,6 +654,72 @@ def _configureCommon():
         env.Append(LINKFLAGS=['-fno-lto'])
 
 
+_TOOLCHAIN_PROBE_FILE = "toolchainProbes.json"
+_MAX_TOOLCHAIN_PROBES = 64
+_TOOLCHAIN_PROBE_REFRESH = 24*3600  # seconds between updates of a cached probe's last-used time
+
+
+def _toolchainProbeKey():
+    """Return a string identifying everything the compiler probes in _configureCommon depend on:
+    the resolved CC and CXX binaries (path, inode, size, mtime), archflags, opt and profile.
+    """
+    import hashlib
+    from . import utils
+
+    key = {"archflags": os.environ.get("ARCHFLAGS", env.get('archflags')),
+           "opt": env['opt'], "profile": env['profile']}
+    for var in ("CC", "CXX"):
+        words = str(env[var]).split()
+        key[var] = env[var]
+        key[var + "_stamp"] = utils.fileStamp(env.WhereIs(words[0])) if words else None
+    return hashlib.sha1(repr(sorted(key.items())).encode()).hexdigest()
+
+
+def _toolchainProbeFile():
+    """Return the file the compiler probe results are cached in, or None if there is no usable
+    cache directory."""
+    from . import utils
+
+    try:
+        return os.path.join(utils.userCacheDir(), _TOOLCHAIN_PROBE_FILE)
+    except OSError:
+        return None
+
+
+def _loadToolchainProbe(key):
+    """Return the cached compiler probe results for key, or None if they need to be recomputed.
+
+    The entry's last-used time is refreshed (at most once a day) so that eviction in
+    _saveToolchainProbe keeps the toolchains that are still in use.
+    """
+    import time
+    from . import utils
+
+    filename = _toolchainProbeFile()
+    if env.GetOption("config") == "force" or filename is None:
+        return None
+    probes = utils.readJsonCache(filename, {})
+    probe = probes.get(key)
+    if probe is not None and time.time() - probe.get("lastUsed", 0) > _TOOLCHAIN_PROBE_REFRESH:
+        probe["lastUsed"] = time.time()
+        utils.writeJsonCache(filename, probes)
+    return probe
+
+
+def _saveToolchainProbe(key, probe):
+    """Record compiler probe results so later builds with the same toolchain can skip them."""
+    import time
+    from . import utils
+
+    filename = _toolchainProbeFile()
+    if filename is None:
+        return
+    probes = utils.readJsonCache(filename, {})
+    probes[key] = dict(probe, lastUsed=time.time())
+    utils.trimJsonCache(probes, _MAX_TOOLCHAIN_PROBES)
+    utils.writeJsonCache(filename, probes)
+
+
 def _saveState():
     """Save state such as optimization level used.  The scons mailing lists were unable to tell
     RHL how to get this back from .sconsign.dblite
@@ -500,6 +742,7 @@ def _saveState():
 
     try:
         confFile = os.path.join(env.Dir(env["CONFIGUREDIR"]).abspath, "build.cfg")
+        os.makedirs(os.path.dirname(confFile), exist_ok=True)
         with open(confFile, 'w') as configfile:
             config.write(configfile)
     except Exception as e:
@@ -508,7 +751,31 @@ def _saveState():
 
 _initOptions()
 _initLog()
+_initTimings()
+if SCons.Script.GetOption("sconsUtilsTimings"):
+    timings.enable()
+if SCons.Script.GetOption("buildTrace"):
+    from . import buildTrace
+    trace = buildTrace.BuildTrace(SCons.Script.GetOption("buildTrace"))
+    trace.enable()
+if SCons.Script.GetOption("whyRebuilt"):
+    from . import rebuildCauses
+    rebuildCauses.RebuildCauses().enable()
 _initVariables()
-_initEnvironment()
+_ENV_LOCK = threading.Lock()
+
+
+def __getattr__(name):
+    # The environment is only created when first used (normally by dependencies.configure), so
+    # that importing sconsUtils doesn't load SCons' tools or walk LSST_CFG_PATH.  The modules that
+    # inject methods into SConsEnvironment are loaded with it.
+    if name == "env":
+        with _ENV_LOCK:
+            if "env" not in globals():
+                from . import builders, installation  # noqa F401
+                with timings.phase("_initEnvironment"):
+                    _initEnvironment()
+        return env
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 # @endcond
@@ -0,0 +1,165 @@
+##
+#  @file timing.py
+#
+#  Wall and CPU time of the phases of sconsUtils startup (--sconsUtils-timings).
+##
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import contextlib
+import subprocess
+
+from . import utils
+
+
+##
+#  @brief Records how long each phase of sconsUtils startup takes.
+#
+#  A single instance lives in state.timings.  Code wraps a phase in
+#  @code
+#  with state.timings.phase("PackageTree"):
+#      ...
+#  @endcode
+#  which costs nothing unless enable() has been called (by the --sconsUtils-timings option).
+#  When enabled, each phase records its start time, wall and CPU time, and the number of
+#  subprocesses spawned and stat calls made while it ran; these counts are taken by wrapping
+#  subprocess.Popen and os.stat/os.lstat for the rest of the run.
+#
+#  At exit the records are written as JSON to $CONFIGUREDIR/timings.json and a summary is
+#  printed.  Start times are given relative to "origin", an absolute (epoch) time, so they can
+#  be lined up with other traces of the same build.
+##
+class Timings:
+
+    FILE_NAME = "timings.json"
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = None
+        self.phases = []
+        self.subprocesses = 0
+        self.statCalls = 0
+        self._depth = threading.local()
+
+    ##
+    #  @brief Start recording.
+    #
+    #  @param summary  If False, the phases are only recorded (for a build trace, say), not written
+    #                  to FILE_NAME and summarized at exit.
+    ##
+    def enable(self, summary=True):
+        if summary:
+            atexit.register(self._finish)
+        if self.enabled:
+            return
+        self.enabled = True
+        self.origin = time.time()
+        self._startCpu = time.process_time()
+        self._countCalls()
+
+    def _countCalls(self):
+        popenInit = subprocess.Popen.__init__
+        stat = os.stat
+        lstat = os.lstat
+
+        def countedPopenInit(popen, *args, **kwds):
+            self.subprocesses += 1
+            popenInit(popen, *args, **kwds)
+
+        def countedStat(*args, **kwds):
+            self.statCalls += 1
+            return stat(*args, **kwds)
+
+        def countedLstat(*args, **kwds):
+            self.statCalls += 1
+            return lstat(*args, **kwds)
+
+        subprocess.Popen.__init__ = countedPopenInit
+        os.stat = countedStat
+        os.lstat = countedLstat
+
+    ##
+    #  @brief Context manager timing the enclosed block as a phase.
+    #
+    #  @param name      Name of the phase, e.g. "PackageTree" or a dependency's name.
+    #  @param category  Kind of phase ("phase", "dependency", "SConscript", ...), for grouping.
+    ##
+    @contextlib.contextmanager
+    def phase(self, name, category="phase"):
+        if not self.enabled:
+            yield
+            return
+        depth = getattr(self._depth, "value", 0)
+        self._depth.value = depth + 1
+        subprocesses = self.subprocesses
+        statCalls = self.statCalls
+        start = time.time()
+        startCpu = time.process_time()
+        try:
+            yield
+        finally:
+            self._depth.value = depth
+            self.phases.append({
+                "name": name,
+                "category": category,
+                "depth": depth,
+                "start": start - self.origin,
+                "wall": time.time() - start,
+                "cpu": time.process_time() - startCpu,
+                "subprocesses": self.subprocesses - subprocesses,
+                "statCalls": self.statCalls - statCalls,
+            })
+
+    # @brief Return the data recorded so far, as written to FILE_NAME.
+    def report(self):
+        return {
+            "origin": self.origin,
+            "command": sys.argv,
+            "phases": sorted(self.phases, key=lambda p: p["start"]),
+            "total": {
+                "wall": time.time() - self.origin,
+                "cpu": time.process_time() - self._startCpu,
+                "subprocesses": self.subprocesses,
+                "statCalls": self.statCalls,
+            },
+            "commands": utils.EXTERNAL_COMMANDS.stats,
+        }
+
+    def _finish(self):
+        from . import state  # can't import at module scope due to circular dependency
+        env = state.env
+        report = self.report()
+        try:
+            filename = os.path.join(env.Dir(env["CONFIGUREDIR"]).abspath, self.FILE_NAME)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, "w") as f:
+                json.dump(report, f, indent=1)
+        except Exception as e:
+            filename = None
+            state.log.warn("Unable to write sconsUtils timings: %s" % e)
+        total = report["total"]
+        state.log.report("sconsUtils timings (whole run): %.2f s wall, %.2f s CPU, %d subprocesses, "
+                         "%d stat calls"
+                         % (total["wall"], total["cpu"], total["subprocesses"], total["statCalls"]))
+        for p in report["phases"]:
+            if p["category"] == "phase":
+                state.log.report("  %s%-*s %7.3f s wall %7.3f s CPU %5d subprocesses %7d stat calls"
+                                 % ("  "*p["depth"], 30 - 2*p["depth"], p["name"], p["wall"], p["cpu"],
+                                    p["subprocesses"], p["statCalls"]))
+        dependencies = sorted((p for p in report["phases"] if p["category"] == "dependency"),
+                              key=lambda p: -p["wall"])
+        if dependencies:
+            state.log.report("  slowest dependencies: %s" %
+                             ", ".join("%s %.3f s" % (p["name"], p["wall"]) for p in dependencies[:5]))
+        probes = [p for p in report["phases"] if p["category"] == "probe"]
+        if probes:
+            state.log.report("  startup probes: %s" %
+                             ", ".join("%s %.3f s" % (p["name"], p["wall"]) for p in probes))
+        for line in utils.EXTERNAL_COMMANDS.summary():
+            state.log.report("  " + line)
+        if filename:
+            state.log.report("  details in %s" % filename)
@@ -5,9 +5,19 @@
 ##
 
 import os
+import re
 import sys
+import json
+import time
+import atexit
+import shutil
+import hashlib
+import tempfile
 import warnings
+import threading
+import contextlib
 import subprocess
+import concurrent.futures
 import platform
 import SCons.Script
 
@@ -24,16 +34,64 @@ class Log:
     def __init__(self):
         self.traceback = False
         self.verbose = True
+        self._local = threading.local()
+
+    def _print(self, message, file=None, verboseOnly=False):
+        captured = getattr(self._local, "captured", None)
+        if captured is not None:
+            captured.append((message, file, verboseOnly))
+        elif self.verbose or not verboseOnly:
+            print(message, file=file)
 
     def info(self, message):
-        if self.verbose:
-            print(message)
+        self._print(message, verboseOnly=True)
+
+    def report(self, message):
+        # for output the user asked for explicitly, so not subject to verbose
+        self._print(message)
 
     def warn(self, message):
+        recorded = getattr(self._local, "recorded", None)
+        if recorded is not None:
+            recorded.append(message)
         if self.traceback:
             warnings.warn(message, stacklevel=2)
         else:
-            print(message, file=sys.stderr)
+            self._print(message, file=sys.stderr)
+
+    ##
+    #  @brief Context manager collecting the messages this thread logs instead of printing them.
+    #
+    #  For work done in background threads, whose messages would otherwise be interleaved with
+    #  the main thread's output; pass the list it yields to replay() once it is safe to print.
+    #  Whether info() messages are printed is decided when they are replayed, as the verbose
+    #  option may not have been applied when they were logged.
+    ##
+    @contextlib.contextmanager
+    def capture(self):
+        messages = []
+        self._local.captured = messages
+        try:
+            yield messages
+        finally:
+            self._local.captured = None
+
+    def replay(self, messages):
+        for message, file, verboseOnly in messages:
+            self._print(message, file=file, verboseOnly=verboseOnly)
+
+    ##
+    #  @brief Context manager collecting the warnings this thread logs; unlike capture(), they are
+    #         still printed as usual.
+    ##
+    @contextlib.contextmanager
+    def record(self):
+        messages = []
+        self._local.recorded = messages
+        try:
+            yield messages
+        finally:
+            self._local.recorded = None
 
     def fail(self, message):
         if self.traceback:
@@ -83,15 +141,26 @@ _pythonPath = None
 #  SCons. Caches result and assumes the PATH does not change between
 #  calls. Runs the "python" command and asks where it is rather than
 #  scanning the PATH.
+#
+#  The answer is taken from the "whichPython" startup probe if that was started.
 ##
 def whichPython():
     global _pythonPath
     if _pythonPath is None:
-        _pythonPath = runExternal(["python", "-c", "import sys; print(sys.executable)"],
-                                  fatal=True, msg="Error getting python path")
+        from . import probes
+        _pythonPath = probes.result("whichPython", findPython)
     return _pythonPath
 
 
+# @brief Run the "python" command to ask where it is (see whichPython).
+#
+# The answer is only remembered for this run: which interpreter "python" runs can depend on
+# things the memo key doesn't see, such as pyenv's .python-version files and shims.
+def findPython():
+    return runExternal(["python", "-c", "import sys; print(sys.executable)"],
+                       fatal=True, msg="Error getting python path", memo=True)
+
+
 ##
 #  @brief Returns True if the shebang lines of executables should be rewritten
 ##
@@ -140,29 +209,284 @@ def libraryLoaderEnvironment():
 #
 #  Note that the entire program output is returned, not just a single line.
 #  @returns Strings not bytes.
+#
+#  Commands are run by EXTERNAL_COMMANDS (see ExternalCommands), which can also remember their output:
+#
+#  @param memo    If True, the output is remembered for the rest of the run, and the command is only
+#                 run again if its arguments, working directory, environment or inputs change.
+#  @param pure    If True, the output depends only on the command, its environment, the executable
+#                 and the inputs, so it is remembered between runs too (implies memo).
+#  @param inputs  Files the output depends on; their stamps (see fileStamp) are part of the memo key.
+#  @param env     Environment to run the command in (default os.environ).
+##
+def runExternal(cmd, fatal=False, msg=None, memo=False, pure=False, inputs=(), env=None):
+    return EXTERNAL_COMMANDS.run(cmd, fatal=fatal, msg=msg, memo=memo, pure=pure, inputs=inputs, env=env)
+
+
+##
+#  @brief Runs external commands for runExternal, keeping their memoized output and statistics.
+#
+#  Memoized commands are keyed on their arguments, the environment variables in ENVIRONMENT, the
+#  stamp of the executable and of any declared inputs and, unless they are pure, the working
+#  directory.  Concurrent callers of the same memoized command wait for a single run.  Only
+#  successful runs are remembered; the output of pure commands is saved in MEMO_FILE in the
+#  user's cache directory at exit (if it can be created), where the least-recently-used entries
+#  are evicted.
+#
+#  The number of runs, memo hits and the time spent are kept per command, and reported at exit.
 ##
-def runExternal(cmd, fatal=False, msg=None):
-    if msg is None:
+class ExternalCommands:
+
+    MEMO_FILE = "externalCommands.json"
+    MAX_MEMO_ENTRIES = 256
+    ENVIRONMENT = ("PATH", "LD_LIBRARY_PATH", "DYLD_LIBRARY_PATH", "PYTHONPATH", "PYTHONHOME",
+                   "LANG", "LC_ALL", "LC_MESSAGES")
+
+    def __init__(self):
+        self.stats = {}
+        self._memo = {}
+        self._saved = None
+        self._unsaved = {}
+        self._savedHits = set()
+        self._started = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _words(cmd):
+        return cmd.split() if isinstance(cmd, str) else [str(word) for word in cmd]
+
+    # @brief Return the name statistics are kept under: the program, and its subcommand if any.
+    @staticmethod
+    def name(cmd):
+        words = ExternalCommands._words(cmd)
+        if not words:
+            return "?"
+        name = os.path.basename(words[0])
+        if len(words) > 1 and re.match(r"^[a-z][-a-z]*$", words[1]):
+            name += " " + words[1]
+        return name
+
+    def _start(self):
+        # called with the lock held
+        if not self._started:
+            self._started = True
+            atexit.register(self._finish)
+
+    ##
+    #  @brief Count a command run by other means (e.g. a persistent server) in the statistics.
+    ##
+    def record(self, name, seconds, runs=1, memoHits=0):
+        with self._lock:
+            self._start()
+            stats = self.stats.setdefault(name, {"runs": 0, "memoHits": 0, "seconds": 0.0})
+            stats["runs"] += runs
+            stats["memoHits"] += memoHits
+            stats["seconds"] += seconds
+
+    def _key(self, cmd, environ, inputs, pure):
+        words = self._words(cmd)
+        executable = shutil.which(words[0], path=environ.get("PATH")) if words else None
+        key = [cmd if isinstance(cmd, str) else words,
+               [(var, environ.get(var)) for var in self.ENVIRONMENT],
+               fileStamp(executable), [fileStamp(str(f)) for f in inputs]]
+        if not pure:
+            key.append(os.getcwd())
+        return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+    def _execute(self, cmd, environ):
+        # Run with shell unless given a list of options
+        shell = not isinstance(cmd, (list, tuple))
+        start = time.perf_counter()
         try:
-            msg = "Error running %s" % cmd.split()[0]
-        except Exception:
-            msg = "Error running external command"
+            result = subprocess.run(cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    env=environ)
+        except OSError as e:
+            ok, output, error = False, "", ("'%s' is not installed" % self._words(cmd)[0]
+                                            if isinstance(e, FileNotFoundError) else str(e))
+        else:
+            ok = result.returncode == 0
+            output = result.stdout.decode().strip()
+            error = result.stderr.decode(errors="replace").strip()
+        self.record(self.name(cmd), time.perf_counter() - start)
+        return ok, output, error
 
-    # Run with shell unless given a list of options
-    shell = True
-    if isinstance(cmd, (list, tuple)):
-        shell = False
+    def _memoFile(self):
+        try:
+            return os.path.join(userCacheDir(), self.MEMO_FILE)
+        except OSError:
+            return None
 
-    try:
-        retval = subprocess.run(cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                check=True)
-    except subprocess.CalledProcessError as e:
-        if fatal:
-            raise RuntimeError(f"{msg}: {e.stderr.decode()}") from e
+    def _loadSaved(self):
+        # called with the lock held
+        if self._saved is None:
+            filename = self._memoFile()
+            self._saved = readJsonCache(filename, {}) if filename else {}
+        return self._saved
+
+    def run(self, cmd, fatal=False, msg=None, memo=False, pure=False, inputs=(), env=None):
+        if msg is None:
+            words = self._words(cmd)
+            msg = "Error running %s" % words[0] if words else "Error running external command"
+        if not (memo or pure):
+            return self._result(self._execute(cmd, env), fatal, msg)
+
+        key = self._key(cmd, os.environ if env is None else env, inputs, pure)
+        with self._lock:
+            self._start()
+            future = self._memo.get(key)
+            owner = future is None
+            if owner:
+                saved = self._loadSaved().get(key) if pure else None
+                future = self._memo[key] = concurrent.futures.Future()
+                if isinstance(saved, dict) and "output" in saved:
+                    self._savedHits.add(key)
+                    future.set_result((True, saved["output"], ""))
+                    owner = False
+        if owner:
+            result = self._execute(cmd, env)
+            with self._lock:
+                if result[0]:
+                    if pure:
+                        self._unsaved[key] = result[1]
+                else:
+                    del self._memo[key]  # failures are not remembered
+            future.set_result(result)
         else:
+            result = future.result()
+            self.record(self.name(cmd), 0.0, runs=0, memoHits=1)
+        return self._result(result, fatal, msg)
+
+    @staticmethod
+    def _result(result, fatal, msg):
+        ok, output, error = result
+        if not ok:
+            if fatal:
+                raise RuntimeError("%s: %s" % (msg, error))
             from . import state  # can't import at module scope due to circular dependency
-            state.log.warn(f"{msg}: {e.stderr}")
-    return retval.stdout.decode().strip()
+            state.log.warn("%s: %s" % (msg, error))
+        return output
+
+    # @brief Return a summary of the statistics, for reporting.
+    def summary(self):
+        with self._lock:
+            stats = sorted(self.stats.items(), key=lambda item: -item[1]["seconds"])
+        lines = ["External commands: %d run in %.3f s, %d answered from memo" % (
+            sum(s["runs"] for n, s in stats), sum(s["seconds"] for n, s in stats),
+            sum(s["memoHits"] for n, s in stats))]
+        for name, s in stats:
+            lines.append("  %-24s %4d run %8.3f s %4d from memo" % (name, s["runs"], s["seconds"],
+                                                                    s["memoHits"]))
+        return lines
+
+    def _finish(self):
+        filename = self._memoFile() if (self._unsaved or self._savedHits) else None
+        if filename:
+            now = time.time()
+            saved = {key: entry for key, entry in readJsonCache(filename, {}).items()
+                     if isinstance(entry, dict)}
+            for key in self._savedHits:
+                if key in saved:
+                    saved[key]["lastUsed"] = now
+            for key, output in self._unsaved.items():
+                saved[key] = {"output": output, "lastUsed": now}
+            trimJsonCache(saved, self.MAX_MEMO_ENTRIES)
+            writeJsonCache(filename, saved)
+        from . import state  # can't import at module scope due to circular dependency
+        for line in self.summary():
+            state.log.info(line)
+
+
+EXTERNAL_COMMANDS = ExternalCommands()
+
+
+##
+#  @brief Return the per-user directory used for caches that persist between builds, creating it
+#         if necessary.
+#
+#  The location is $SCONSUTILS_CACHE_ROOT if set, otherwise $XDG_CACHE_HOME/sconsUtils (defaulting
+#  to ~/.cache/sconsUtils).  Any extra arguments are joined on as subdirectories.
+##
+def userCacheDir(*subdirs):
+    root = os.environ.get("SCONSUTILS_CACHE_ROOT")
+    if not root:
+        root = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                            "sconsUtils")
+    path = os.path.join(root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+##
+#  @brief Return a (path, inode, size, mtime) stamp for a file, or None if it does not exist.
+#
+#  Used to key persistent caches on the identity of files (e.g. compiler binaries) without
+#  reading their contents.
+##
+def fileStamp(path):
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.realpath(path), st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+##
+#  @brief Write data (str or bytes) to filename atomically.
+#
+#  The data are written to a temporary file in the same directory which is then renamed over
+#  the target, so concurrent readers see either the old or the new contents, never a partial file.
+##
+def atomicWrite(filename, data):
+    dirName = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(dirName, exist_ok=True)
+    fd, tmpName = tempfile.mkstemp(dir=dirName, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as tmpFile:
+            tmpFile.write(data)
+        os.replace(tmpName, filename)
+    except BaseException:
+        try:
+            os.unlink(tmpName)
+        except OSError:
+            pass
+        raise
+
+
+##
+#  @brief Read a JSON cache file, returning default if it is missing or unreadable.
+##
+def readJsonCache(filename, default=None):
+    try:
+        with open(filename) as cacheFile:
+            return json.load(cacheFile)
+    except (OSError, ValueError):
+        return default
+
+
+##
+#  @brief Atomically write a JSON cache file; failures are reported but never fatal.
+##
+def writeJsonCache(filename, data):
+    try:
+        atomicWrite(filename, json.dumps(data, sort_keys=True))
+    except OSError as e:
+        from . import state  # can't import at module scope due to circular dependency
+        state.log.warn("Unable to write cache file %s: %s" % (filename, e))
+
+
+##
+#  @brief Remove the least-recently-used entries of a JSON cache until it holds at most maxEntries.
+#
+#  Each entry is a dict whose "lastUsed" item is the time it was last stored or used; the order
+#  of the keys is not kept, as writeJsonCache sorts them.
+##
+def trimJsonCache(cache, maxEntries):
+    excess = len(cache) - maxEntries
+    if excess > 0:
+        for key in sorted(cache, key=lambda k: cache[k].get("lastUsed", 0))[:excess]:
+            del cache[key]
 
 
 ##
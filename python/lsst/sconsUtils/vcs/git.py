@@ -1,11 +1,23 @@
 #
-# A simple python interface to git, using os.popen
+# A simple python interface to git.
 # Based on the svn interface.
 #
-# If ever we want to do anything clever, we should use one of
-# the supported python packages
+# HEAD, refs and tags are read directly from the repository's metadata (see GitDir), which
+# avoids starting git processes in the common cases; git itself is only run for what GitDir
+# doesn't handle.  All answers are computed at most once per working directory and run, so
+# setPrefix and VersionModule share them.
 #
 import os
+import re
+import stat
+import zlib
+import hashlib
+import mmap
+import struct
+import functools
+import collections
+import configparser
+import threading
 from .. import state
 from .. import utils
 
@@ -16,11 +28,9 @@ def guessVersionName():
     if not os.path.exists(".git"):
         state.log.warn("Cannot guess version without .git directory; version will be set to 'unknown'.")
         return "unknown"
-    status = utils.runExternal("git status --porcelain --untracked-files=no", fatal=True)
-    if status.strip():
+    if isModified():
         raise RuntimeError("Error with git version: uncommitted changes")
-    desc = utils.runExternal("git describe --tags --always", fatal=True)
-    return desc.strip()
+    return describe()
 
 
 def guessFingerprint():
@@ -31,11 +41,599 @@ def guessFingerprint():
         state.log.warn("Cannot guess fingerprint without .git directory; will be set to '%s'."
                        % fingerprint)
     else:
-        status = utils.runExternal("git status --porcelain --untracked-files=no", fatal=True)
-        if status.strip():
-            modified = True
-        output = utils.runExternal("git rev-parse HEAD", fatal=False)
-
-        fingerprint = output.strip()
+        modified = isModified()
+        fingerprint = headSha()
 
     return fingerprint, modified
+
+
+_MEMO = {}
+_MEMO_LOCK = threading.RLock()
+
+
+def _memoized(func):
+    """Cache func's result for each working directory for the rest of the run.
+
+    The lock is held while computing, so concurrent callers wait for and share one answer.
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = (func.__name__, os.getcwd()) + args
+        with _MEMO_LOCK:
+            if key not in _MEMO:
+                _MEMO[key] = func(*args)
+            return _MEMO[key]
+    return wrapper
+
+
+@_memoized
+def isModified():
+    """Return True if tracked files in the work tree or index differ from HEAD
+
+    Equivalent to a non-empty "git status --porcelain --untracked-files=no".
+    """
+    with state.timings.phase("git modification check"):
+        try:
+            modified = _repository().isModified()
+            method = "index"
+        except _Unsupported as e:
+            state.log.info("Running git to check for modifications: %s" % e)
+            status = utils.runExternal("git status --porcelain --untracked-files=no", fatal=True)
+            modified = bool(status.strip())
+            method = "git status"
+    state.log.info("Checked for uncommitted changes (%s): %s" % (method, "modified" if modified else "clean"))
+    return modified
+
+
+@_memoized
+def headSha():
+    """Return the SHA1 of the commit checked out"""
+    try:
+        sha = _repository().head()
+        if sha is not None:
+            return sha
+    except _Unsupported as e:
+        state.log.info("Running git to resolve HEAD: %s" % e)
+    return utils.runExternal("git rev-parse HEAD", fatal=False).strip()
+
+
+@_memoized
+def describe():
+    """Return the output of "git describe --tags --always" for HEAD
+
+    Only a tag pointing at HEAD itself is found in-process (see GitDir.exactTag); an untagged
+    HEAD, as in most development builds, always runs git describe.  The "<tag>-<n>-g<sha>" form
+    depends on git's choice among candidate tags and on its abbreviation length, which grows
+    with the repository, so it is left to git rather than reproduced.
+    """
+    try:
+        name = _repository().exactTag(headSha())
+        if name is not None:
+            return name
+    except _Unsupported as e:
+        state.log.info("Running git to describe HEAD: %s" % e)
+    return utils.runExternal("git describe --tags --always", fatal=True).strip()
+
+
+@_memoized
+def _repository():
+    return GitDir(".")
+
+
+class _Unsupported(Exception):
+    """Raised when GitDir can't answer a question itself; the caller should run git instead."""
+
+
+_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+_OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+_GITLINK = 0o160000
+_OFS_DELTA = 6
+_REF_DELTA = 7
+
+
+class GitDir:
+    """Read-only access to the refs and objects of the git repository containing a work tree.
+
+    Handles .git directories and .git files (worktrees and submodules), loose and packed refs,
+    and loose and packed (including deltified) SHA-1 objects.  Anything else, such as reftable
+    ref storage, SHA-256 repositories or objects in alternates, raises _Unsupported.
+    """
+
+    def __init__(self, workTree="."):
+        dotGit = os.path.join(workTree, ".git")
+        try:
+            if os.path.isfile(dotGit):
+                with open(dotGit) as f:
+                    content = f.read().strip()
+                if not content.startswith("gitdir:"):
+                    raise _Unsupported("unrecognized .git file")
+                dotGit = os.path.join(workTree, content[len("gitdir:"):].strip())
+            self.gitDir = os.path.abspath(dotGit)
+            self.commonDir = self.gitDir
+            if os.path.exists(os.path.join(self.gitDir, "commondir")):
+                with open(os.path.join(self.gitDir, "commondir")) as f:
+                    self.commonDir = os.path.abspath(os.path.join(self.gitDir, f.read().strip()))
+        except OSError as e:
+            raise _Unsupported(str(e))
+        if os.path.exists(os.path.join(self.commonDir, "reftable")):
+            raise _Unsupported("reftable ref storage")
+        self._packedRefs = None
+        self._packs = None
+
+    def _readText(self, path):
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            raise _Unsupported(str(e))
+
+    def packedRefs(self):
+        """Return {refname: (sha, peeled)} from packed-refs.
+
+        peeled is the object an annotated tag points to, "" for a tag known not to be annotated,
+        or None if packed-refs doesn't say.
+        """
+        if self._packedRefs is None:
+            refs = {}
+            peeledTags = False
+            last = None
+            for line in (self._readText(os.path.join(self.commonDir, "packed-refs")) or "").splitlines():
+                if line.startswith("#"):
+                    traits = line.split(":", 1)[1].split() if line.startswith("# pack-refs with:") else []
+                    peeledTags = "peeled" in traits or "fully-peeled" in traits
+                elif line.startswith("^"):
+                    if last is not None:
+                        refs[last] = (refs[last][0], line[1:].strip())
+                elif line.strip():
+                    sha, name = line.split(" ", 1)
+                    refs[name] = (sha, "" if peeledTags and name.startswith("refs/tags/") else None)
+                    last = name
+            self._packedRefs = refs
+        return self._packedRefs
+
+    def readRef(self, name, depth=0):
+        """Return the SHA1 a ref (e.g. "HEAD" or "refs/heads/main") points to, or None"""
+        if depth > 5:
+            raise _Unsupported("symbolic ref loop at %s" % name)
+        for base in (self.gitDir, self.commonDir):
+            content = self._readText(os.path.join(base, name))
+            if content is not None:
+                content = content.strip()
+                if content.startswith("ref:"):
+                    return self.readRef(content[len("ref:"):].strip(), depth + 1)
+                if not _SHA_RE.match(content):
+                    raise _Unsupported("unrecognized content in ref %s" % name)
+                return content
+        packed = self.packedRefs().get(name)
+        return packed[0] if packed is not None else None
+
+    def head(self):
+        """Return the SHA1 of HEAD, or None if the current branch has no commits yet"""
+        return self.readRef("HEAD")
+
+    def tags(self):
+        """Return {tagname: (sha, peeled)} for all tags, with peeled as in packedRefs()"""
+        tags = {name[len("refs/tags/"):]: value for name, value in self.packedRefs().items()
+                if name.startswith("refs/tags/")}
+        tagDir = os.path.join(self.commonDir, "refs", "tags")
+        for root, dirs, files in os.walk(tagDir):
+            for fileName in files:
+                path = os.path.join(root, fileName)
+                sha = (self._readText(path) or "").strip()
+                if _SHA_RE.match(sha):
+                    tags[os.path.relpath(path, tagDir).replace(os.sep, "/")] = (sha, None)
+        return tags
+
+    def exactTag(self, commit):
+        """Return the tag "git describe --tags" would print for commit if a tag points at it, else None.
+
+        Like git, an annotated tag is preferred over lightweight ones, and the first of several
+        lightweight tags (in refname order) is used.  Choosing between several annotated tags
+        requires comparing their dates, which is left to git.
+        """
+        if commit is None:
+            return None
+        annotated = []
+        lightweight = []
+        for name, (sha, peeled) in sorted(self.tags().items()):
+            if peeled is None and sha != commit:
+                peeled = self.peel(sha)
+            if sha == commit:
+                lightweight.append(name)
+            elif peeled == commit:
+                annotated.append(name)
+        if len(annotated) > 1:
+            raise _Unsupported("several annotated tags point at HEAD")
+        if annotated:
+            return annotated[0]
+        return lightweight[0] if lightweight else None
+
+    def peel(self, sha):
+        """Return the object an annotated tag (or chain of tags) points to, or "" if sha isn't a tag"""
+        peeled = ""
+        for depth in range(10):
+            objectType, data = self.readObject(sha)
+            if objectType != "tag":
+                return peeled
+            match = re.match(rb"object ([0-9a-f]{40})\n", data)
+            if not match:
+                raise _Unsupported("malformed tag object %s" % sha)
+            sha = peeled = match.group(1).decode()
+        raise _Unsupported("tag chain too long")
+
+    def readObject(self, sha):
+        """Return (type, data) for the object with the given SHA1"""
+        objectsDir = os.path.join(self.commonDir, "objects")
+        try:
+            with open(os.path.join(objectsDir, sha[:2], sha[2:]), "rb") as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            pass
+        except (OSError, zlib.error) as e:
+            raise _Unsupported("unable to read object %s: %s" % (sha, e))
+        else:
+            header, data = raw.split(b"\0", 1)
+            return header.split(b" ", 1)[0].decode(), data
+        for pack in self._packIndexes():
+            offset = pack.find(sha)
+            if offset is not None:
+                return pack.readObject(offset, self)
+        raise _Unsupported("object %s not found" % sha)
+
+    def config(self):
+        """Return the repository's own config file, parsed with ConfigParser"""
+        parser = configparser.ConfigParser(strict=False, allow_no_value=True, interpolation=None)
+        try:
+            parser.read(os.path.join(self.commonDir, "config"))
+        except configparser.Error as e:
+            raise _Unsupported("unable to parse git config: %s" % e)
+        return parser
+
+    def commitTree(self, commit):
+        """Return the SHA1 of a commit's tree"""
+        objectType, data = self.readObject(commit)
+        match = re.match(rb"tree ([0-9a-f]{40})\n", data)
+        if objectType != "commit" or not match:
+            raise _Unsupported("malformed commit %s" % commit)
+        return match.group(1).decode()
+
+    def flattenTree(self, tree, prefix=b""):
+        """Return {path: (mode, sha)} for all the files (and submodules) below a tree"""
+        objectType, data = self.readObject(tree)
+        if objectType != "tree":
+            raise _Unsupported("%s is not a tree" % tree)
+        result = {}
+        pos = 0
+        while pos < len(data):
+            space = data.index(b" ", pos)
+            nul = data.index(b"\0", space)
+            mode = int(data[pos:space], 8)
+            path = prefix + data[space + 1:nul]
+            sha = data[nul + 1:nul + 21].hex()
+            pos = nul + 21
+            if stat.S_ISDIR(mode):
+                result.update(self.flattenTree(sha, path + b"/"))
+            else:
+                result[path] = (mode, sha)
+        return result
+
+    ##
+    # Modification checking
+    #
+    # The work tree is compared with the index using the stat data git records for each file;
+    # a file whose stat data differ (or that is "racily clean") is hashed and compared with the
+    # blob in the index, so touching a file doesn't make the tree look modified.  The index is
+    # compared with HEAD using the root of the index's cache-tree (TREE) extension, falling back
+    # to comparing every entry with HEAD's tree when that is out of date.
+    #
+    # Untracked files are not considered (as with --untracked-files=no), so the untracked cache
+    # is irrelevant.  Split or sparse indexes, submodules, and content that may need clean filters
+    # or eol conversion before it can be compared are left to git.
+    #
+    # So are indexes maintained with an fsmonitor (FSMN extension), which means that repositories
+    # with core.fsmonitor set get no speedup from this check.  The FSMN data only say which paths
+    # were clean as of the fsmonitor token stored with them; knowing which have changed since
+    # needs a query of the fsmonitor hook or daemon, which git status makes anyway.  Trusting the
+    # stat data alone instead would be correct, but git skips refreshing the stat data of paths
+    # the fsmonitor reports clean, so it would hash far more files than git does.
+    ##
+
+    def isModified(self, workTree="."):
+        """Return True if tracked files in workTree or the index differ from HEAD"""
+        head = self.head()
+        if head is None:
+            raise _Unsupported("HEAD has no commits")
+        indexFile = os.path.join(self.gitDir, "index")
+        index = GitIndex(indexFile)
+        if "FSMN" in index.extensions:
+            raise _Unsupported("index is maintained by an fsmonitor")
+        for name in ("link", "sdir"):
+            if name in index.extensions:
+                raise _Unsupported("unsupported index extension '%s'" % name)
+        entries = index.entries
+        if any(stat.S_IFMT(e.mode) == _GITLINK for e in entries):
+            raise _Unsupported("repository has submodules")
+        if any(e.stage != 0 or e.intentToAdd for e in entries):
+            return True
+        if self._indexDiffersFromHead(index, head):
+            return True
+        config = self.config()
+        fileMode = config.get("core", "filemode", fallback="true").lower() not in ("false", "no", "off", "0")
+        racyTime = os.stat(indexFile).st_mtime_ns
+        for entry in entries:
+            if entry.skipWorktree or entry.assumeValid:
+                continue
+            if self._entryModified(entry, os.path.join(workTree, os.fsdecode(entry.path)), fileMode,
+                                   racyTime):
+                if self._mayFilter(index, config):
+                    raise _Unsupported("%s may be subject to content filters"
+                                       % os.fsdecode(entry.path))
+                return True
+        return False
+
+    def _indexDiffersFromHead(self, index, head):
+        headTree = self.commitTree(head)
+        cacheTree = index.extensions.get("TREE")
+        if cacheTree is not None:
+            # The first cache-tree entry is the root: "\0<entry count> <subtrees>\n<sha>"; a
+            # negative count means it has been invalidated.
+            header = cacheTree[:cacheTree.index(b"\n")]
+            if not header.startswith(b"\0"):
+                raise _Unsupported("malformed cache-tree extension")
+            count = int(header[1:].split(b" ")[0])
+            if count >= 0:
+                start = len(header) + 1
+                return cacheTree[start:start + 20].hex() != headTree
+        inIndex = {e.path: (e.mode, e.sha) for e in index.entries}
+        return inIndex != self.flattenTree(headTree)
+
+    @staticmethod
+    def _entryModified(entry, path, fileMode, racyTime):
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            raise _Unsupported(str(e))
+        if stat.S_ISLNK(entry.mode) != stat.S_ISLNK(st.st_mode) or \
+                not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+            return True
+        if fileMode and stat.S_ISREG(st.st_mode) and bool(entry.mode & 0o100) != bool(st.st_mode & 0o100):
+            return True
+        mtime = entry.mtime[0]*1000000000 + entry.mtime[1]
+        if (entry.size == st.st_size & 0xffffffff and
+                entry.mtime == (int(st.st_mtime), st.st_mtime_ns % 1000000000) and
+                entry.ctime == (int(st.st_ctime), st.st_ctime_ns % 1000000000) and
+                entry.ino == st.st_ino & 0xffffffff and mtime < racyTime):
+            return False
+        if stat.S_ISLNK(st.st_mode):
+            content = os.fsencode(os.readlink(path))
+            return _blobSha(len(content), [content]) != entry.sha
+        with open(path, "rb") as f:
+            return _blobSha(st.st_size, iter(functools.partial(f.read, 1 << 20), b"")) != entry.sha
+
+    def _mayFilter(self, index, config):
+        """Could eol conversion or filters make the work tree content differ from the blob?"""
+        if any(os.path.basename(e.path) == b".gitattributes" for e in index.entries):
+            return True
+        if os.path.exists(os.path.join(self.commonDir, "info", "attributes")):
+            return True
+        if config.has_option("core", "autocrlf") or config.has_option("core", "attributesfile"):
+            return True
+        xdgConfig = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+        if os.path.exists(os.path.join(xdgConfig, "git", "attributes")):
+            return True
+        for globalConfig in ("/etc/gitconfig", os.path.join(xdgConfig, "git", "config"),
+                             os.path.expanduser("~/.gitconfig")):
+            try:
+                with open(globalConfig) as f:
+                    text = f.read().lower()
+            except OSError:
+                continue
+            if "autocrlf" in text or "attributesfile" in text:
+                return True
+        return False
+
+    def _packIndexes(self):
+        if self._packs is None:
+            packDir = os.path.join(self.commonDir, "objects", "pack")
+            try:
+                names = sorted(os.listdir(packDir))
+            except OSError:
+                names = []
+            self._packs = [_PackIndex(os.path.join(packDir, name)) for name in names
+                           if name.endswith(".idx") and name[:-4] + ".pack" in names]
+        return self._packs
+
+
+def _blobSha(size, chunks):
+    sha = hashlib.sha1(b"blob %d\0" % size)
+    for chunk in chunks:
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+_IndexEntry = collections.namedtuple(
+    "_IndexEntry",
+    "path mode sha size mtime ctime ino stage assumeValid skipWorktree intentToAdd")
+
+
+class GitIndex:
+    """The entries and extensions of a git index file (versions 2 to 4)"""
+
+    def __init__(self, filename):
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            raise _Unsupported("unable to read index: %s" % e)
+        if data[:4] != b"DIRC":
+            raise _Unsupported("unrecognized index file")
+        version, count = struct.unpack(">II", data[4:12])
+        if version not in (2, 3, 4):
+            raise _Unsupported("unsupported index version %d" % version)
+        self.entries = []
+        self.extensions = {}
+        pos = 12
+        name = b""
+        for i in range(count):
+            ctimeS, ctimeNs, mtimeS, mtimeNs, dev, ino, mode, uid, gid, size = \
+                struct.unpack_from(">10I", data, pos)
+            sha = data[pos + 40:pos + 60].hex()
+            flags, = struct.unpack_from(">H", data, pos + 60)
+            nameStart = pos + 62
+            extendedFlags = 0
+            if version >= 3 and flags & 0x4000:
+                extendedFlags, = struct.unpack_from(">H", data, nameStart)
+                nameStart += 2
+            if version == 4:
+                # the name is stored as the number of bytes to remove from the previous name,
+                # followed by the suffix to append to it
+                byte = data[nameStart]
+                strip = byte & 0x7f
+                nameStart += 1
+                while byte & 0x80:
+                    byte = data[nameStart]
+                    strip = ((strip + 1) << 7) | (byte & 0x7f)
+                    nameStart += 1
+                end = data.index(b"\0", nameStart)
+                name = name[:len(name) - strip] + data[nameStart:end]
+                pos = end + 1
+            else:
+                end = data.index(b"\0", nameStart)
+                name = data[nameStart:end]
+                pos += (nameStart - pos + len(name) + 8) & ~7
+            self.entries.append(_IndexEntry(name, mode, sha, size, (mtimeS, mtimeNs), (ctimeS, ctimeNs), ino,
+                                            (flags >> 12) & 3, bool(flags & 0x8000),
+                                            bool(extendedFlags & 0x4000), bool(extendedFlags & 0x2000)))
+        end = len(data) - 20  # trailing checksum
+        while pos + 8 <= end:
+            signature = data[pos:pos + 4].decode("latin-1")
+            size, = struct.unpack_from(">I", data, pos + 4)
+            self.extensions[signature] = data[pos + 8:pos + 8 + size]
+            pos += 8 + size
+
+
+class _PackIndex:
+    """A version 2 pack index and its pack file"""
+
+    def __init__(self, filename):
+        self.packName = filename[:-len(".idx")] + ".pack"
+        try:
+            with open(filename, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise _Unsupported("unable to read pack index %s: %s" % (filename, e))
+        if self.data[:8] != b"\377tOc\0\0\0\2":
+            raise _Unsupported("unsupported pack index %s" % filename)
+        self.fanout = struct.unpack(">256I", self.data[8:8 + 1024])
+        self.count = self.fanout[255]
+        self.shaTable = 8 + 1024
+        self.offsetTable = self.shaTable + 24*self.count  # after the SHA1s and their CRC32s
+        self.largeOffsetTable = self.offsetTable + 4*self.count
+
+    def find(self, sha):
+        """Return the offset in the pack of the object with the given SHA1, or None"""
+        binSha = bytes.fromhex(sha)
+        lo = self.fanout[binSha[0] - 1] if binSha[0] else 0
+        hi = self.fanout[binSha[0]]
+        while lo < hi:
+            mid = (lo + hi)//2
+            entry = self.data[self.shaTable + 20*mid:self.shaTable + 20*mid + 20]
+            if entry < binSha:
+                lo = mid + 1
+            elif entry > binSha:
+                hi = mid
+            else:
+                start = self.offsetTable + 4*mid
+                offset, = struct.unpack(">I", self.data[start:start + 4])
+                if offset & 0x80000000:
+                    start = self.largeOffsetTable + 8*(offset & 0x7fffffff)
+                    offset, = struct.unpack(">Q", self.data[start:start + 8])
+                return offset
+        return None
+
+    def readObject(self, offset, repository):
+        """Return (type, data) for the object at offset, resolving deltas"""
+        with open(self.packName, "rb") as f:
+            return self._read(f, offset, repository)
+
+    def _read(self, f, offset, repository):
+        f.seek(offset)
+        byte = f.read(1)[0]
+        typeCode = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = f.read(1)[0]
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        if typeCode == _OFS_DELTA:
+            byte = f.read(1)[0]
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = f.read(1)[0]
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            baseOffset = offset - distance
+            start = f.tell()
+            objectType, base = self._read(f, baseOffset, repository)
+            f.seek(start)
+        elif typeCode == _REF_DELTA:
+            baseSha = f.read(20).hex()
+            start = f.tell()
+            objectType, base = repository.readObject(baseSha)
+            f.seek(start)
+        elif typeCode in _OBJECT_TYPES:
+            return _OBJECT_TYPES[typeCode], self._inflate(f, size)
+        else:
+            raise _Unsupported("unknown object type %d in %s" % (typeCode, self.packName))
+        return objectType, _applyDelta(base, self._inflate(f, size))
+
+    def _inflate(self, f, size):
+        inflater = zlib.decompressobj()
+        chunks = []
+        produced = 0
+        while produced < size and not inflater.eof:
+            chunk = f.read(65536)
+            if not chunk:
+                break
+            out = inflater.decompress(chunk)
+            chunks.append(out)
+            produced += len(out)
+        data = b"".join(chunks)
+        if len(data) != size:
+            raise _Unsupported("truncated object in %s" % self.packName)
+        return data
+
+
+def _applyDelta(base, delta):
+    """Apply a git delta to base, returning the result"""
+    pos = 0
+    for _ in range(2):  # skip the base and result sizes
+        while delta[pos] & 0x80:
+            pos += 1
+        pos += 1
+    out = []
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8*i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8*i)
+                    pos += 1
+            out.append(base[offset:offset + (size or 0x10000)])
+        elif op:
+            out.append(delta[pos:pos + op])
+            pos += op
+        else:
+            raise _Unsupported("invalid delta")
+    return b"".join(out)
@@ -1,12 +1,21 @@
 #
-# A simple python interface to hg (Mercurial), using os.popen
+# A simple python interface to hg (Mercurial)
 # Based on the svn interface.
 #
+# Queries are sent to a single Mercurial command server ("hg serve --cmdserver pipe") per
+# working directory, so hg's startup cost is paid once per build; if the command server can't
+# be used, hg is run directly.  The identity of the working directory is only queried once.
+#
 # If ever we want to do anything clever, we should use one of
 # the supported svn/python packages
 #
 import os
 import re
+import time
+import atexit
+import struct
+import threading
+import subprocess
 from .. import state
 from .. import utils
 
@@ -18,7 +27,7 @@ def guessVersionName():
         state.log.warn("Cannot guess version without .hg directory; will be set to '%s'." % version)
         return version
 
-    idents = utils.runExternal("hg id", fatal=True)
+    idents = identify()
     ident = re.split(r"\s+", idents)
     if len(ident) == 0:
         raise RuntimeError("Unable to determine hg version")
@@ -48,13 +57,140 @@ def guessFingerprint():
     if not os.path.exists(".hg"):
         state.log.warn("Cannot guess fingerprint without .hg directory; will be set to '%s'." % fingerprint)
     else:
-        idents = utils.runExternal("hg id", fatal=True)
+        idents = identify()
         ident = re.split(r"\s+", idents)
         if len(ident) == 0:
             raise RuntimeError("Unable to determine hg version")
 
-        fingerprint = utils.runExternal("hg ident --id", fatal=True).strip()
+        # the first word of "hg id" is what "hg id --id" prints
+        fingerprint = ident[0]
         if re.search(r"\+", ident[0]):
             modified = True
 
     return fingerprint, modified
+
+
+_IDENTITIES = {}
+_IDENTITIES_LOCK = threading.Lock()
+
+
+def identify():
+    """Return the output of "hg id" for the current directory, running it at most once"""
+    cwd = os.getcwd()
+    with _IDENTITIES_LOCK:
+        if cwd not in _IDENTITIES:
+            _IDENTITIES[cwd] = run("id")
+        return _IDENTITIES[cwd]
+
+
+def run(*args):
+    """Run an hg command in the current directory, returning its output"""
+    server = CommandServer.get()
+    if server is not None:
+        start = time.perf_counter()
+        try:
+            code, out, err = server.runCommand(args)
+        except (OSError, RuntimeError) as e:
+            state.log.info("Mercurial command server failed (%s); running hg directly" % e)
+            CommandServer.disable()
+        else:
+            utils.EXTERNAL_COMMANDS.record("hg %s (command server)" % args[0], time.perf_counter() - start)
+            if code != 0:
+                raise RuntimeError("Error running hg %s: %s" % (" ".join(args), err.strip()))
+            return out.strip()
+    return utils.runExternal(["hg"] + list(args), fatal=True, msg="Error running hg %s" % " ".join(args))
+
+
+class CommandServer:
+    """A Mercurial command server running in a working directory.
+
+    Speaks the pipe protocol of "hg serve --cmdserver pipe": each command is sent as
+    "runcommand\\n" and its NUL-separated arguments, and the server answers on output ("o"),
+    error ("e") and result ("r") channels.  get() returns the server for the current directory,
+    starting it on first use; servers are shut down at exit.
+    """
+
+    _servers = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        cwd = os.getcwd()
+        with cls._lock:
+            if cwd not in cls._servers:
+                try:
+                    cls._servers[cwd] = cls()
+                except (OSError, RuntimeError) as e:
+                    state.log.info("Unable to start Mercurial command server (%s); running hg directly" % e)
+                    cls._servers[cwd] = None
+            return cls._servers[cwd]
+
+    @classmethod
+    def disable(cls):
+        with cls._lock:
+            server = cls._servers.get(os.getcwd())
+            cls._servers[os.getcwd()] = None
+        if server is not None:
+            server.close()
+
+    def __init__(self):
+        env = dict(os.environ, HGPLAIN="1", HGENCODING="UTF-8")
+        self.process = subprocess.Popen(["hg", "serve", "--cmdserver", "pipe"], env=env,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+        channel, hello = self._readChannel()
+        fields = dict(line.split(": ", 1) for line in hello.decode().splitlines() if ": " in line)
+        if channel != b"o" or "runcommand" not in fields.get("capabilities", "").split():
+            self.close()
+            raise RuntimeError("unexpected greeting from hg command server")
+        self.encoding = fields.get("encoding", "UTF-8")
+
+    def _read(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.process.stdout.read(size - len(data))
+            if not chunk:
+                raise RuntimeError("hg command server exited")
+            data += chunk
+        return data
+
+    def _readChannel(self):
+        channel, length = struct.unpack(">cI", self._read(5))
+        if channel in (b"I", b"L"):
+            return channel, length  # input requests carry the size wanted, not data
+        return channel, self._read(length)
+
+    def runCommand(self, args):
+        """Run an hg command, returning (exit code, output, error output)"""
+        data = "\0".join(args).encode(self.encoding)
+        with self.lock:
+            self.process.stdin.write(b"runcommand\n" + struct.pack(">I", len(data)) + data)
+            self.process.stdin.flush()
+            out = []
+            err = []
+            while True:
+                channel, payload = self._readChannel()
+                if channel == b"o":
+                    out.append(payload)
+                elif channel == b"e":
+                    err.append(payload)
+                elif channel == b"r":
+                    code, = struct.unpack(">i", payload)
+                    return code, b"".join(out).decode(self.encoding), b"".join(err).decode(self.encoding)
+                elif channel in (b"I", b"L"):
+                    # we never have input to give; an empty reply is end-of-file
+                    self.process.stdin.write(struct.pack(">I", 0))
+                    self.process.stdin.flush()
+                elif channel.isupper():
+                    raise RuntimeError("unsupported hg command server channel %r" % channel)
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
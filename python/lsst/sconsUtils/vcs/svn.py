@@ -1,5 +1,8 @@
 #
-# A simple python interface to svn, using os.popen
+# A simple python interface to svn
+#
+# Each working copy path is queried with a single "svn info --xml" (and the working copy
+# with a single "svnversion") per run; the results are parsed with ElementTree and cached.
 #
 # If ever we want to do anything clever, we should use one of
 # the supported svn/python packages
@@ -7,30 +10,62 @@
 import os
 import re
 import sys
+import functools
+import xml.etree.ElementTree as ElementTree
+from .. import utils
+
+
+def _run(cmd):
+    """Run an svn command, returning its output; raise RuntimeError with svn's message on failure"""
+    return utils.runExternal(cmd, fatal=True, msg="%s failed" % " ".join(cmd))
+
+
+@functools.lru_cache(maxsize=None)
+def _info(path):
+    try:
+        output = _run(["svn", "info", "--xml", path])
+    except RuntimeError as e:
+        if "E155007" in str(e) or "is not a working copy" in str(e):
+            return None
+        raise
+    entry = ElementTree.fromstring(output).find("entry")
+    if entry is None:
+        raise RuntimeError("Unexpected output from svn info --xml %s" % path)
+
+    def text(tag):
+        element = entry.find(tag)
+        return element.text if element is not None else None
+
+    commit = entry.find("commit")
+    info = {
+        "Path": entry.get("path"),
+        "Node Kind": entry.get("kind"),
+        "Revision": entry.get("revision"),
+        "URL": text("url"),
+        "Relative URL": text("relative-url"),
+        "Repository Root": text("repository/root"),
+        "Repository UUID": text("repository/uuid"),
+        "Last Changed Rev": commit.get("revision") if commit is not None else None,
+        "Last Changed Author": text("commit/author"),
+        "Last Changed Date": text("commit/date"),
+    }
+    return {k: v for k, v in info.items() if v is not None}
 
 
 def isSvnFile(file):
     """Is file under svn control?"""
 
-    return re.search(r"is not a working copy",
-                     "".join(os.popen("svn info %s 2>&1" % file).readlines())) is None
+    return _info(os.path.abspath(file)) is not None
 
 
 def getInfo(file="."):
-    """Return a dictionary of all the information returned by "svn info" for the specified file"""
+    """Return a dictionary of the information returned by "svn info" for the specified file"""
 
-    if not isSvnFile(file):
+    info = _info(os.path.abspath(file))
+    if info is None:
         raise RuntimeError("%s is not under svn control" % file)
 
-    infoList = os.popen("svn info %s" % file).readlines()
-
-    info = {}
-    for line in infoList:
-        mat = re.search(r"^([^:]+)\s*:\s*(.*)", line)
-        if mat:
-            info[mat.group(1)] = mat.group(2)
-
-    return info
+    return dict(info)
 
 
 def isTrunk(file="."):
@@ -41,6 +76,11 @@ def isTrunk(file="."):
     return re.search(r"/trunk($|/)", info["URL"]) is not None
 
 
+@functools.lru_cache(maxsize=None)
+def _svnversion(path):
+    return _run(["svnversion", path]).strip()
+
+
 def revision(file=None, lastChanged=False):
     """Return file's Revision as a string; if file is None return
     a tuple (oldestRevision, youngestRevision, flags) as reported
@@ -59,28 +99,26 @@ def revision(file=None, lastChanged=False):
     if lastChanged:
         raise RuntimeError("lastChanged makes no sense if file is None")
 
-    res = os.popen("svnversion . 2>&1").readline()
+    res = _svnversion(os.path.abspath("."))
 
-    if res == "exported\n":
+    if res == "exported" or res.startswith("Unversioned"):
         raise RuntimeError("No svn revision information is available")
 
-    versionRe = r"^(?P<oldest>\d+)(:(?P<youngest>\d+))?(?P<flags>[MS]*)"
+    versionRe = r"^(?P<oldest>\d+)(:(?P<youngest>\d+))?(?P<flags>[MSP]*)$"
     mat = re.search(versionRe, res)
     if mat:
         matches = mat.groupdict()
+        flags = tuple(f for f in matches["flags"] if f in "MS")
         if not matches["youngest"]:
-            matches["youngest"] = matches["oldest"]
-            # OK, we have only one revision present.  Find the newest revision
-            # that actually changed anything in this product and ignore "oldest" (#522)
-            res = os.popen("svnversion --committed . 2>&1").readline()
-            mat = re.search(versionRe, res)
-            if mat:
-                matches = mat.groupdict()
-                return matches["youngest"], matches["youngest"], tuple(matches["flags"])
-
-        return matches["oldest"], matches["youngest"], tuple(matches["flags"])
-
-    raise RuntimeError("svnversion returned unexpected result \"%s\"" % res[:-1])
+            # OK, we have only one revision present.  Use the newest revision that actually
+            # changed anything in this product and ignore "oldest" (#522); for a single-revision
+            # working copy that is the last changed revision of its root.
+            lastChangedRev = getInfo(".").get("Last Changed Rev", matches["oldest"])
+            return lastChangedRev, lastChangedRev, flags
+
+        return matches["oldest"], matches["youngest"], flags
+
+    raise RuntimeError("svnversion returned unexpected result \"%s\"" % res)
 
 
 #
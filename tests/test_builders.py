@@ -0,0 +1,178 @@
+"""
+Tests for the environment methods in builders.py that set up library sources
+
+Run with:
+   python test_builders.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+try:
+    import SCons.Script
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    from lsst.sconsUtils import builders, state  # noqa F401 (builders adds the methods tested)
+
+
+class EnvironmentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.env = SCons.Script.Environment(tools=["default"], CCFLAGS=["-O2"])
+        # state.env is only needed for its Flatten method and compiler name
+        self.env.whichCc = "gcc"
+        patcher = unittest.mock.patch.dict(state.__dict__, {"env": self.env})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def files(self, *names):
+        nodes = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("int %s() { return 0; }\n" % os.path.splitext(os.path.basename(name))[0])
+            nodes.append(self.env.File(path))
+        return nodes
+
+    def includes(self, batch):
+        """Return the sources #included by a batch, relative to the test directory."""
+        directory = os.path.dirname(batch.abspath)
+        lines = batch.sources[0].read().splitlines()
+        self.assertTrue(lines[0].startswith("//"))
+        return [os.path.relpath(os.path.join(directory, line.split('"')[1]), self.root) for line in lines[1:]]
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class UnityBatchesTestCase(EnvironmentTestCase):
+
+    def batches(self, files, batchSize, directory="unity"):
+        batches = self.env.UnityBatches(files, batchSize, os.path.join(self.root, directory))
+        return [(os.path.basename(batch.path), self.includes(batch)) for batch in batches]
+
+    def testSplitting(self):
+        files = self.files("src/d.cc", "src/b.cc", "src/a.cc", "src/c.cc", "src/e.cc", "src/x.c",
+                           "src/sub/z.cc")
+        batches = self.batches(files, 2)
+        stem = [name for name, includes in batches if name.endswith("_c_0.c")][0][:-len("_c_0.c")]
+        self.assertEqual(batches, [
+            (stem + "_c_0.c", ["src/x.c"]),
+            (stem + "_cc_0.cc", ["src/a.cc", "src/b.cc"]),
+            (stem + "_cc_1.cc", ["src/c.cc", "src/d.cc"]),
+            (stem + "_cc_2.cc", ["src/e.cc"]),
+            (stem + "_sub_cc_0.cc", ["src/sub/z.cc"]),
+        ])
+        # the batches don't depend on the order the sources are given in
+        self.assertEqual(self.batches(list(reversed(files)), 2, "unity2"), batches)
+
+    def testAddedFile(self):
+        # a new file only changes the batches from its position on
+        before = self.batches(self.files("a.cc", "b.cc", "d.cc", "e.cc"), 2)
+        after = self.batches(self.files("a.cc", "b.cc", "c.cc", "d.cc", "e.cc"), 2, "unity2")
+        self.assertEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+        self.assertEqual(len(after), 3)
+
+    def objectSources(self, objs):
+        """Return the sources compiled into each object, as (includes, CCFLAGS) pairs."""
+        result = []
+        for obj in self.env.Flatten(objs):
+            source = obj.sources[0]
+            if source.has_builder() and source.builder.action is not None and source.sources:
+                names = self.includes(source)
+            else:
+                names = [os.path.relpath(source.abspath, self.root)]
+            ccflags = obj.get_build_env()["CCFLAGS"]
+            result.append((names, ccflags if isinstance(ccflags, str) else " ".join(ccflags)))
+        return sorted(result)
+
+    def testExclusion(self):
+        files = self.files("a.cc", "b.cc", "c.cc", "d.cc", "e.cc")
+        objs = self.env.SourcesForSharedLibrary(files, unity=3, unityExclude=("b.cc",),
+                                                unityDir=os.path.join(self.root, "unity"))
+        self.assertEqual(self.objectSources(objs), [
+            (["a.cc", "c.cc", "d.cc"], "-O2"),
+            (["b.cc"], "-O2"),
+            (["e.cc"], "-O2"),
+        ])
+
+    def testOwnFlags(self):
+        # files with flags of their own are compiled alone
+        self.env["noOptFiles"] = "c.cc"
+        files = self.files("a.cc", "b.cc", "c.cc")
+        objs = self.env.SourcesForSharedLibrary(files, unity=4, unityDir=os.path.join(self.root, "unity"))
+        self.assertEqual(self.objectSources(objs), [(["a.cc", "b.cc"], "-O2"), (["c.cc"], "-O0 ")])
+
+    def testNoUnity(self):
+        files = self.files("a.cc", "b.cc")
+        for unity in (0, 1):
+            objs = self.env.SourcesForSharedLibrary(files, unity=unity)
+            self.assertEqual(self.objectSources(objs), [(["a.cc"], "-O2"), (["b.cc"], "-O2")])
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class PrecompiledHeaderTestCase(EnvironmentTestCase):
+
+    def setUp(self):
+        EnvironmentTestCase.setUp(self)
+        # keep the nodes made by one test from being reused by the next
+        patcher = unittest.mock.patch.dict(builders._PRECOMPILED_HEADERS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testFlags(self):
+        self.env.Replace(SHCXXFLAGS=["-fPIC"], CXXFLAGS=["-std=c++14"])
+        overrides, nodes = self.env.UsePrecompiledHeader("Eigen/Core", LIBS=["m"])
+        self.assertEqual([os.path.basename(node.path) for node in nodes], ["pch.h", "pch.h.gch"])
+        self.assertEqual(overrides, {"LIBS": ["m"], "SHCXXFLAGS": ["-fPIC", "-include", nodes[0].path]})
+        # C++ only, so C sources compiled with the same overrides are unaffected
+        self.assertNotIn("-include", self.env["CCFLAGS"] + self.env["CXXFLAGS"])
+        overrides, programNodes = self.env.UsePrecompiledHeader("Eigen/Core", shared=False)
+        self.assertEqual(overrides, {"CXXFLAGS": ["-std=c++14", "-include", programNodes[0].path]})
+        self.assertNotEqual(programNodes, nodes)
+        # a source's own flags are kept
+        overrides, nodes = self.env.UsePrecompiledHeader("Eigen/Core", SHCXXFLAGS="-fPIC -DFOO")
+        self.assertEqual(overrides["SHCXXFLAGS"], ["-fPIC", "-DFOO", "-include", nodes[0].path])
+
+    def testSharing(self):
+        first = self.env.UsePrecompiledHeader(["Eigen/Core", "vector"])[1]
+        self.assertEqual(self.env.UsePrecompiledHeader(["Eigen/Core", "vector"])[1], first)
+        self.assertNotEqual(self.env.UsePrecompiledHeader(["Eigen/Core"])[1], first)
+        self.assertNotEqual(self.env.UsePrecompiledHeader(["Eigen/Core", "vector"], CCFLAGS=["-O0"])[1],
+                            first)
+        self.assertEqual(first[0].sources[0].read().splitlines()[1:],
+                         ["#include <Eigen/Core>", "#include <vector>"])
+
+    def testUnsupportedCompiler(self):
+        self.env.whichCc = "unknown"
+        with state.log.capture():
+            self.assertEqual(self.env.UsePrecompiledHeader("Eigen/Core", LIBS=["m"]), ({"LIBS": ["m"]}, []))
+        self.assertEqual(self.env.UsePrecompiledHeader(None), ({}, []))
+
+    def testSources(self):
+        files = self.files("a.cc", "b.c")
+        objs = self.env.Flatten(self.env.SourcesForSharedLibrary(files, pch="Eigen/Core"))
+        cc, c = sorted(objs, key=lambda obj: obj.sources[0].suffix, reverse=True)
+        pch = self.env.UsePrecompiledHeader("Eigen/Core")[1]
+        self.assertIn("-include", cc.get_build_env()["SHCXXFLAGS"])
+        self.assertTrue(set(pch) <= set(cc.depends))
+        self.assertNotIn("-include", c.get_build_env().subst("$SHCCFLAGS $SHCFLAGS $SHCXXFLAGS"))
+        self.assertFalse(set(pch) & set(c.depends))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Tests for the per-file compile flags read from ups/compileFlags.ini
+
+Run with:
+   python test_compileFlags.py
+or by typing
+   pytest
+"""
+
+import os
+import unittest
+import importlib.util
+
+# compileFlags.py doesn't depend on SCons, so load it without importing the package
+spec = importlib.util.spec_from_file_location(
+    "compileFlags", os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir,
+                                 "python", "lsst", "sconsUtils", "compileFlags.py"))
+overlays = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(overlays)
+
+text = """
+# hot loops
+[src/kernels/*.cc]
+add = -O3 -march=native -ffast-math
+
+[src/**/slow?.cc]
+remove = -O* -g
+add = -O1
+
+[src/kernels/noFastMath.cc]
+remove = -ffast-math
+"""
+
+ccflags = ["-g", "-O2", "-Wall"]
+
+
+class CompileFlagOverlayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.overlay = overlays.CompileFlagOverlay(text)
+
+    def testUnmatched(self):
+        self.assertIsNone(self.overlay.apply("src/other.cc", ccflags))
+        self.assertIsNone(self.overlay.apply("src/kernels/sub/deep.cc", ccflags))
+
+    def testAdd(self):
+        self.assertEqual(self.overlay.apply("src/kernels/dot.cc", ccflags),
+                         ["-g", "-Wall", "-O3", "-march=native", "-ffast-math"])
+
+    def testRemove(self):
+        self.assertEqual(self.overlay.apply("src/io/fits/slow1.cc", ccflags), ["-Wall", "-O1"])
+        self.assertEqual(self.overlay.apply("src/slow2.cc", ccflags), ["-Wall", "-O1"])
+
+    def testLaterSectionsWin(self):
+        self.assertEqual(self.overlay.apply("src/kernels/noFastMath.cc", ccflags),
+                         ["-g", "-Wall", "-O3", "-march=native"])
+        self.assertEqual(self.overlay.apply("src/kernels/slowA.cc", ccflags),
+                         ["-Wall", "-march=native", "-ffast-math", "-O1"])
+
+    def testErrors(self):
+        with self.assertRaises(ValueError):
+            overlays.CompileFlagOverlay("[src/*.cc]\nflags = -O3\n")
+        with self.assertRaises(ValueError):
+            overlays.CompileFlagOverlay("add = -O3\n")
+
+    def testMissingFile(self):
+        self.assertIsNone(overlays.CompileFlagOverlay.read("/nonexistent/compileFlags.ini"))
+
+
+if __name__ == "__main__":
+    unittest.main()
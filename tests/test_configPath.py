@@ -0,0 +1,193 @@
+"""
+Tests for finding and loading the .cfg files on the configuration search path
+
+Run with:
+   python test_configPath.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    from lsst.sconsUtils import dependencies, state
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def write(self, name, content=""):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class ConfigPathIndexTestCase(TempDirTestCase):
+
+    def testSearchPath(self):
+        a, b = self.path("a"), self.path("b")
+        cfgPath = [a, b + "/", a, b, self.path("b", "..", "a")]
+        self.assertEqual(dependencies.ConfigPathIndex.searchPath(cfgPath), [a, b])
+
+    def testFind(self):
+        first = self.write(os.path.join("a", "foo.cfg"))
+        second = self.write(os.path.join("b", "foo.cfg"))
+        bar = self.write(os.path.join("b", "bar.cfg"))
+        self.write(os.path.join("b", "notes.txt"))
+        os.makedirs(self.path("b", "dir.cfg"))
+        index = dependencies.ConfigPathIndex([self.path("b"), self.path("missing"), self.path("a"),
+                                              self.path("b")])
+        self.assertEqual(index.path, [self.path("b"), self.path("missing"), self.path("a")])
+        self.assertEqual(list(index.find("foo")), [second, first])
+        self.assertEqual(list(index.find("bar")), [bar])
+        self.assertIn("bar", index)
+        for name in ("baz", "dir", "notes"):
+            self.assertNotIn(name, index)
+            self.assertEqual(list(index.find(name)), [])
+
+    def testNewFiles(self):
+        # each PackageTree makes its own index, which sees the files present when it's created
+        cfgPath = [self.path("a"), self.path("b")]
+        os.makedirs(self.path("a"))
+        self.assertNotIn("foo", dependencies.ConfigPathIndex(cfgPath))
+        foo = self.write(os.path.join("b", "foo.cfg"))
+        self.assertEqual(list(dependencies.ConfigPathIndex(cfgPath).find("foo")), [foo])
+        shadow = self.write(os.path.join("a", "foo.cfg"))
+        self.assertEqual(list(dependencies.ConfigPathIndex(cfgPath).find("foo")), [shadow, foo])
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class WalkConfigPathTestCase(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        patcher = unittest.mock.patch.dict(os.environ, {"SCONSUTILS_CACHE_ROOT": self.path("cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in ("a", "a/b", "a/.hidden", "a/CVS", "other"):
+            os.makedirs(self.path("cfg", name))
+
+    def walk(self, *roots):
+        with unittest.mock.patch.object(state, "_walkConfigRoot", wraps=state._walkConfigRoot) as walkRoot:
+            result = state._walkConfigPath([self.path(root) for root in roots])
+        return result, walkRoot.call_count
+
+    def testWalk(self):
+        expected = [self.path("cfg"), self.path("cfg", "a"), self.path("cfg", "a", "b"),
+                    self.path("cfg", "other")]
+        self.assertEqual(self.walk("cfg"), (expected, 1))
+        self.assertTrue(os.path.exists(self.path("cache", state._CFG_WALK_CACHE_FILE)))
+        self.assertEqual(self.walk("cfg"), (expected, 0))
+
+    def testNewDirectory(self):
+        self.walk("cfg")
+        os.makedirs(self.path("cfg", "a", "b", "c"))
+        result, walked = self.walk("cfg")
+        self.assertIn(self.path("cfg", "a", "b", "c"), result)
+        self.assertEqual(walked, 1)
+
+    def testRemovedDirectory(self):
+        self.walk("cfg")
+        os.rmdir(self.path("cfg", "other"))
+        result, walked = self.walk("cfg")
+        self.assertNotIn(self.path("cfg", "other"), result)
+        self.assertEqual(walked, 1)
+
+    def testNewRoot(self):
+        self.assertEqual(self.walk("new"), ([], 1))
+        self.assertEqual(self.walk("new"), ([], 0))
+        os.makedirs(self.path("new", "x"))
+        self.assertEqual(self.walk("new"), ([self.path("new"), self.path("new", "x")], 1))
+
+    def testRoots(self):
+        # each root is cached separately
+        self.walk("cfg")
+        result, walked = self.walk("new", "cfg")
+        self.assertEqual(result[0], self.path("cfg"))
+        self.assertEqual(walked, 1)
+
+    def testUnusableCache(self):
+        self.write("cache")  # a file, so the cache directory can't be created
+        self.assertEqual(self.walk("cfg")[1], 1)
+        self.assertEqual(self.walk("cfg")[1], 1)
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class ConfigurationLoaderTestCase(TempDirTestCase):
+
+    MODULE_NAME = "lsst.sconsUtils.tests.configurationLoader"
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        patcher = unittest.mock.patch.dict(os.environ, {"SCONSUTILS_CACHE_ROOT": self.path("cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(sys.modules.pop, self.MODULE_NAME, None)
+        self.filename = self.write(os.path.join("ups", "foo.cfg"), "value = 1\n")
+
+    def load(self):
+        module, loader = dependencies.loadConfigurationModule(self.MODULE_NAME, self.filename)
+        return module.value, loader.cacheHit
+
+    def cacheFiles(self):
+        return os.listdir(self.path("cache", "cfg"))
+
+    def testCache(self):
+        self.assertEqual(self.load(), (1, False))
+        self.assertEqual(len(self.cacheFiles()), 1)
+        self.assertEqual(self.load(), (1, True))
+
+    def testModified(self):
+        self.load()
+        self.write(os.path.join("ups", "foo.cfg"), "value = 22\n")
+        self.assertEqual(self.load(), (22, False))
+        self.assertEqual(self.load(), (22, True))
+        self.assertEqual(len(self.cacheFiles()), 1)
+
+    def testTouched(self):
+        # the same size, so only the mtime shows the change
+        self.load()
+        self.write(os.path.join("ups", "foo.cfg"), "value = 2\n")
+        st = os.stat(self.filename)
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        self.assertEqual(self.load(), (2, False))
+
+    def testCorruptCache(self):
+        self.load()
+        cacheFile = self.path("cache", "cfg", self.cacheFiles()[0])
+        with open(cacheFile, "r+b") as f:
+            f.truncate(os.path.getsize(cacheFile) - 4)
+        self.assertEqual(self.load(), (1, False))
+        self.assertEqual(self.load(), (1, True))
+
+    def testUnusableCache(self):
+        self.write("cache")  # a file, so the cache directory can't be created
+        self.assertEqual(self.load(), (1, False))
+        self.assertEqual(self.load(), (1, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
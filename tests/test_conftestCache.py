@@ -0,0 +1,130 @@
+"""
+Tests for the shared cache of configuration test results (--conftest-cache)
+
+Run with:
+   python test_conftestCache.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    import SCons.Environment
+    from lsst.sconsUtils import dependencies, state
+    from lsst.sconsUtils.cacheStore import CacheStore
+
+FLAG_SOURCE = "int main(int argc, char **argv) { return 0; }"
+HEADER_SOURCE = "#include <foo/foo.h>\nint main(int argc, char **argv) { return 0; }"
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class ConftestCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.compiler = os.path.join(self.root, "bin", "c++")
+        os.makedirs(os.path.dirname(self.compiler))
+        with open(self.compiler, "w") as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(self.compiler, 0o755)
+        # the key includes the compiler version that _configureCommon leaves in state.env
+        self.stateEnv = unittest.mock.Mock(ccVersion="1.0")
+        patcher = unittest.mock.patch.dict(state.__dict__, {"env": self.stateEnv})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def makeEnv(self, package="a", **kwargs):
+        env = SCons.Environment.Environment(tools=["default"], CXX=self.compiler, LINK=self.compiler,
+                                            CXXFLAGS=["-std=c++14"], CCFLAGS=["-O2"])
+        env.Append(CPPPATH=[os.path.join(self.root, package, "include")],
+                   LIBPATH=[os.path.join(self.root, package, "lib")])
+        env.Append(**kwargs)
+        return env
+
+    def key(self, env, kind="compile", source=FLAG_SOURCE, extension=".cc"):
+        return dependencies.ConftestCache.key(env, kind, source, extension)
+
+    def testSharedBetweenPackages(self):
+        a, b = self.makeEnv("a"), self.makeEnv("b")
+        self.assertEqual(self.key(a), self.key(b))
+        self.assertEqual(self.key(a, "link"), self.key(b, "link"))
+        # the include and library paths matter to tests that use them
+        self.assertNotEqual(self.key(a, source=HEADER_SOURCE), self.key(b, source=HEADER_SOURCE))
+        a.Append(LIBS=["foo"])
+        b.Append(LIBS=["foo"])
+        self.assertNotEqual(self.key(a, "link"), self.key(b, "link"))
+
+    def testInvalidation(self):
+        env = self.makeEnv()
+        key = self.key(env)
+        self.assertEqual(self.key(self.makeEnv()), key)
+        self.assertNotEqual(self.key(self.makeEnv(CCFLAGS=["-fPIC"])), key)
+        self.assertNotEqual(self.key(self.makeEnv(CPPDEFINES=["FOO"])), key)
+        self.assertNotEqual(self.key(env, source=FLAG_SOURCE + "\n"), key)
+        self.assertNotEqual(self.key(env, kind="link"), key)
+        self.assertNotEqual(self.key(env, extension=".c"), key)
+        self.stateEnv.ccVersion = "2.0"
+        self.assertNotEqual(self.key(env), key)
+        self.stateEnv.ccVersion = "1.0"
+        # a new compiler at the same path
+        st = os.stat(self.compiler)
+        os.utime(self.compiler, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        self.assertNotEqual(self.key(env), key)
+
+    def testTryBuild(self):
+        store = CacheStore(os.path.join(self.root, "cache"))
+        patcher = unittest.mock.patch.object(dependencies.ConftestCache, "_store", store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def context(env):
+            return unittest.mock.Mock(env=env, sconf=unittest.mock.Mock(cached=0),
+                                      TryCompile=unittest.mock.Mock(return_value=1))
+
+        first, second = context(self.makeEnv("a")), context(self.makeEnv("b"))
+        self.assertEqual(dependencies.ConftestCache.tryBuild(first, "compile", FLAG_SOURCE, ".cc"), 1)
+        first.TryCompile.assert_called_once_with(FLAG_SOURCE, ".cc")
+        self.assertEqual(first.sconf.cached, 0)
+        self.assertEqual(dependencies.ConftestCache.tryBuild(second, "compile", FLAG_SOURCE, ".cc"), 1)
+        second.TryCompile.assert_not_called()
+        self.assertEqual(second.sconf.cached, 1)
+        third = context(self.makeEnv("a", CCFLAGS=["-fPIC"]))
+        third.TryCompile.return_value = 0
+        self.assertEqual(dependencies.ConftestCache.tryBuild(third, "compile", FLAG_SOURCE, ".cc"), 0)
+        third.TryCompile.assert_called_once_with(FLAG_SOURCE, ".cc")
+
+    def testUnusableStore(self):
+        with open(os.path.join(self.root, "cache"), "w"):
+            pass  # a file, so the cache directory can't be created
+        env = self.makeEnv()
+        environ = {"SCONSUTILS_CACHE_ROOT": os.path.join(self.root, "cache")}
+        options = {"conftestCache": True}
+        with unittest.mock.patch.dict(os.environ, environ), \
+                unittest.mock.patch.multiple(dependencies.ConftestCache, _store=None, _registered=True,
+                                             _unusable=False), \
+                unittest.mock.patch.object(env, "GetOption", side_effect=options.get), \
+                state.log.capture() as messages:
+            self.assertIsNone(dependencies.ConftestCache.getStore(env))
+            self.assertIsNone(dependencies.ConftestCache.getStore(env))
+        self.assertEqual(len(messages), 1)
+        self.assertIn("Shared conftest cache disabled", messages[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests for the coalesced --checkDependencies checks
+
+Run with:
+   python test_dependencyChecks.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+import concurrent.futures
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    import SCons.Environment
+    from lsst.sconsUtils import dependencies, state
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class DependencyCheckerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.env = SCons.Environment.Environment(tools=["default"],
+                                                 CONFIGUREDIR=os.path.join(self.root, "sconf"))
+        patcher = unittest.mock.patch.object(self.env, "GetOption", return_value=2)  # num_jobs
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checker(self, headers=(), libs=()):
+        checker = dependencies.DependencyChecker(self.env)
+        for name, header in headers:
+            checker.add(name, [header], [])
+        for name, lib in libs:
+            checker.add(name, [], [lib])
+        return checker
+
+    def testBisect(self):
+        calls = []
+
+        def check(index, items):
+            calls.append(items)
+            bad = [item for item in items if item.startswith("bad")]
+            return not bad, "failed: %s" % " ".join(bad)
+
+        items = ["ok%d" % i for i in range(8)]
+        items[2], items[7] = "bad2", "bad7"
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            failures = self.checker()._bisect(pool, [(check, items)])
+        self.assertEqual(failures, [(check, "bad2", "failed: bad2"), (check, "bad7", "failed: bad7")])
+        self.assertEqual(calls[0], items)
+        # halves that pass aren't split any further
+        self.assertEqual(len(calls), 1 + 2 + 4 + 4)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(self.checker()._bisect(pool, [(check, ["ok0", "ok1"])]), [])
+
+    def testNothingToCheck(self):
+        self.assertEqual(self.checker().run(), [])
+
+    @unittest.skipIf(shutil.which("g++") is None, "g++ is not available")
+    def testRun(self):
+        include = os.path.join(self.root, "include")
+        os.makedirs(include)
+        for name, content in (("good.h", "inline int good() { return 1; }\n"),
+                              ("other.h", "#include \"good.h\"\n"),
+                              ("broken.h", "#error broken\n")):
+            with open(os.path.join(include, name), "w") as f:
+                f.write(content)
+        self.env.Append(CPPPATH=[include])
+        checker = self.checker(headers=[("a", "good.h"), ("b", "broken.h"), ("c", "other.h")],
+                               libs=[("d", "m"), ("c", "noSuchLibraryForTesting")])
+        with state.log.capture() as messages:
+            failed = checker.run()
+        self.assertEqual(failed, ["b", "c"])
+        # the failures are reported in the order the bisection finds them
+        warnings = sorted(message.splitlines()[0] for message, file, verboseOnly in messages
+                          if not verboseOnly)
+        self.assertEqual(warnings, ["Package b: header broken.h failed its check:",
+                                    "Package c: library noSuchLibraryForTesting failed its check:"])
+        # the scratch directory is removed
+        self.assertEqual(os.listdir(os.path.join(self.root, "sconf")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
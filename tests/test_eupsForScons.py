@@ -0,0 +1,82 @@
+"""
+Tests for eupsForScons.SetupProductResolver
+
+Run with:
+   python test_eupsForScons.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import types
+import unittest
+import unittest.mock
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    from lsst.sconsUtils import eupsForScons
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class SetupProductResolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.eups = unittest.mock.Mock()
+        self.eups.getSetupProducts.return_value = [
+            types.SimpleNamespace(name="bulk", version="2.0", dir="/eups/bulk"),
+        ]
+        self.eups.findSetupVersion.return_value = ("1.0", None, "/eups/single", None, "Linux")
+        environ = {"SETUP_ENVIRON": "environ 3.0 -f Linux", "ENVIRON_DIR": "/env/environ",
+                   "OTHER_DIR": "/env/other"}
+        for patcher in (unittest.mock.patch.dict(os.environ, environ, clear=True),
+                        unittest.mock.patch.object(eupsForScons, "getEups", return_value=self.eups),
+                        unittest.mock.patch.object(eupsForScons, "productDir",
+                                                   side_effect=lambda name: "/dir/%s" % name)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def resolver(self, haveEups):
+        patcher = unittest.mock.patch.object(eupsForScons, "haveEups", return_value=haveEups)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        resolver = eupsForScons.SetupProductResolver()
+        resolver.prefill()
+        return resolver
+
+    def testEnvironment(self):
+        resolver = self.resolver(True)
+        self.assertEqual(resolver.find("environ"), ("3.0", "/env/environ"))
+        self.assertEqual(resolver.find("bulk"), ("2.0", "/eups/bulk"))
+        self.eups.getSetupProducts.assert_called_once_with()
+        self.eups.findSetupVersion.assert_not_called()
+
+    def testBulkMiss(self):
+        resolver = self.resolver(True)
+        self.assertEqual(resolver.find("other"), (None, "/dir/other"))
+        self.eups.findSetupVersion.assert_not_called()
+
+    def testNoBulkQuery(self):
+        self.eups.getSetupProducts.side_effect = RuntimeError("too old")
+        resolver = self.resolver(True)
+        self.assertEqual(resolver.find("bulk"), ("1.0", "/eups/single"))
+        self.eups.findSetupVersion.return_value = (None, None, None, None, "Linux")
+        self.assertEqual(resolver.find("other"), (None, "/dir/other"))
+
+    def testNoEups(self):
+        resolver = self.resolver(False)
+        self.eups.findSetupVersion.return_value = (None, None, None, None, "Linux")
+        self.assertEqual(resolver.find("other"), (None, "/dir/other"))
+        self.eups.getSetupProducts.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+"""
+Tests for the in-process git metadata reader, compared with git itself
+
+Run with:
+   python test_git.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+import subprocess
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    from lsst.sconsUtils.vcs import git
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+@unittest.skipIf(shutil.which("git") is None, "git is not available")
+class GitDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workTree = tempfile.mkdtemp()
+        self.environ = dict(os.environ, HOME=self.workTree, GIT_CONFIG_NOSYSTEM="1",
+                            GIT_AUTHOR_NAME="Test", GIT_AUTHOR_EMAIL="test@example.com",
+                            GIT_COMMITTER_NAME="Test", GIT_COMMITTER_EMAIL="test@example.com")
+        self.git("init", "-q")
+        for name in ("a.txt", "b.txt"):
+            self.write(name, "%s\n" % name)
+        self.write(os.path.join("sub", "c.txt"), "c\n")
+        self.commit("first")
+
+    def tearDown(self):
+        shutil.rmtree(self.workTree, ignore_errors=True)
+
+    def git(self, *args):
+        return subprocess.check_output(("git",) + args, cwd=self.workTree, env=self.environ,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+
+    def write(self, name, content):
+        path = os.path.join(self.workTree, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def commit(self, message):
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", message)
+
+    def gitDir(self):
+        return git.GitDir(self.workTree)
+
+    def assertHeadMatches(self):
+        self.assertEqual(self.gitDir().head(), self.git("rev-parse", "HEAD"))
+
+    def assertExactTagMatches(self):
+        gitDir = self.gitDir()
+        try:
+            expected = self.git("describe", "--tags", "--exact-match")
+        except subprocess.CalledProcessError:
+            expected = None
+        self.assertEqual(gitDir.exactTag(gitDir.head()), expected)
+
+    def assertModifiedMatches(self, expected):
+        # wait out git's racy-clean window, so the stat data is trusted where git would trust it
+        time.sleep(0.01)
+        # GitDir goes first, as "git status" refreshes the stat data in the index; the user's own
+        # git configuration is kept out of its check for content filters
+        with unittest.mock.patch.dict(os.environ, {"HOME": self.workTree, "XDG_CONFIG_HOME": ""}):
+            modified = self.gitDir().isModified(self.workTree)
+        status = self.git("status", "--porcelain", "--untracked-files=no")
+        self.assertEqual(bool(status), expected, status)
+        self.assertEqual(modified, expected)
+
+    def assertObjectsMatch(self):
+        gitDir = self.gitDir()
+        objects = self.git("cat-file", "--batch-all-objects", "--batch-check").splitlines()
+        self.assertTrue(objects)
+        for line in objects:
+            sha, objectType, size = line.split()
+            data = subprocess.check_output(["git", "cat-file", objectType, sha], cwd=self.workTree,
+                                           env=self.environ)
+            self.assertEqual(gitDir.readObject(sha), (objectType, data), sha)
+
+    def testHead(self):
+        self.assertHeadMatches()
+        self.write("a.txt", "changed\n")
+        self.commit("second")
+        self.assertHeadMatches()
+        self.git("checkout", "-q", "-b", "topic")
+        self.assertHeadMatches()
+        self.git("checkout", "-q", "--detach")
+        self.assertHeadMatches()
+
+    def testPackedRefs(self):
+        self.git("tag", "light")
+        self.git("tag", "-a", "-m", "annotated", "annotated")
+        self.git("pack-refs", "--all")
+        self.assertFalse(os.path.exists(os.path.join(self.workTree, ".git", "refs", "tags", "light")))
+        self.assertHeadMatches()
+        self.assertExactTagMatches()
+        self.assertEqual(self.gitDir().exactTag(self.gitDir().head()), "annotated")
+
+    def testLightweightTags(self):
+        self.assertExactTagMatches()
+        self.git("tag", "v2")
+        self.git("tag", "v1")
+        self.assertExactTagMatches()
+        self.write("a.txt", "changed\n")
+        self.commit("second")
+        self.assertExactTagMatches()
+
+    def testAnnotatedTags(self):
+        self.git("tag", "light")
+        self.git("tag", "-a", "-m", "annotated", "zannotated")
+        self.assertExactTagMatches()
+        self.assertEqual(self.gitDir().exactTag(self.gitDir().head()), "zannotated")
+        # a tag of a tag
+        self.git("tag", "-a", "-m", "outer", "outer", "zannotated")
+        self.git("tag", "-d", "zannotated")
+        self.assertExactTagMatches()
+
+    def testDeltifiedPacks(self):
+        lines = ["line %d of a file that is mostly the same in each revision\n" % i for i in range(200)]
+        for revision in range(5):
+            lines[revision*10] = "revision %d\n" % revision
+            self.write("big.txt", "".join(lines))
+            self.commit("revision %d" % revision)
+        self.git("tag", "-a", "-m", "annotated", "annotated")
+        self.git("gc", "-q", "--aggressive")
+        packs = os.listdir(os.path.join(self.workTree, ".git", "objects", "pack"))
+        self.assertTrue(any(name.endswith(".pack") for name in packs))
+        pack = [name for name in packs if name.endswith(".idx")][0]
+        verify = self.git("verify-pack", "-v", os.path.join(".git", "objects", "pack", pack))
+        self.assertIn("chain length", verify)  # some objects are stored as deltas
+        self.assertObjectsMatch()
+        self.assertHeadMatches()
+        self.assertExactTagMatches()
+        self.assertModifiedMatches(False)
+        self.write("big.txt", "different\n")
+        self.assertModifiedMatches(True)
+
+    def testModifications(self):
+        self.assertModifiedMatches(False)
+        # touched but unchanged
+        os.utime(os.path.join(self.workTree, "a.txt"), (time.time() + 5, time.time() + 5))
+        self.assertModifiedMatches(False)
+        # modified
+        self.write("a.txt", "changed\n")
+        self.assertModifiedMatches(True)
+        # staged
+        self.git("add", "a.txt")
+        self.assertModifiedMatches(True)
+        self.git("reset", "-q", "--hard")
+        self.assertModifiedMatches(False)
+        # deleted
+        os.unlink(os.path.join(self.workTree, "sub", "c.txt"))
+        self.assertModifiedMatches(True)
+        self.git("checkout", "-q", "--", "sub")
+        self.assertModifiedMatches(False)
+        # staged deletion, and an untracked file, which doesn't count
+        self.git("rm", "-q", "b.txt")
+        self.assertModifiedMatches(True)
+        self.git("reset", "-q", "--hard")
+        self.write("untracked.txt", "new\n")
+        self.assertModifiedMatches(False)
+
+    def testIndexVersion4(self):
+        self.git("update-index", "--index-version", "4")
+        with open(os.path.join(self.workTree, ".git", "index"), "rb") as f:
+            self.assertEqual(f.read(8), b"DIRC\0\0\0\4")
+        self.assertModifiedMatches(False)
+        os.utime(os.path.join(self.workTree, "sub", "c.txt"), (time.time() + 5, time.time() + 5))
+        self.assertModifiedMatches(False)
+        self.write(os.path.join("sub", "c.txt"), "changed\n")
+        self.assertModifiedMatches(True)
+        self.git("add", "-A")
+        self.assertModifiedMatches(True)
+        self.commit("second")
+        self.assertModifiedMatches(False)
+        os.unlink(os.path.join(self.workTree, "a.txt"))
+        self.assertModifiedMatches(True)
+
+
+if __name__ == "__main__":
+    unittest.main()
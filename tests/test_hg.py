@@ -0,0 +1,145 @@
+"""
+Tests for talking to a Mercurial command server
+
+The server is a stand-in for "hg serve --cmdserver pipe" that speaks the same framing, so
+Mercurial itself isn't needed.
+
+Run with:
+   python test_hg.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    from lsst.sconsUtils import state, utils
+    from lsst.sconsUtils.vcs import hg
+
+# Each command's output is written in two chunks, to check that they're joined; "cat" reads its
+# input, which the client must answer with end-of-file.
+FAKE_HG = r'''#!%(python)s
+import os
+import sys
+import struct
+
+stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+
+def write(channel, data):
+    stdout.write(struct.pack(">cI", channel, len(data)) + data)
+    stdout.flush()
+
+
+def read(size):
+    data = stdin.read(size)
+    if len(data) < size:
+        sys.exit(0)
+    return data
+
+
+if sys.argv[1:] != ["serve", "--cmdserver", "pipe"]:
+    sys.stdout.write("direct %%s\n" %% " ".join(sys.argv[1:]))
+    sys.exit(0)
+write(b"o", os.environ.get("FAKE_HG_HELLO", "capabilities: getencoding runcommand\nencoding: UTF-8").encode())
+while True:
+    line = stdin.readline()
+    if not line:
+        break
+    if line != b"runcommand\n":
+        sys.exit(1)
+    length, = struct.unpack(">I", read(4))
+    args = read(length).decode().split("\0")
+    if args[0] == "crash":
+        sys.exit(1)
+    if args[0] == "fail":
+        write(b"e", b"abort: no repository found\n")
+        code = 255
+    elif args[0] == "cat":
+        # input requests carry the size wanted in place of a length, and no data
+        stdout.write(struct.pack(">cI", b"I", 4096))
+        stdout.flush()
+        size, = struct.unpack(">I", read(4))
+        write(b"o", b"read %%d bytes\n" %% size)
+        code = 0
+    else:
+        text = (" ".join(args) + " é\n").encode()
+        write(b"o", text[:3])
+        write(b"d", b"debug output is ignored")
+        write(b"o", text[3:])
+        code = 0
+    write(b"r", struct.pack(">i", code))
+'''
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class CommandServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        with open(os.path.join(self.root, "hg"), "w") as f:
+            f.write(FAKE_HG % {"python": sys.executable})
+        os.chmod(os.path.join(self.root, "hg"), 0o755)
+        environ = {"PATH": self.root + os.pathsep + os.environ["PATH"]}
+        # statistics of the commands run, kept out of the report at exit
+        externalCommands = utils.ExternalCommands()
+        externalCommands._started = True
+        for patcher in (unittest.mock.patch.dict(os.environ, environ),
+                        unittest.mock.patch.object(hg.CommandServer, "_servers", {}),
+                        unittest.mock.patch.object(utils, "EXTERNAL_COMMANDS", externalCommands)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.closeServers)
+
+    def closeServers(self):
+        for server in hg.CommandServer._servers.values():
+            if server is not None:
+                server.close()
+
+    def testRunCommand(self):
+        server = hg.CommandServer.get()
+        self.assertIs(hg.CommandServer.get(), server)
+        self.assertEqual(server.runCommand(["id", "--id"]), (0, "id --id é\n", ""))
+        self.assertEqual(server.runCommand(["fail"]), (255, "", "abort: no repository found\n"))
+        self.assertEqual(server.runCommand(["cat"]), (0, "read 0 bytes\n", ""))
+        # the server is still in step after all that
+        self.assertEqual(server.runCommand(["log"]), (0, "log é\n", ""))
+
+    def testRun(self):
+        self.assertEqual(hg.run("id"), "id é")
+        with self.assertRaisesRegex(RuntimeError, "no repository found"):
+            hg.run("fail")
+
+    def testServerExits(self):
+        server = hg.CommandServer.get()
+        with self.assertRaisesRegex(RuntimeError, "exited"):
+            server.runCommand(["crash"])
+        # run() falls back to running hg directly
+        with state.log.capture():
+            self.assertEqual(hg.run("crash"), "direct crash")
+        self.assertIsNone(hg.CommandServer.get())
+
+    def testBadGreeting(self):
+        with unittest.mock.patch.dict(os.environ, {"FAKE_HG_HELLO": "capabilities: getencoding"}), \
+                state.log.capture():
+            self.assertIsNone(hg.CommandServer.get())
+            self.assertEqual(hg.run("id"), "direct id")
+
+
+if __name__ == "__main__":
+    unittest.main()
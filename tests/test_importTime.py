@@ -0,0 +1,89 @@
+"""
+Check that importing lsst.sconsUtils stays cheap: submodules and helpers that
+are only needed by some builds must not be imported up front, nor the
+environment created.  The import time itself depends on the machine's load, so
+it is only checked against a budget if $SCONSUTILS_TEST_IMPORT_TIME is set.
+
+Run with:
+   python test_importTime.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import unittest
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+# SCons itself is imported before the clock starts; this is the budget for sconsUtils alone,
+# which currently takes about 15 ms on an idle machine.
+IMPORT_BUDGET = 0.03
+
+PROBE = """
+import sys, time, json
+import SCons.Script
+start = time.perf_counter()
+import lsst.sconsUtils
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+ENV_PROBE = """
+import json
+import SCons.Script
+from lsst.sconsUtils import env, configure
+from lsst.sconsUtils.builders import DoxygenBuilder
+print(json.dumps({"methods": [hasattr(env, m) for m in ("ProductDir", "InstallLSST", "Declare")],
+                  "cuda": "NVCC" in env, "configure": configure.__module__,
+                  "doxygen": DoxygenBuilder.__module__}))
+"""
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class ImportTimeTestCase(unittest.TestCase):
+
+    def runProbe(self, probe=PROBE):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            env = dict(os.environ)
+            env["PYTHONPATH"] = os.pathsep.join([PYTHON_DIR] + sys.path)
+            env["SCONSUTILS_CACHE_ROOT"] = os.path.join(tmpDir, "cache")
+            output = subprocess.check_output([sys.executable, "-c", probe], cwd=tmpDir, env=env,
+                                             stderr=subprocess.DEVNULL)
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    def testLazyModules(self):
+        modules = set(self.runProbe()["modules"])
+        self.assertIn("lsst.sconsUtils.state", modules)
+        for name in ("lsst.sconsUtils.scripts", "lsst.sconsUtils.tests", "lsst.sconsUtils.doxygen",
+                     "lsst.sconsUtils.builders", "lsst.sconsUtils.installation",
+                     "lsst.sconsUtils.dependencies", "lsst.sconsUtils.vcs", "lsst.sconsUtils.vcs.git",
+                     "lsst.sconsUtils.vcs.hg", "lsst.sconsUtils.vcs.svn", "lsst.sconsUtils.probes",
+                     "SCons.Tool.default", "distutils", "imp"):
+            self.assertNotIn(name, modules)
+
+    def testLazyEnvironment(self):
+        result = self.runProbe(ENV_PROBE)
+        self.assertEqual(result["methods"], [True, True, True])
+        self.assertTrue(result["cuda"])
+        self.assertEqual(result["configure"], "lsst.sconsUtils.dependencies")
+        self.assertEqual(result["doxygen"], "lsst.sconsUtils.doxygen")
+
+    @unittest.skipIf(not os.environ.get("SCONSUTILS_TEST_IMPORT_TIME"),
+                     "set SCONSUTILS_TEST_IMPORT_TIME to check the import time")
+    def testImportBudget(self):
+        elapsed = min(self.runProbe()["elapsed"] for i in range(3))
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
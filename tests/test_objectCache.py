@@ -0,0 +1,90 @@
+"""
+Tests for the object cache's compiler wrapper
+
+Run with:
+   python test_objectCache.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+import importlib.util
+
+# objectCache.py runs as a script without SCons, importing cacheStore from its own directory
+MODULE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir,
+                          "python", "lsst", "sconsUtils")
+sys.path.insert(0, MODULE_DIR)
+try:
+    spec = importlib.util.spec_from_file_location("objectCache", os.path.join(MODULE_DIR, "objectCache.py"))
+    OBJECT_CACHE = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(OBJECT_CACHE)
+finally:
+    sys.path.remove(MODULE_DIR)
+
+compiler = shutil.which("cc")
+
+
+class ObjectCacheTestCase(unittest.TestCase):
+
+    def testParseCommand(self):
+        output, preprocess = OBJECT_CACHE.parseCommand(["g++", "-o", "src/a.os", "-c", "-O2", "-Iinclude",
+                                                        "src/a.cc"])
+        self.assertEqual(output, "src/a.os")
+        self.assertEqual(preprocess, ["g++", "-E", "-O2", "-Iinclude", "src/a.cc"])
+
+    def testUncacheable(self):
+        for command in (["g++", "-o", "a", "a.cc"],                          # links
+                        ["g++", "-o", "a.o", "-c", "a.cc", "b.cc"],          # two sources
+                        ["g++", "-c", "a.cc"],                               # no -o
+                        ["g++", "-o", "a.o", "-c", "-MD", "a.cc"],           # writes a .d file
+                        ["g++", "-o", "a.o", "-c", "--coverage", "a.cc"]):
+            self.assertIsNone(OBJECT_CACHE.parseCommand(command), command)
+
+    def testPrefixMaps(self):
+        def key(root, option="-ffile-prefix-map"):
+            command = ["g++", "-o", "a.os", "-c", "-I%s/include" % root, "%s=%s=." % (option, root), "a.cc"]
+            return OBJECT_CACHE.computeKey(command, b'# 1 "%s/include/a.h"\n' % root.encode())
+
+        self.assertEqual(key("/work/a"), key("/work/b"))
+        self.assertEqual(key("/work/a", "-fmacro-prefix-map"), key("/work/b", "-fmacro-prefix-map"))
+        # __FILE__ isn't mapped, so the source still differs
+        self.assertNotEqual(key("/work/a", "-fdebug-prefix-map"), key("/work/b", "-fdebug-prefix-map"))
+
+    def testParseSize(self):
+        self.assertEqual(OBJECT_CACHE.parseSize("1000"), 1000)
+        self.assertEqual(OBJECT_CACHE.parseSize("500M"), 500*1024**2)
+        self.assertEqual(OBJECT_CACHE.parseSize("1.5g"), int(1.5*1024**3))
+        with self.assertRaises(ValueError):
+            OBJECT_CACHE.parseSize("big")
+
+    @unittest.skipIf(compiler is None, "No C compiler is available")
+    def testCompile(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            with open(os.path.join(tmpDir, "a.c"), "w") as f:
+                f.write("int f(int x) { int unused; return x + 1; }\n")
+            statsFile = os.path.join(tmpDir, "stats")
+            env = dict(os.environ)
+            env[OBJECT_CACHE.DIR_VARIABLE] = os.path.join(tmpDir, "cache")
+            env[OBJECT_CACHE.STATS_VARIABLE] = statsFile
+            command = [sys.executable, os.path.join(MODULE_DIR, "objectCache.py"),
+                       compiler, "-Wall", "-o", "a.o", "-c", "a.c"]
+            outputs = []
+            for i in range(2):
+                result = subprocess.run(command, cwd=tmpDir, env=env, stderr=subprocess.PIPE)
+                self.assertEqual(result.returncode, 0)
+                self.assertIn(b"unused", result.stderr)  # warnings are replayed from the cache
+                with open(os.path.join(tmpDir, "a.o"), "rb") as f:
+                    outputs.append(f.read())
+                os.unlink(os.path.join(tmpDir, "a.o"))
+            self.assertEqual(outputs[0], outputs[1])
+            with open(statsFile) as f:
+                self.assertEqual([line.split()[0] for line in f], ["miss", "hit"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests for the --why-rebuilt report, which scons is run to produce
+
+Run with:
+   python test_rebuildCauses.py
+or by typing
+   pytest
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+SCONSTRUCT = """
+import sys
+sys.path.insert(0, %(pythonDir)r)
+from lsst.sconsUtils import state
+
+env = Environment(MESSAGE=ARGUMENTS.get("message", "hello"))
+state.targets["lib"].extend(env.Command("copy.txt", "in.txt", Copy("$TARGET", "$SOURCE")))
+state.targets["tests"].extend(env.Command("message.txt", [], "echo $MESSAGE > $TARGET"))
+depends = env.Command("depends.txt", "in.txt", Copy("$TARGET", "$SOURCE"))
+env.Depends(depends, "extra.txt")
+state.targets["tests"].extend(depends)
+"""
+
+
+@unittest.skipIf(shutil.which("scons") is None, "scons is not available")
+class RebuildCausesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.write("SConstruct", SCONSTRUCT % {"pythonDir": os.path.abspath(PYTHON_DIR)})
+        self.write("in.txt", "in\n")
+        self.write("extra.txt", "extra\n")
+
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), "w") as f:
+            f.write(content)
+
+    def scons(self, *args):
+        """Run scons, returning the report's headline, its causes and its inputs (as lists of words).
+
+        Causes with the same count are listed in the order they were found, so the causes are
+        returned sorted.
+        """
+        output = subprocess.check_output(["scons", "-Q", "--why-rebuilt"] + list(args), cwd=self.root,
+                                         stderr=subprocess.STDOUT, env=dict(os.environ, PYTHONPATH=""))
+        lines = output.decode().splitlines()
+        start = [line.startswith("Why rebuilt") for line in lines].index(True)
+        report = [line.split() for line in lines[start:]]
+        if ["top", "triggering", "inputs:"] in report:
+            end = report.index(["top", "triggering", "inputs:"])
+            return report[0], sorted(report[1:end]), report[end + 1:]
+        return report[0], sorted(report[1:]), []
+
+    def testCauses(self):
+        self.assertEqual(self.scons(), (["Why", "rebuilt:", "3", "targets"],
+                                        [["target", "missing", "3", "(tests", "2,", "lib", "1)"]], []))
+        self.assertEqual(self.scons(), (["Why", "rebuilt:", "nothing", "was", "rebuilt"], [], []))
+        self.write("extra.txt", "changed\n")
+        self.assertEqual(self.scons("message=goodbye"), (
+            ["Why", "rebuilt:", "2", "targets"],
+            [["command", "line", "1", "(tests", "1)"], ["explicit", "dependencies", "1", "(tests", "1)"]],
+            [["1", "extra.txt"]],
+        ))
+        self.write("in.txt", "changed\n")
+        os.unlink(os.path.join(self.root, "message.txt"))
+        self.assertEqual(self.scons("message=goodbye"), (
+            ["Why", "rebuilt:", "3", "targets"],
+            [["sources", "2", "(lib", "1,", "tests", "1)"], ["target", "missing", "1", "(tests", "1)"]],
+            [["2", "in.txt"]],
+        ))
+        # a target that exists but was never recorded
+        os.unlink(os.path.join(self.root, ".sconsign.dblite"))
+        self.assertEqual(self.scons("message=goodbye")[1],
+                         [["no", "build", "record", "3", "(tests", "2,", "lib", "1)"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests for the compiler and archiver options of relocatable builds
+
+Run with:
+   python test_relocatable.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import types
+import unittest
+import collections
+
+try:
+    import SCons.Script
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    import SCons.Subst
+    from lsst.sconsUtils import dependencies, state
+
+
+def package(root, eupsProduct=None):
+    config = types.SimpleNamespace(root=root)
+    if eupsProduct is not None:
+        config.eupsProduct = eupsProduct
+    return types.SimpleNamespace(config=config)
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class MakeRelocatableTestCase(unittest.TestCase):
+
+    def makeEnv(self, whichCc="gcc", ccVersion="12.2.0", **kwargs):
+        env = SCons.Script.Environment(tools=["default"], **kwargs)
+        env.whichCc = whichCc
+        env.ccVersion = ccVersion
+        return env
+
+    def packages(self):
+        return types.SimpleNamespace(packages=collections.OrderedDict([
+            ("base", package("/stack/base")),
+            ("missing", None),
+            ("eigen", package("/stack/base/eigen", eupsProduct="eigen3")),
+            ("odd", package("/stack/a=b")),
+        ]))
+
+    def testPrefixMaps(self):
+        env = self.makeEnv()
+        dependencies._makeRelocatable(env, self.packages())
+        top = env.Dir("#").abspath
+        expected = {top: ".", os.path.realpath(top): ".", "/stack/base": "BASE_DIR",
+                    "/stack/base/eigen": "EIGEN3_DIR"}
+        flags = env["_PREFIXMAPFLAGS"]
+        self.assertEqual((flags[0], flags[-1]), ("$(", "$)"))
+        maps = [flag.split("=", 1)[1].rsplit("=", 1) for flag in flags[1:-1]]
+        self.assertTrue(all(flag.startswith("-ffile-prefix-map=") for flag in flags[1:-1]))
+        # roots containing "=" can't be mapped
+        self.assertEqual(dict(maps), expected)
+        # the longest (most specific) roots come last, as gcc uses the last matching map
+        self.assertEqual(len(maps), len(expected))
+        self.assertEqual([root for root, replacement in sorted(maps, key=lambda m: len(m[0]))],
+                         [root for root, replacement in maps])
+
+    def testSignature(self):
+        env = self.makeEnv(CPPDEFINES=["FOO"])
+        before = env.subst("$_CCCOMCOM", SCons.Subst.SUBST_SIG)
+        dependencies._makeRelocatable(env, self.packages())
+        # the maps are on the command line, but don't change its signature
+        command = env.subst("$_CCCOMCOM", SCons.Subst.SUBST_CMD)
+        self.assertIn("-ffile-prefix-map=/stack/base=BASE_DIR", command)
+        self.assertEqual(env.subst("$_CCCOMCOM", SCons.Subst.SUBST_SIG), before)
+
+    def testOption(self):
+        for whichCc, ccVersion, option in (("gcc", "7.5.0", "-fdebug-prefix-map"),
+                                           ("gcc", "8.1.0", "-ffile-prefix-map"),
+                                           ("clang", "9.0.1", "-fdebug-prefix-map"),
+                                           ("clang", "15.0.7", "-ffile-prefix-map"),
+                                           ("clang", "unknown", "-fdebug-prefix-map")):
+            env = self.makeEnv(whichCc, ccVersion)
+            dependencies._makeRelocatable(env, self.packages())
+            self.assertTrue(env["_PREFIXMAPFLAGS"][1].startswith(option + "="), (whichCc, ccVersion))
+
+    def testUnsupportedCompiler(self):
+        env = self.makeEnv("unknown", "unknown")
+        ccComCom = env["_CCCOMCOM"]
+        with state.log.capture() as messages:
+            dependencies._makeRelocatable(env, self.packages())
+        self.assertIn("not supported", messages[0][0])
+        self.assertNotIn("_PREFIXMAPFLAGS", env)
+        self.assertEqual(env["_CCCOMCOM"], ccComCom)
+
+    def testArchives(self):
+        env = self.makeEnv(ARFLAGS="rc", RANLIBFLAGS=[])
+        dependencies._makeRelocatable(env, self.packages())
+        self.assertEqual(env["ARFLAGS"], ["rcD"])
+        self.assertEqual(env["RANLIBFLAGS"], ["-D"])
+        env = self.makeEnv(PLATFORM="darwin", ENV={})
+        dependencies._makeRelocatable(env, self.packages())
+        self.assertEqual(env["ENV"]["ZERO_AR_DATE"], "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
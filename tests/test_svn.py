@@ -0,0 +1,146 @@
+"""
+Tests for reading "svn info --xml" and svnversion output
+
+Run with:
+   python test_svn.py
+or by typing
+   pytest
+"""
+
+import os
+import sys
+import unittest
+import unittest.mock
+
+try:
+    import SCons.Script  # noqa F401
+    HAVE_SCONS = True
+except ImportError:
+    HAVE_SCONS = False
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, "python")
+
+if HAVE_SCONS:
+    sys.path.insert(0, PYTHON_DIR)
+    from lsst.sconsUtils.vcs import svn
+
+INFO = """<?xml version="1.0" encoding="UTF-8"?>
+<info>
+<entry
+   kind="dir"
+   path="."
+   revision="4168">
+<url>https://svn.example.com/repo/foo/branches/1.2</url>
+<relative-url>^/foo/branches/1.2</relative-url>
+<repository>
+<root>https://svn.example.com/repo</root>
+<uuid>4ae59bd1-5d07-0410-9d3a-b1d0ee1ac67b</uuid>
+</repository>
+<wc-info>
+<wcroot-abspath>/work/foo</wcroot-abspath>
+<schedule>normal</schedule>
+<depth>infinity</depth>
+</wc-info>
+<commit
+   revision="4123">
+<author>someone</author>
+<date>2012-03-04T05:06:07.890123Z</date>
+</commit>
+</entry>
+</info>
+"""
+
+# an added file has no commit yet
+ADDED = """<?xml version="1.0" encoding="UTF-8"?>
+<info>
+<entry kind="file" path="new.txt" revision="0">
+<url>https://svn.example.com/repo/foo/trunk/new.txt</url>
+<repository><root>https://svn.example.com/repo</root></repository>
+<wc-info><schedule>add</schedule></wc-info>
+</entry>
+</info>
+"""
+
+
+@unittest.skipIf(not HAVE_SCONS, "SCons is not available")
+class SvnInfoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        svn._info.cache_clear()
+        svn._svnversion.cache_clear()
+        self.addCleanup(svn._info.cache_clear)
+        self.addCleanup(svn._svnversion.cache_clear)
+        self.outputs = {}
+        patcher = unittest.mock.patch.object(svn, "_run", side_effect=self.runSvn)
+        self.runMock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def runSvn(self, cmd):
+        output = self.outputs[cmd[0]]
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+    def testInfo(self):
+        self.outputs["svn"] = INFO
+        self.assertEqual(svn.getInfo(), {
+            "Path": ".",
+            "Node Kind": "dir",
+            "Revision": "4168",
+            "URL": "https://svn.example.com/repo/foo/branches/1.2",
+            "Relative URL": "^/foo/branches/1.2",
+            "Repository Root": "https://svn.example.com/repo",
+            "Repository UUID": "4ae59bd1-5d07-0410-9d3a-b1d0ee1ac67b",
+            "Last Changed Rev": "4123",
+            "Last Changed Author": "someone",
+            "Last Changed Date": "2012-03-04T05:06:07.890123Z",
+        })
+        self.assertTrue(svn.isSvnFile("."))
+        self.assertFalse(svn.isTrunk())
+        self.assertEqual(svn.revision("."), "4168")
+        self.assertEqual(svn.revision(".", lastChanged=True), "4123")
+        # svn info is run once per path
+        self.runMock.assert_called_once_with(["svn", "info", "--xml", os.path.abspath(".")])
+
+    def testMissingElements(self):
+        self.outputs["svn"] = ADDED
+        info = svn.getInfo("new.txt")
+        self.assertEqual(info, {"Path": "new.txt", "Node Kind": "file", "Revision": "0",
+                                "URL": "https://svn.example.com/repo/foo/trunk/new.txt",
+                                "Repository Root": "https://svn.example.com/repo"})
+        self.assertTrue(svn.isTrunk("new.txt"))
+
+    def testNotWorkingCopy(self):
+        for message in ("svn: E155007: '/work' is not a working copy",
+                        "svn: warning: '/work' is not a working copy"):
+            svn._info.cache_clear()
+            self.outputs["svn"] = RuntimeError(message)
+            self.assertFalse(svn.isSvnFile("."))
+            with self.assertRaises(RuntimeError):
+                svn.getInfo()
+
+    def testErrors(self):
+        self.outputs["svn"] = RuntimeError("svn: E170013: Unable to connect to a repository")
+        with self.assertRaisesRegex(RuntimeError, "E170013"):
+            svn.isSvnFile(".")
+        svn._info.cache_clear()
+        self.outputs["svn"] = '<?xml version="1.0"?><info></info>'
+        with self.assertRaisesRegex(RuntimeError, "Unexpected output"):
+            svn.getInfo()
+
+    def testSvnversion(self):
+        self.outputs["svn"] = INFO
+        self.outputs["svnversion"] = "4100:4168MS\n"
+        self.assertEqual(svn.revision(), ("4100", "4168", ("M", "S")))
+        svn._svnversion.cache_clear()
+        # a single revision is replaced by the last one that changed the working copy
+        self.outputs["svnversion"] = "4168P\n"
+        self.assertEqual(svn.revision(), ("4123", "4123", ()))
+        svn._svnversion.cache_clear()
+        self.outputs["svnversion"] = "exported\n"
+        with self.assertRaises(RuntimeError):
+            svn.revision()
+
+
+if __name__ == "__main__":
+    unittest.main()